@@ -0,0 +1,65 @@
+'''
+Batch bindings benchmark
+
+Evaluates one program for a growing number of bindings (values of r), once with the compiled blocks called for each
+binding and once with VectorEvaluator over all of them, and checks that both give the same values. Needs NumPy.
+
+Usage:
+python3 benchmarks/bindings.py [max_rows]
+'''
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy
+
+from parser import compile_program
+from vectorized import VectorEvaluator, parse_program
+
+PROGRAM = '''let r : real = 10.0 ;
+pi : real = 3.1416 ;
+in
+real ( if r > pi then pi * r * r else r )
+end ;
+let x : int = 7 ;
+y : real = 3.0 ;
+in
+real ( ( real ( x ) + y ) * ( real ( x ) - y ) / r )
+end ;
+'''
+
+ROWS = [10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6]
+
+def time_compiled(program, values):
+    """ Runs the compiled blocks once per binding, returns (values of each binding, seconds). """
+    functions = compile_program(program)
+    start = time.perf_counter()
+    results = []
+    for value in values:
+        symbol_table = {}
+        overrides = {'r': value}
+        results.append([function(symbol_table, overrides) for function in functions])
+    return results, time.perf_counter() - start
+
+def time_vectorized(program, column):
+    """ Runs VectorEvaluator over all the bindings, returns (BatchResult, seconds). """
+    start = time.perf_counter()
+    result = VectorEvaluator(program).run({'r': column})
+    return result, time.perf_counter() - start
+
+if __name__ == "__main__":
+    max_rows = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS[-1]
+    program = parse_program(PROGRAM)
+    print(f"{'rows':>10} {'compiled s':>11} {'vector s':>10} {'speedup':>8}")
+    for rows in ROWS:
+        if rows > max_rows:
+            break
+        column = numpy.linspace(0.5, 100.0, rows)
+        expected, compiled_seconds = time_compiled(program, column.tolist())
+        result, vector_seconds = time_vectorized(program, column)
+        step = max(1, rows // 1000)
+        assert all(result.row(row)[0] == expected[row] for row in range(0, rows, step)), "results differ"
+        print(f"{rows:>10} {compiled_seconds:>11.4f} {vector_seconds:>10.4f} {compiled_seconds / vector_seconds:>7.1f}x")
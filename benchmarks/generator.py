@@ -0,0 +1,189 @@
+'''
+Synthetic .tiny program generator
+
+Builds random programs for the full grammar from a seed, so the same seed always gives the same program:
+nested if ... then ... else, deep parenthesised expressions, long decl-lists and long sequences of let-in-end blocks.
+By default the programs use everything parser.py accepts:
+- names that start with in, int or real (keywords matched with a word boundary, so inx and realm are names)
+- conditions between any factors (names, ints, reals, casts and parenthesised expressions), reading the names of
+  earlier blocks too
+- casts of whole expressions, <type> ( <expr> )
+The comparisons are still < and > only: every lexer in the repository, parser.py's included, reads <=, >=, == and <>
+as two tokens, so a program with one of them stops with a syntax error (as do names that start with let, end, if,
+then or else).
+Divisions are by non zero numbers, and the names of earlier blocks are only read in conditions, so values stay small.
+
+restricted=True (--restricted) only uses what the parsers in Other Parsers accept, as in the CFG:
+- names never start with a keyword (their lexers match keywords without a word boundary)
+- conditions compare names and ints, and casts are <type> ( id )
+- each block only reads the names it declares
+
+Usage:
+python3 -m benchmarks.generator [--seed N] [--blocks N] [--name-length N] [--restricted] > program.tiny
+'''
+
+import argparse
+import random
+import string
+import sys
+
+NAME_LETTERS = 'abcdvwxyz'
+
+# Keywords matched with a word boundary in parser.py, names may start with them
+KEYWORD_PREFIXES = ('in', 'int', 'real')
+
+class ProgramGenerator:
+    """
+    Seeded random generator of .tiny programs.
+    decls is the largest number of declarations in a block, depth the deepest nesting of parentheses and ifs.
+    ifs=False leaves out if ... then ... else (example2.py in Other Parsers has no rule for it).
+    name_length is the number of letters of the names, before the number that makes them unique in their block.
+    Like the one letter names, longer names come back in other blocks (the same letter and number give the same name).
+    restricted=True keeps to what the parsers in Other Parsers accept (see the module description).
+    """
+    def __init__(self, seed=0, decls=8, depth=6, ifs=True, name_length=1, restricted=False):
+        self.random = random.Random(seed)
+        self.decls = decls
+        self.depth = depth
+        self.ifs = ifs
+        self.name_length = name_length
+        self.restricted = restricted
+        self.long_names = {}
+        self.names = []
+        self.earlier_names = [] # Names declared by the earlier blocks
+
+    def program(self, blocks):
+        """
+        <prog> ::= <let-in-end> { <let-in-end> }
+        There is no whitespace after the last block, the Other Parsers lexers reject it.
+        """
+        return '\n'.join(self.let_in_end() for _ in range(blocks))
+
+    def let_in_end(self):
+        """
+        <let-in-end> ::= let <decl-list> in <type> ( <expr> ) end ;
+        """
+        self.earlier_names = list(dict.fromkeys(self.earlier_names + self.names))
+        self.names = []
+        decl_list = ''.join(self.decl(number) for number in range(self.random.randint(1, self.decls)))
+        return f'let\n{decl_list}in\n{self.type()} ( {self.expr(self.depth)} )\nend ;'
+
+    def decl(self, number):
+        """
+        <decl> ::= id : <type> = <expr> ;
+        """
+        value = self.expr(self.depth)
+        name = f'{self.random.choice(NAME_LETTERS)}{number}'
+        if self.name_length > 1:
+            if name not in self.long_names:
+                letters = ''.join(self.random.choice(string.ascii_lowercase) for _ in range(self.name_length - 1))
+                self.long_names[name] = f'{name[0]}{letters}{number}'
+            name = self.long_names[name]
+        if not self.restricted and self.random.random() < 0.1:
+            name = self.random.choice(KEYWORD_PREFIXES) + name
+        self.names.append(name)
+        return f'{name} : {self.type()} = {value} ;\n'
+
+    def type(self):
+        return self.random.choice(('int', 'real'))
+
+    def expr(self, depth):
+        """
+        <expr> ::= <term> { + <term> | - <term> } | if <cond> then <expr> else <expr>
+        """
+        if self.ifs and depth > 0 and self.random.random() < 0.15:
+            return f'if {self.cond(depth - 1)} then {self.expr(depth - 1)} else {self.expr(depth - 1)}'
+        terms = [self.term(depth) for _ in range(self.random.randint(1, 3))]
+        expression = terms[0]
+        for term in terms[1:]:
+            expression += f' {self.random.choice("+-")} {term}'
+        return expression
+
+    def term(self, depth):
+        """
+        <term> ::= <factor> { * <factor> | / <factor> }
+        Only the first factor can be an expression, the others are numbers.
+        """
+        term = self.factor(depth)
+        if self.random.random() < 0.4:
+            term += f' {self.random.choice("*/")} {self.number()}'
+        return term
+
+    def factor(self, depth):
+        """
+        <factor> ::= ( <expr> ) | id | number | <type> ( id )
+        Once in a while the parentheses are nested depth times around the expression.
+        """
+        choice = self.random.random()
+        if depth > 0 and choice < 0.3:
+            levels = depth if self.random.random() < 0.1 else 1
+            return '( ' * levels + self.expr(depth - 1) + ' )' * levels
+        if self.names and choice < 0.6:
+            return self.random.choice(self.names)
+        if self.names and choice < 0.7:
+            if not self.restricted and depth > 0 and self.random.random() < 0.5:
+                return f'{self.type()} ( {self.expr(depth - 1)} )'
+            return f'{self.type()} ( {self.random.choice(self.names)} )'
+        return self.number()
+
+    def cond(self, depth):
+        """
+        <cond> ::= <oprnd> < <oprnd> | <oprnd> > <oprnd>
+        """
+        return f'{self.oprnd(depth)} {self.random.choice("<>")} {self.oprnd(depth)}'
+
+    def oprnd(self, depth):
+        """
+        <oprnd> ::= id | intnum, or any <factor> and the names of earlier blocks unless restricted
+        """
+        if self.restricted:
+            if self.names and self.random.random() < 0.6:
+                return self.random.choice(self.names)
+            return str(self.random.randint(0, 99))
+        choice = self.random.random()
+        if self.earlier_names and choice < 0.25:
+            return self.random.choice(self.earlier_names)
+        if choice < 0.7:
+            return self.factor(depth)
+        return f'{self.random.randint(0, 99)}.{self.random.randint(0, 99)}' if choice < 0.8 else str(self.random.randint(0, 99))
+
+    def number(self):
+        """ A non zero int or real number. """
+        if self.random.random() < 0.3:
+            return f'{self.random.randint(1, 99)}.{self.random.randint(0, 99)}'
+        return str(self.random.randint(1, 99))
+
+    def arithmetic(self, depth=None):
+        """
+        An expression of the smaller grammar used by the expression parsers in Other Parsers:
+        <expr> ::= <term> { ('+'|'-') <term> }
+        <term> ::= <factor> { ('*'|'/') <factor> }
+        <factor> ::= <NUM> | '(' <expr> ')'
+        """
+        depth = self.depth if depth is None else depth
+        terms = []
+        for _ in range(self.random.randint(1, 3)):
+            if depth > 0 and self.random.random() < 0.4:
+                term = f'( {self.arithmetic(depth - 1)} )'
+            else:
+                term = str(self.random.randint(1, 99))
+            if self.random.random() < 0.4:
+                term += f' {self.random.choice("*/")} {self.random.randint(1, 99)}'
+            terms.append(term)
+        expression = terms[0]
+        for term in terms[1:]:
+            expression += f' {self.random.choice("+-")} {term}'
+        return expression
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Writes a random .tiny program to stdout.")
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--blocks', type=int, default=100, help="number of let-in-end blocks")
+    arg_parser.add_argument('--decls', type=int, default=8, help="largest number of declarations in a block")
+    arg_parser.add_argument('--depth', type=int, default=6, help="deepest nesting of parentheses and ifs")
+    arg_parser.add_argument('--no-ifs', dest='ifs', action='store_false', help="leave out if ... then ... else")
+    arg_parser.add_argument('--name-length', type=int, default=1, help="number of letters of the names")
+    arg_parser.add_argument('--restricted', action='store_true', help="only what the parsers in Other Parsers accept")
+    args = arg_parser.parse_args()
+    generator = ProgramGenerator(args.seed, args.decls, args.depth, args.ifs, args.name_length, args.restricted)
+    sys.stdout.write(generator.program(args.blocks))
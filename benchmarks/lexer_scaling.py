@@ -0,0 +1,55 @@
+'''
+Lexer scaling benchmark
+
+Builds .tiny programs of growing size (1 KB up to 100 MB by default) out of the sample blocks
+and times the single pass tokenizer over each one.
+If lexing is linear the time per byte (ns/byte column) stays flat while the input grows.
+
+Usage:
+python3 benchmarks/lexer_scaling.py [max_size_in_bytes]
+'''
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from parser import scan
+
+BLOCK = '''let x : int = 7 ;
+y : real = 3.0 ;
+in
+real ( ( real ( x ) + y ) * ( real ( x ) - y ) )
+end ;
+let r : real = 10.0 ;
+pi : real = 3.1416 ;
+in
+real ( if r > pi then pi * r * r else r )
+end ;
+'''
+
+SIZES = [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7, 10 ** 8]
+
+def make_program(size):
+    """ Repeats the sample blocks until the program is at least size bytes long. """
+    return BLOCK * (size // len(BLOCK) + 1)
+
+def time_lexer(text):
+    """ Tokenizes the text once and returns (token count, seconds). """
+    start = time.perf_counter()
+    count = 0
+    for _ in scan(text):
+        count += 1
+    return count, time.perf_counter() - start
+
+if __name__ == "__main__":
+    max_size = int(sys.argv[1]) if len(sys.argv) > 1 else SIZES[-1]
+
+    print(f"{'bytes':>12} {'tokens':>12} {'seconds':>10} {'ns/byte':>9} {'MB/s':>8}")
+    for size in SIZES:
+        if size > max_size:
+            break
+        text = make_program(size)
+        count, seconds = time_lexer(text)
+        print(f"{len(text):>12} {count:>12} {seconds:>10.4f} {seconds * 1e9 / len(text):>9.2f} {len(text) / seconds / 1e6:>8.2f}")
@@ -0,0 +1,304 @@
+'''
+Parser benchmark suite
+
+Times the lexer, the parser engines and the Python parsers in Other Parsers on programs made by the seeded generator
+and reports tokens/sec and let-blocks/sec (expressions/sec for the expression parsers, which have no let-in-end blocks).
+Each target is timed --repeat times with timeit (each time over enough runs to take 0.2 seconds) and the best time is kept.
+
+The results are compared with a stored baseline (benchmarks/baseline.json). A target is a regression if its
+tokens/sec dropped by more than --tolerance, or if its token count, block count or output changed.
+The exit status is 1 when there is a regression. Rates depend on the machine, so run --update on the machine
+the comparison is made on before changing the code. The baseline stores the interpreter and platform it was recorded
+on and the backend of each target (python or c): when they differ from the current run, rates are not compared
+(a warning is printed) and only the token counts, block counts and outputs are checked.
+
+Every target except native and identifiers_native runs the pure-Python code, even when the C extension (_cparser)
+is built, so a target always measures the same code. Those two are only listed when the extension is built.
+The C parsers in Other Parsers are not timed.
+
+Usage:
+python3 -m benchmarks.suite [--repeat N] [--tolerance 0.25] [--baseline FILE] [--update] [target ...]
+'''
+
+import argparse
+import contextlib
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import sys
+import timeit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from benchmarks.generator import ProgramGenerator
+import parser
+from parser import DFALexer, Evaluator, Lexer, LL1Parser, Parser, StackParser, TreeBuilder, optimize, run_compiled, run_native, run_tree
+
+OTHER_PARSERS = os.path.join(ROOT, 'Other Parsers')
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+SEED = 0
+PROGRAM_BLOCKS = 200 # Programs for the parsers in parser.py
+OTHER_BLOCKS = 50    # The Other Parsers lexers copy the rest of the text for every token, so their programs are smaller
+EXPRESSIONS = 200    # Expressions for the expression parsers in Other Parsers
+IDENTIFIER_DECLS = 30 # The identifiers target: long decl-lists of long names, flat expressions that mostly read names
+NAME_LENGTH = 12
+REPEAT = 5
+TOLERANCE = 0.25
+
+_modules = {}
+
+def load_other(filename):
+    """ Imports a parser from Other Parsers by file name (the file names are not valid module names). """
+    if filename not in _modules:
+        spec = importlib.util.spec_from_file_location(filename[:-3], os.path.join(OTHER_PARSERS, filename))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _modules[filename] = module
+    return _modules[filename]
+
+def program(blocks=PROGRAM_BLOCKS, ifs=True, restricted=False):
+    return ProgramGenerator(SEED, ifs=ifs, restricted=restricted).program(blocks)
+
+def expressions(count=EXPRESSIONS):
+    generator = ProgramGenerator(SEED)
+    return [generator.arithmetic() for _ in range(count)]
+
+'''
+Each target returns (run, tokens, blocks): the function that is timed, and the number of tokens and blocks it handles.
+'''
+
+def lexer_target():
+    text = program()
+    return (lambda: Lexer(text)), len(Lexer(text).tokens), PROGRAM_BLOCKS
+
+def dfa_lexer_target():
+    text = program()
+    return (lambda: DFALexer(text)), len(Lexer(text).tokens), PROGRAM_BLOCKS
+
+def parser_target():
+    text = program()
+    return (lambda: Parser(Lexer(text)).prog()), len(Lexer(text).tokens), PROGRAM_BLOCKS
+
+def identifiers_target():
+    """
+    Parser on a program of long names declared and read many times.
+    As identifiers_native it runs on the tokens of the C extension, whose interned names the symbol table finds by identity.
+    """
+    text = ProgramGenerator(SEED, decls=IDENTIFIER_DECLS, depth=0, name_length=NAME_LENGTH).program(PROGRAM_BLOCKS)
+    return (lambda: Parser(Lexer(text)).prog()), len(Lexer(text).tokens), PROGRAM_BLOCKS
+
+def native_target():
+    """ The C extension (only listed when it is built), with Parser for what it leaves. """
+    text = program()
+    return (lambda: run_native(text) or Parser(Lexer(text)).prog()), len(Lexer(text).tokens), PROGRAM_BLOCKS
+
+def stack_target():
+    text = program()
+    return (lambda: StackParser(Lexer(text)).prog()), len(Lexer(text).tokens), PROGRAM_BLOCKS
+
+def ll1_target():
+    text = program()
+    return (lambda: LL1Parser(Lexer(text)).prog()), len(Lexer(text).tokens), PROGRAM_BLOCKS
+
+def ast_target():
+    text = program()
+    return (lambda: run_tree(Lexer(text))), len(Lexer(text).tokens), PROGRAM_BLOCKS
+
+def evaluate_target(optimized=False):
+    """ Only the evaluation of a tree built (and optimized) beforehand, what a program evaluated many times pays each time. """
+    text = program()
+    builder = TreeBuilder(Lexer(text))
+    tree = builder.prog()
+    if optimized:
+        tree = optimize(tree)
+    return (lambda: Evaluator().prog(tree)), len(Lexer(text).tokens), PROGRAM_BLOCKS
+
+def compile_target():
+    text = program()
+    return (lambda: run_compiled(Lexer(text))), len(Lexer(text).tokens), PROGRAM_BLOCKS
+
+def example_target(filename, ifs=True):
+    """ The full grammar parsers of Other Parsers, both have the same Lexer and Parser classes as parser.py had. """
+    module = load_other(filename)
+    text = program(OTHER_BLOCKS, ifs, restricted=True)
+    return (lambda: module.Parser(module.Lexer(text)).prog()), len(module.Lexer(text).tokens), OTHER_BLOCKS
+
+def expression_target(filename):
+    """ The book style expression parsers of Other Parsers, ExpressionEvaluator().parse() on each expression. """
+    module = load_other(filename)
+    texts = expressions()
+
+    def run():
+        for text in texts:
+            module.ExpressionEvaluator().parse(text)
+    return run, sum(len(list(module.generate_tokens(text))) for text in texts), len(texts)
+
+def class_input_target():
+    """ parserFromClassWithInput.py keeps its state in globals and reads input(), so the globals are set here. """
+    module = load_other('parserFromClassWithInput.py')
+    texts = expressions()
+
+    def start(text):
+        module.input_string = text + " " # Same as main(): a space to handle EOF detection
+        module.current_index = 0
+        module.get_char()
+        module.lex()
+
+    def run():
+        for text in texts:
+            start(text)
+            module.expr()
+
+    tokens = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for text in texts:
+            start(text)
+            while module.next_token != module.EOF_TOKEN:
+                tokens += 1
+                module.lex()
+    return run, tokens, len(texts)
+
+TARGETS = {
+    'lexer': lexer_target,
+    'dfa_lexer': dfa_lexer_target,
+    'parser': parser_target,
+    'identifiers': identifiers_target,
+    'stack': stack_target,
+    'll1': ll1_target,
+    'ast': ast_target,
+    'compile': compile_target,
+    'evaluate': evaluate_target,
+    'optimized': lambda: evaluate_target(optimized=True),
+    'example': lambda: example_target('example.py'),
+    'example2': lambda: example_target('example2.py', ifs=False),
+    'parserFromBook': lambda: expression_target('parserFromBook.py'),
+    'parserFromClassWithRegex': lambda: expression_target('parserFromClassWithRegex.py'),
+    'FINALparserWithEvaluator': lambda: expression_target('FINALparserWithEvaluator(Important).py'),
+    'parserFromClassWithInput': class_input_target,
+}
+
+# The C extension as parser.py imported it, None when it is not built
+CPARSER = parser._cparser
+
+# Targets that run the C extension, the others turn it off
+NATIVE_TARGETS = {'native', 'identifiers_native'}
+
+if CPARSER is not None:
+    TARGETS['native'] = native_target
+    TARGETS['identifiers_native'] = identifiers_target
+
+def measure(name, repeat=REPEAT):
+    """
+    Runs one target and returns its result: token and block counts, a digest of what it printed and the rates.
+    """
+    parser._cparser = CPARSER if name in NATIVE_TARGETS else None
+    run, tokens, blocks = TARGETS[name]()
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        run()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        timer = timeit.Timer(run)
+        number, _ = timer.autorange()
+        seconds = min(timer.repeat(repeat, number)) / number
+    return {
+        'backend': 'c' if parser._cparser is not None else 'python',
+        'tokens': tokens,
+        'blocks': blocks,
+        'output': hashlib.sha256(output.getvalue().encode()).hexdigest(),
+        'seconds': seconds,
+        'tokens_per_sec': tokens / seconds,
+        'blocks_per_sec': blocks / seconds,
+    }
+
+def environment():
+    """ What the rates depend on besides the code: the interpreter and the machine. """
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+    }
+
+def comparable(result, baseline):
+    """ True if the rates of a result can be compared with its baseline (same backend). """
+    return result['backend'] == baseline.get('backend')
+
+def compare(result, baseline, tolerance=TOLERANCE, rates=True):
+    """
+    Returns the list of regressions of a result against its baseline (empty when there is none).
+    rates=False only checks the counts and the output.
+    """
+    problems = [f"{key} changed" for key in ('tokens', 'blocks', 'output') if result[key] != baseline[key]]
+    if rates and result['tokens_per_sec'] < baseline['tokens_per_sec'] * (1 - tolerance):
+        problems.append(f"{1 - result['tokens_per_sec'] / baseline['tokens_per_sec']:.0%} slower")
+    return problems
+
+def load_baseline(path):
+    """ Returns (environment, targets) of the baseline file, (None, {}) if there is none. """
+    if not os.path.exists(path):
+        return None, {}
+    with open(path) as file:
+        data = json.load(file)
+    return {key: data.get(key) for key in environment()}, data['targets']
+
+def save_baseline(path, results):
+    data = {
+        **environment(),
+        'seed': SEED,
+        'targets': results,
+    }
+    with open(path, 'w') as file:
+        json.dump(data, file, indent=2, sort_keys=True)
+        file.write('\n')
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmarks the parsers and compares them with a baseline.")
+    arg_parser.add_argument('targets', nargs='*', metavar='target',
+                            help=f"targets to run (default: all of {', '.join(TARGETS)})")
+    arg_parser.add_argument('--repeat', type=int, default=REPEAT, help="timed runs per target, the best one is kept")
+    arg_parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                            help="largest drop in tokens/sec that is not a regression (default: 0.25)")
+    arg_parser.add_argument('--baseline', default=BASELINE, help="baseline JSON file")
+    arg_parser.add_argument('--update', action='store_true', help="store the results as the new baseline")
+    args = arg_parser.parse_args()
+    for name in args.targets:
+        if name not in TARGETS:
+            arg_parser.error(f"unknown target {name}, choose from {', '.join(TARGETS)}")
+
+    baseline_environment, baseline = load_baseline(args.baseline)
+    changed = [key for key, value in environment().items() if baseline and baseline_environment[key] != value]
+    if changed:
+        print(f"Warning: {args.baseline} was recorded with another {', '.join(changed)}, "
+              "rates are not compared (run --update on this machine)")
+        if args.update:
+            baseline = {} # Rates from another machine can't be mixed with these
+    results = {}
+    regressions = 0
+    print(f"{'target':<26} {'tokens':>8} {'blocks':>7} {'seconds':>9} {'tokens/s':>11} {'blocks/s':>10} {'baseline':>9}")
+    for name in args.targets or TARGETS:
+        result = results[name] = measure(name, args.repeat)
+        note = ''
+        if name in baseline:
+            rates = not changed and comparable(result, baseline[name])
+            ratio = f"{result['tokens_per_sec'] / baseline[name]['tokens_per_sec']:.2f}x" if rates else 'n/a'
+            problems = [] if args.update else compare(result, baseline[name], args.tolerance, rates)
+            if not comparable(result, baseline[name]):
+                note = f"  (baseline backend: {baseline[name].get('backend', 'unknown')})"
+        else:
+            ratio, problems = '-', []
+        print(f"{name:<26} {result['tokens']:>8} {result['blocks']:>7} {result['seconds']:>9.4f} "
+              f"{result['tokens_per_sec']:>11.0f} {result['blocks_per_sec']:>10.1f} {ratio:>9}"
+              + (f"  REGRESSION: {', '.join(problems)}" if problems else note))
+        regressions += bool(problems)
+
+    if args.update:
+        save_baseline(args.baseline, {**baseline, **results})
+        print(f"Baseline saved to {args.baseline}")
+    elif regressions:
+        print(f"{regressions} regression(s) against {args.baseline}")
+        sys.exit(1)
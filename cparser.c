@@ -0,0 +1,799 @@
+/* cparser.c - C lexer and parser for .tiny programs, built as the CPython extension module _cparser
+ *
+ * The core comes from "Other Parsers/parserFromClassWithInput.c" (a lex function driven by character classes and one
+ * function per grammar rule), extended to the full let ... in ... end grammar of parser.py and made reentrant: the
+ * state lives in a struct instead of global variables, so several threads can parse at once without the GIL.
+ *
+ * Build it with: python3 setup.py build_ext --inplace
+ * parser.py imports it when it is built and uses its pure-Python code otherwise.
+ *
+ * Functions (the text is any bytes-like object, text_mode tells that it holds an ASCII str):
+ * tokenize(text, text_mode=False) -> (kinds, starts, ends, name_ids, names), or None on an invalid token.
+ *     The first four are the bytes of TokenStore's arrays, names the list of the distinct identifiers as interned str
+ *     and name_ids the index in names of each token's identifier (-1 for the tokens that are not IDs).
+ * run(text, text_mode=False) -> list of the values of the blocks, or None
+ *
+ * run only gives the values of programs it runs exactly like parser.py. On any error, on ints that don't fit in 64 bits,
+ * on ints mixed with reals beyond 2**53 (where a double no longer holds them exactly) and on expressions nested deep
+ * enough to reach Python's recursion limit, it returns None and parser.py runs the program itself.
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <limits.h>
+#include <math.h>
+#include <setjmp.h>
+#include <stdint.h>
+#include <string.h>
+
+/* Token Codes, in the same order as TOKEN_TYPES in parser.py */
+enum {
+    LET, IN, END, IF, THEN, ELSE, INT, REAL, ID, NUMBER, ASSIGN, COLON, SEMICOLON, LPAREN, RPAREN,
+    PLUS, MINUS, TIMES, DIVIDE, LESS, LESSEQ, GREATER, GREATEREQ, EQUAL, NOTEQ, EOF_TOKEN
+};
+
+static const char *token_names[] = {
+    "LET", "IN", "END", "IF", "THEN", "ELSE", "INT", "REAL", "ID", "NUMBER", "ASSIGN", "COLON", "SEMICOLON",
+    "LPAREN", "RPAREN", "PLUS", "MINUS", "TIMES", "DIVIDE", "LESS", "LESSEQ", "GREATER", "GREATEREQ", "EQUAL",
+    "NOTEQ", "EOF"
+};
+
+/* Character Classes */
+#define LETTER 0
+#define DIGIT 1
+#define SPACE 2
+#define UNKNOWN 99
+
+/* Keywords in the order of the master pattern, the first one that matches wins.
+ * boundary means no letter, digit or _ may follow (r'\bin\b'), the others also match as prefixes (letx -> let, x). */
+#define KEYWORD_COUNT 8
+static const struct {
+    const char *word;
+    int length;
+    int boundary;
+    int token;
+} keywords[KEYWORD_COUNT] = {
+    {"let", 3, 0, LET}, {"in", 2, 1, IN}, {"end", 3, 0, END}, {"if", 2, 0, IF}, {"then", 4, 0, THEN},
+    {"else", 4, 0, ELSE}, {"int", 3, 1, INT}, {"real", 4, 1, REAL}
+};
+
+/* Keywords are found by their first two characters: KEYWORD_HASH gives each pair of the keywords above its own slot
+ * (a perfect hash), so a word is compared with at most the keywords that start like it (in and int share theirs).
+ * keyword_slots holds the first keyword of each slot and keyword_next the next one in the same slot, -1 ends the list.
+ * Both are filled when the module is imported. */
+#define KEYWORD_SLOTS 16
+#define KEYWORD_HASH(first, second) ((((first) * 5) ^ (second)) & (KEYWORD_SLOTS - 1))
+static signed char keyword_slots[KEYWORD_SLOTS];
+static signed char keyword_next[KEYWORD_COUNT];
+
+static void build_keyword_slots(void) {
+    memset(keyword_slots, -1, sizeof(keyword_slots));
+    for (int k = KEYWORD_COUNT - 1; k >= 0; k--) { /* Backwards, so each list keeps the master pattern order */
+        int slot = KEYWORD_HASH((unsigned char)keywords[k].word[0], (unsigned char)keywords[k].word[1]);
+        keyword_next[k] = keyword_slots[slot];
+        keyword_slots[slot] = (signed char)k;
+    }
+}
+
+/* Deepest nesting of <expr> run here. Parser uses about 3 Python frames per level, deeper programs are left to it
+ * so it raises RecursionError where it would. */
+#define MAX_DEPTH 100
+
+/* Largest int a double holds exactly */
+#define EXACT_INT (1LL << 53)
+
+typedef struct {
+    int is_real;
+    long long i;
+    double d;
+} Value;
+
+typedef struct {
+    Py_ssize_t start;
+    Py_ssize_t length;
+    Py_ssize_t id; /* Order in which the names were first added, the index of the name in tokenize's list */
+    Value value;
+} Symbol;
+
+typedef struct {
+    /* Input */
+    const unsigned char *text;
+    Py_ssize_t length;
+    int text_mode;
+
+    /* Token list, like TokenStore */
+    signed char *kinds;
+    Py_ssize_t *starts;
+    Py_ssize_t *ends;
+    Py_ssize_t count;
+    Py_ssize_t capacity;
+    Py_ssize_t *name_ids; /* Index of the name of each token (-1 if it is not an ID), only made by tokenize */
+
+    /* Parser state */
+    Py_ssize_t index;
+    int nextToken;
+    int depth;
+    jmp_buf bail;
+
+    /* Symbol table, open addressing with a power of two capacity. tokenize uses it to number the distinct names */
+    Symbol *symbols;
+    Py_ssize_t symbol_count;
+    Py_ssize_t symbol_capacity;
+
+    /* Values of the blocks */
+    Value *values;
+    Py_ssize_t value_count;
+    Py_ssize_t value_capacity;
+} Parser;
+
+/* Ways run can stop early */
+#define BAIL_DECIDE 1 /* parser.py must run the program */
+#define BAIL_MEMORY 2
+
+static void bail(Parser *p, int reason) {
+    longjmp(p->bail, reason);
+}
+
+/******************************************************/
+/* Lexical Analyzer */
+
+static int char_class(const Parser *p, unsigned char ch) {
+    if ((ch >= 'a' && ch <= 'z') || (ch >= 'A' && ch <= 'Z'))
+        return LETTER;
+    if (ch >= '0' && ch <= '9')
+        return DIGIT;
+    /* \s of the master pattern: ASCII whitespace, and \x1c-\x1f too for a str (str.isspace) */
+    if (ch == ' ' || (ch >= '\t' && ch <= '\r') || (p->text_mode && ch >= 0x1c && ch <= 0x1f))
+        return SPACE;
+    return UNKNOWN;
+}
+
+static int is_word(const Parser *p, Py_ssize_t pos) {
+    return pos < p->length && (char_class(p, p->text[pos]) == LETTER || char_class(p, p->text[pos]) == DIGIT ||
+                               p->text[pos] == '_');
+}
+
+/* Look up operators and parentheses, returns -1 for an invalid character */
+static int lookup(unsigned char ch) {
+    switch (ch) {
+        case '=': return ASSIGN; /* == and <= are never reached, as in the master pattern (= and < come first) */
+        case ':': return COLON;
+        case ';': return SEMICOLON;
+        case '(': return LPAREN;
+        case ')': return RPAREN;
+        case '+': return PLUS;
+        case '-': return MINUS;
+        case '*': return TIMES;
+        case '/': return DIVIDE;
+        case '<': return LESS;
+        case '>': return GREATER;
+        default: return -1;
+    }
+}
+
+static int add_token(Parser *p, int kind, Py_ssize_t start, Py_ssize_t end) {
+    if (p->count == p->capacity) {
+        Py_ssize_t capacity = p->capacity ? p->capacity * 2 : 1024;
+        signed char *kinds = PyMem_RawRealloc(p->kinds, capacity);
+        if (kinds == NULL)
+            return -1;
+        p->kinds = kinds;
+        Py_ssize_t *starts = PyMem_RawRealloc(p->starts, capacity * sizeof(Py_ssize_t));
+        if (starts == NULL)
+            return -1;
+        p->starts = starts;
+        Py_ssize_t *ends = PyMem_RawRealloc(p->ends, capacity * sizeof(Py_ssize_t));
+        if (ends == NULL)
+            return -1;
+        p->ends = ends;
+        p->capacity = capacity;
+    }
+    p->kinds[p->count] = (signed char)kind;
+    p->starts[p->count] = start;
+    p->ends[p->count] = end;
+    p->count++;
+    return 0;
+}
+
+/* Scans the whole text into the token list. Returns 0, 1 on an invalid token or -1 when out of memory. */
+static int lex(Parser *p) {
+    const unsigned char *text = p->text;
+    Py_ssize_t length = p->length;
+    Py_ssize_t pos = 0;
+    while (pos < length) {
+        Py_ssize_t start = pos;
+        int kind;
+        switch (char_class(p, text[pos])) {
+            case SPACE:
+                while (pos < length && char_class(p, text[pos]) == SPACE)
+                    pos++;
+                continue;
+
+            case LETTER:
+                /* The word is scanned once, then looked up among the keywords that start like it */
+                kind = ID;
+                pos++;
+                while (pos < length && (char_class(p, text[pos]) == LETTER || char_class(p, text[pos]) == DIGIT))
+                    pos++;
+                if (pos - start < 2)
+                    break;
+                for (int k = keyword_slots[KEYWORD_HASH(text[start], text[start + 1])]; k >= 0; k = keyword_next[k]) {
+                    int word_length = keywords[k].length;
+                    /* A boundary keyword must be the whole word and not be followed by _ */
+                    if (keywords[k].boundary ? pos - start == word_length && !is_word(p, pos)
+                                             : pos - start >= word_length) {
+                        if (memcmp(text + start, keywords[k].word, word_length) == 0) {
+                            kind = keywords[k].token;
+                            pos = start + word_length;
+                            break;
+                        }
+                    }
+                }
+                break;
+
+            case DIGIT:
+                kind = NUMBER;
+                while (pos < length && char_class(p, text[pos]) == DIGIT)
+                    pos++;
+                if (pos + 1 < length && text[pos] == '.' && char_class(p, text[pos + 1]) == DIGIT) {
+                    pos++;
+                    while (pos < length && char_class(p, text[pos]) == DIGIT)
+                        pos++;
+                }
+                break;
+
+            default:
+                kind = lookup(text[pos]);
+                if (kind < 0)
+                    return 1;
+                pos++;
+                break;
+        }
+        if (add_token(p, kind, start, pos) < 0)
+            return -1;
+    }
+    return 0;
+}
+
+/******************************************************/
+/* Symbol table */
+
+static size_t hash_name(const unsigned char *name, Py_ssize_t length) {
+    size_t hash = 14695981039346656037ULL; /* FNV-1a */
+    for (Py_ssize_t k = 0; k < length; k++) {
+        hash ^= name[k];
+        hash *= 1099511628211ULL;
+    }
+    return hash;
+}
+
+/* Returns the slot of the name, empty (length 0) if the name is not in the table */
+static Symbol *find_symbol(Parser *p, Py_ssize_t start, Py_ssize_t length) {
+    size_t mask = (size_t)p->symbol_capacity - 1;
+    size_t slot = hash_name(p->text + start, length) & mask;
+    while (p->symbols[slot].length != 0) {
+        Symbol *symbol = &p->symbols[slot];
+        if (symbol->length == length && memcmp(p->text + symbol->start, p->text + start, length) == 0)
+            return symbol;
+        slot = (slot + 1) & mask;
+    }
+    return &p->symbols[slot];
+}
+
+/* Returns the slot of the name, added with the next id if the name is not in the table yet */
+static Symbol *add_symbol(Parser *p, Py_ssize_t start, Py_ssize_t length) {
+    if ((p->symbol_count + 1) * 2 > p->symbol_capacity) {
+        Symbol *old = p->symbols;
+        Py_ssize_t old_capacity = p->symbol_capacity;
+        Symbol *symbols = PyMem_RawCalloc(old_capacity * 2, sizeof(Symbol));
+        if (symbols == NULL)
+            bail(p, BAIL_MEMORY);
+        p->symbols = symbols;
+        p->symbol_capacity = old_capacity * 2;
+        for (Py_ssize_t k = 0; k < old_capacity; k++)
+            if (old[k].length != 0)
+                *find_symbol(p, old[k].start, old[k].length) = old[k];
+        PyMem_RawFree(old);
+    }
+    Symbol *symbol = find_symbol(p, start, length);
+    if (symbol->length == 0) {
+        symbol->start = start;
+        symbol->length = length;
+        symbol->id = p->symbol_count++;
+    }
+    return symbol;
+}
+
+static void store_symbol(Parser *p, Py_ssize_t start, Py_ssize_t length, Value value) {
+    add_symbol(p, start, length)->value = value;
+}
+
+/* Gives every ID token the id of its name in name_ids, the same name always gets the same id */
+static void number_names(Parser *p) {
+    p->name_ids = PyMem_RawMalloc((p->count ? p->count : 1) * sizeof(Py_ssize_t));
+    if (p->name_ids == NULL)
+        bail(p, BAIL_MEMORY);
+    for (Py_ssize_t k = 0; k < p->count; k++)
+        p->name_ids[k] = p->kinds[k] == ID ? add_symbol(p, p->starts[k], p->ends[k] - p->starts[k])->id : -1;
+}
+
+/******************************************************/
+/* Values, with the results of Python's int and float operations */
+
+static Value int_value(long long i) {
+    Value value = {0, i, 0.0};
+    return value;
+}
+
+static Value real_value(double d) {
+    Value value = {1, 0, d};
+    return value;
+}
+
+/* The value as a double, only for ints a double holds exactly */
+static double to_double(Parser *p, Value value) {
+    if (value.is_real)
+        return value.d;
+    if (value.i > EXACT_INT || value.i < -EXACT_INT)
+        bail(p, BAIL_DECIDE);
+    return (double)value.i;
+}
+
+static Value arithmetic(Parser *p, Value left, int op, Value right) {
+    if (op == DIVIDE) {
+        /* / always gives a real, Python divides ints that fit in 53 bits as doubles too */
+        double divisor = to_double(p, right);
+        if (divisor == 0.0)
+            bail(p, BAIL_DECIDE); /* ZeroDivisionError */
+        return real_value(to_double(p, left) / divisor);
+    }
+    if (left.is_real || right.is_real) {
+        double a = to_double(p, left), b = to_double(p, right);
+        return real_value(op == PLUS ? a + b : op == MINUS ? a - b : a * b);
+    }
+    long long result;
+#if defined(__GNUC__) || defined(__clang__)
+    int overflow = op == PLUS ? __builtin_saddll_overflow(left.i, right.i, &result)
+                 : op == MINUS ? __builtin_ssubll_overflow(left.i, right.i, &result)
+                 : __builtin_smulll_overflow(left.i, right.i, &result);
+#else
+    /* Without the builtins, only operands below 2**31 are safe for all three operations */
+    int overflow = left.i > INT_MAX || left.i < -INT_MAX || right.i > INT_MAX || right.i < -INT_MAX;
+    result = op == PLUS ? left.i + right.i : op == MINUS ? left.i - right.i : left.i * right.i;
+#endif
+    if (overflow)
+        bail(p, BAIL_DECIDE); /* Python ints keep growing */
+    return int_value(result);
+}
+
+static Value cast(Parser *p, int kind, Value value) {
+    if (kind == REAL)
+        return real_value(to_double(p, value));
+    if (!value.is_real)
+        return value;
+    /* int ( ) of inf or nan raises, and ints from 2**63 on don't fit in a long long */
+    if (!isfinite(value.d) || value.d >= 9223372036854775808.0 || value.d <= -9223372036854775808.0)
+        bail(p, BAIL_DECIDE);
+    return int_value((long long)value.d);
+}
+
+static int compare(Parser *p, Value left, int op, Value right) {
+    if (!left.is_real && !right.is_real) {
+        long long a = left.i, b = right.i;
+        switch (op) {
+            case LESS: return a < b;
+            case LESSEQ: return a <= b;
+            case GREATER: return a > b;
+            case GREATEREQ: return a >= b;
+            case EQUAL: return a == b;
+            default: return a != b;
+        }
+    }
+    double a = to_double(p, left), b = to_double(p, right);
+    switch (op) {
+        case LESS: return a < b;
+        case LESSEQ: return a <= b;
+        case GREATER: return a > b;
+        case GREATEREQ: return a >= b;
+        case EQUAL: return a == b;
+        default: return a != b;
+    }
+}
+
+static Value number(Parser *p, Py_ssize_t start, Py_ssize_t end) {
+    const unsigned char *text = p->text;
+    if (memchr(text + start, '.', end - start) == NULL) {
+        long long i = 0;
+        for (Py_ssize_t pos = start; pos < end; pos++) {
+            int digit = text[pos] - '0';
+            if (i > (LLONG_MAX - digit) / 10)
+                bail(p, BAIL_DECIDE);
+            i = i * 10 + digit;
+        }
+        return int_value(i);
+    }
+    /* float() rounds the exact decimal value. Digits below 2**53 over a power of ten up to 10**22 are both exact doubles,
+     * so their quotient is rounded the same way (Clinger's fast path), longer literals are left to parser.py */
+    static const double powers_of_ten[] = {
+        1e0, 1e1, 1e2, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9, 1e10, 1e11, 1e12, 1e13, 1e14, 1e15, 1e16, 1e17, 1e18, 1e19,
+        1e20, 1e21, 1e22
+    };
+    long long digits = 0;
+    int decimals = 0, after_dot = 0;
+    for (Py_ssize_t pos = start; pos < end; pos++) {
+        if (text[pos] == '.') {
+            after_dot = 1;
+            continue;
+        }
+        digits = digits * 10 + (text[pos] - '0');
+        decimals += after_dot;
+        if (digits > EXACT_INT || decimals > 22)
+            bail(p, BAIL_DECIDE);
+    }
+    return real_value((double)digits / powers_of_ten[decimals]);
+}
+
+/******************************************************/
+/* Parser, one function per grammar rule as in Parser */
+
+static void getToken(Parser *p) {
+    p->nextToken = p->index < p->count ? p->kinds[p->index] : EOF_TOKEN;
+    p->index++;
+}
+
+static void consume(Parser *p, int kind) {
+    if (p->nextToken != kind)
+        bail(p, BAIL_DECIDE); /* Syntax error */
+    getToken(p);
+}
+
+static Value expr(Parser *p);
+
+/* factor: Parses <factor> -> ( <expr> ) | id | number | <type> ( <expr> ) */
+static Value factor(Parser *p) {
+    int kind = p->nextToken;
+    Py_ssize_t current = p->index - 1;
+    Value result = {0, 0, 0.0};
+    switch (kind) {
+        case LPAREN:
+            getToken(p);
+            result = expr(p);
+            consume(p, RPAREN);
+            return result;
+
+        case ID: {
+            getToken(p);
+            Symbol *symbol = find_symbol(p, p->starts[current], p->ends[current] - p->starts[current]);
+            if (symbol->length == 0)
+                bail(p, BAIL_DECIDE); /* Undefined variable */
+            return symbol->value;
+        }
+
+        case NUMBER:
+            getToken(p);
+            return number(p, p->starts[current], p->ends[current]);
+
+        case INT:
+        case REAL:
+            getToken(p);
+            consume(p, LPAREN);
+            result = expr(p);
+            consume(p, RPAREN);
+            return cast(p, kind, result);
+
+        default:
+            bail(p, BAIL_DECIDE);
+            return result;
+    }
+}
+
+/* term: Parses <term> -> <factor> {(* | /) <factor>} */
+static Value term(Parser *p) {
+    Value result = factor(p);
+    while (p->nextToken == TIMES || p->nextToken == DIVIDE) {
+        int op = p->nextToken;
+        getToken(p);
+        Value right = factor(p);
+        result = arithmetic(p, result, op, right);
+    }
+    return result;
+}
+
+/* cond: Parses <cond> -> <oprnd> (< | <= | > | >= | == | <>) <oprnd>, the operands are factors as in Parser.cond */
+static int cond(Parser *p) {
+    Value left = factor(p);
+    int op = p->nextToken;
+    if (op < LESS || op > NOTEQ)
+        bail(p, BAIL_DECIDE);
+    getToken(p);
+    Value right = factor(p);
+    return compare(p, left, op, right);
+}
+
+/* if_expr: Parses if <cond> then <expr> else <expr>, both branches are evaluated as in Parser.if_expr */
+static Value if_expr(Parser *p) {
+    consume(p, IF);
+    int condition = cond(p);
+    consume(p, THEN);
+    Value true_expr = expr(p);
+    consume(p, ELSE);
+    Value false_expr = expr(p);
+    return condition ? true_expr : false_expr;
+}
+
+/* expr: Parses <expr> -> <term> {(+ | -) <term>} | <if-expr> */
+static Value expr(Parser *p) {
+    if (++p->depth > MAX_DEPTH)
+        bail(p, BAIL_DECIDE);
+    Value result;
+    if (p->nextToken == IF) {
+        result = if_expr(p);
+    } else {
+        result = term(p);
+        while (p->nextToken == PLUS || p->nextToken == MINUS) {
+            int op = p->nextToken;
+            getToken(p);
+            Value right = term(p);
+            result = arithmetic(p, result, op, right);
+        }
+    }
+    p->depth--;
+    return result;
+}
+
+/* type: Parses <type> -> int | real */
+static void type(Parser *p) {
+    if (p->nextToken != INT && p->nextToken != REAL)
+        bail(p, BAIL_DECIDE);
+    getToken(p);
+}
+
+/* decl: Parses <decl> -> id : <type> = <expr> ; */
+static void decl(Parser *p) {
+    Py_ssize_t name = p->index - 1;
+    consume(p, ID);
+    consume(p, COLON);
+    type(p);
+    consume(p, ASSIGN);
+    Value value = expr(p);
+    consume(p, SEMICOLON);
+    store_symbol(p, p->starts[name], p->ends[name] - p->starts[name], value);
+}
+
+/* let_in_end: Parses let <decl-list> in <type> ( <expr> ) end ; */
+static Value let_in_end(Parser *p) {
+    consume(p, LET);
+    decl(p);
+    while (p->nextToken == ID)
+        decl(p);
+    consume(p, IN);
+    type(p);
+    consume(p, LPAREN);
+    Value result = expr(p);
+    consume(p, RPAREN);
+    consume(p, END);
+    consume(p, SEMICOLON);
+    return result;
+}
+
+/* prog: Parses <let-in-end> { <let-in-end> }, stopping silently at a token that doesn't start a block */
+static void prog(Parser *p) {
+    while (p->nextToken == LET) {
+        Value value = let_in_end(p);
+        if (p->value_count == p->value_capacity) {
+            Py_ssize_t capacity = p->value_capacity ? p->value_capacity * 2 : 64;
+            Value *values = PyMem_RawRealloc(p->values, capacity * sizeof(Value));
+            if (values == NULL)
+                bail(p, BAIL_MEMORY);
+            p->values = values;
+            p->value_capacity = capacity;
+        }
+        p->values[p->value_count++] = value;
+    }
+}
+
+/* Lexes the text and makes an empty symbol table, returns 0, BAIL_DECIDE on an invalid token or BAIL_MEMORY */
+static int start_parser(Parser *p) {
+    int lexed = lex(p);
+    if (lexed != 0)
+        return lexed < 0 ? BAIL_MEMORY : BAIL_DECIDE;
+    p->symbol_capacity = 64;
+    p->symbols = PyMem_RawCalloc(p->symbol_capacity, sizeof(Symbol));
+    if (p->symbols == NULL)
+        return BAIL_MEMORY;
+    return 0;
+}
+
+/* Runs the program, returns 0 when the values are ready, BAIL_DECIDE or BAIL_MEMORY */
+static int run_parser(Parser *p) {
+    int reason = start_parser(p);
+    if (reason != 0)
+        return reason;
+    reason = setjmp(p->bail);
+    if (reason != 0)
+        return reason;
+    getToken(p);
+    prog(p);
+    return 0;
+}
+
+/* Lexes the text and numbers its names, returns 0, BAIL_DECIDE on an invalid token or BAIL_MEMORY */
+static int tokenize_names(Parser *p) {
+    int reason = start_parser(p);
+    if (reason != 0)
+        return reason;
+    reason = setjmp(p->bail);
+    if (reason != 0)
+        return reason;
+    number_names(p);
+    return 0;
+}
+
+static void free_parser(Parser *p) {
+    PyMem_RawFree(p->kinds);
+    PyMem_RawFree(p->starts);
+    PyMem_RawFree(p->ends);
+    PyMem_RawFree(p->name_ids);
+    PyMem_RawFree(p->symbols);
+    PyMem_RawFree(p->values);
+}
+
+/******************************************************/
+/* Module functions */
+
+/* Offsets as TokenStore keeps them: 32 bit unless the text is over 2 GB */
+static PyObject *offsets_bytes(const Py_ssize_t *offsets, Py_ssize_t count, int wide) {
+    PyObject *result = PyBytes_FromStringAndSize(NULL, count * (wide ? sizeof(int64_t) : sizeof(int32_t)));
+    if (result == NULL)
+        return NULL;
+    char *data = PyBytes_AS_STRING(result);
+    for (Py_ssize_t k = 0; k < count; k++) {
+        if (wide) {
+            int64_t offset = offsets[k];
+            memcpy(data + k * sizeof(int64_t), &offset, sizeof(int64_t));
+        } else {
+            int32_t offset = (int32_t)offsets[k];
+            memcpy(data + k * sizeof(int32_t), &offset, sizeof(int32_t));
+        }
+    }
+    return result;
+}
+
+/* The distinct names in the order of their ids, as interned str (like sys.intern) so the symbol table of the parser
+ * finds them by identity */
+static PyObject *name_list(const Parser *p) {
+    PyObject *names = PyList_New(p->symbol_count);
+    if (names == NULL)
+        return NULL;
+    for (Py_ssize_t k = 0; k < p->symbol_capacity; k++) {
+        const Symbol *symbol = &p->symbols[k];
+        if (symbol->length == 0)
+            continue;
+        PyObject *name = PyUnicode_DecodeASCII((const char *)p->text + symbol->start, symbol->length, NULL);
+        if (name == NULL) {
+            Py_DECREF(names);
+            return NULL;
+        }
+        PyUnicode_InternInPlace(&name);
+        PyList_SET_ITEM(names, symbol->id, name);
+    }
+    return names;
+}
+
+static PyObject *cparser_tokenize(PyObject *module, PyObject *args) {
+    Py_buffer view;
+    int text_mode = 0;
+    if (!PyArg_ParseTuple(args, "y*|p:tokenize", &view, &text_mode))
+        return NULL;
+    Parser p;
+    memset(&p, 0, sizeof(p));
+    p.text = view.buf;
+    p.length = view.len;
+    p.text_mode = text_mode;
+    int reason;
+    Py_BEGIN_ALLOW_THREADS
+    reason = tokenize_names(&p);
+    Py_END_ALLOW_THREADS
+
+    PyObject *result = NULL;
+    if (reason == BAIL_MEMORY) {
+        PyErr_NoMemory();
+    } else if (reason == BAIL_DECIDE) {
+        Py_INCREF(Py_None);
+        result = Py_None;
+    } else {
+        int wide = p.length >= ((Py_ssize_t)1 << 31);
+        PyObject *kinds = PyBytes_FromStringAndSize((const char *)p.kinds, p.count);
+        PyObject *starts = offsets_bytes(p.starts, p.count, wide);
+        PyObject *ends = offsets_bytes(p.ends, p.count, wide);
+        PyObject *name_ids = offsets_bytes(p.name_ids, p.count, wide);
+        PyObject *names = name_list(&p);
+        if (kinds && starts && ends && name_ids && names)
+            result = PyTuple_Pack(5, kinds, starts, ends, name_ids, names);
+        Py_XDECREF(kinds);
+        Py_XDECREF(starts);
+        Py_XDECREF(ends);
+        Py_XDECREF(name_ids);
+        Py_XDECREF(names);
+    }
+    free_parser(&p);
+    PyBuffer_Release(&view);
+    return result;
+}
+
+static PyObject *cparser_run(PyObject *module, PyObject *args) {
+    Py_buffer view;
+    int text_mode = 0;
+    if (!PyArg_ParseTuple(args, "y*|p:run", &view, &text_mode))
+        return NULL;
+    Parser p;
+    memset(&p, 0, sizeof(p));
+    p.text = view.buf;
+    p.length = view.len;
+    p.text_mode = text_mode;
+    int reason;
+    Py_BEGIN_ALLOW_THREADS
+    reason = run_parser(&p);
+    Py_END_ALLOW_THREADS
+
+    PyObject *result = NULL;
+    if (reason == BAIL_MEMORY) {
+        PyErr_NoMemory();
+    } else if (reason == BAIL_DECIDE) {
+        Py_INCREF(Py_None);
+        result = Py_None;
+    } else if ((result = PyList_New(p.value_count)) != NULL) {
+        for (Py_ssize_t k = 0; k < p.value_count; k++) {
+            Value value = p.values[k];
+            PyObject *item = value.is_real ? PyFloat_FromDouble(value.d) : PyLong_FromLongLong(value.i);
+            if (item == NULL) {
+                Py_CLEAR(result);
+                break;
+            }
+            PyList_SET_ITEM(result, k, item);
+        }
+    }
+    free_parser(&p);
+    PyBuffer_Release(&view);
+    return result;
+}
+
+static PyMethodDef cparser_methods[] = {
+    {"tokenize", cparser_tokenize, METH_VARARGS,
+     "tokenize(text, text_mode=False)\n--\n\nScans a bytes-like text, returns (kinds, starts, ends, name_ids, names) or None on an invalid token."},
+    {"run", cparser_run, METH_VARARGS,
+     "run(text, text_mode=False)\n--\n\nRuns a bytes-like program, returns the values of its blocks or None when parser.py must run it."},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef cparser_module = {
+    PyModuleDef_HEAD_INIT, "_cparser", "C lexer and parser for .tiny programs, see cparser.c.", -1, cparser_methods
+};
+
+PyMODINIT_FUNC PyInit__cparser(void) {
+    build_keyword_slots();
+    PyObject *module = PyModule_Create(&cparser_module);
+    if (module == NULL)
+        return NULL;
+    size_t count = sizeof(token_names) / sizeof(token_names[0]);
+    PyObject *names = PyTuple_New(count);
+    if (names == NULL) {
+        Py_DECREF(module);
+        return NULL;
+    }
+    for (size_t k = 0; k < count; k++) {
+        PyObject *name = PyUnicode_FromString(token_names[k]);
+        if (name == NULL) {
+            Py_DECREF(names);
+            Py_DECREF(module);
+            return NULL;
+        }
+        PyTuple_SET_ITEM(names, k, name);
+    }
+    if (PyModule_AddObject(module, "TOKEN_NAMES", names) < 0) {
+        Py_DECREF(names);
+        Py_DECREF(module);
+        return NULL;
+    }
+    return module;
+}
@@ -0,0 +1,52 @@
+'''
+Client for the parser server (python3 server.py SOCKET)
+
+Prints the same thing as python3 parser.py input_file, but the parsing is done by the running server,
+so Python doesn't have to load the parser and compile its patterns for every file.
+If no server answers on the socket, it runs parser.py itself.
+
+Usage:
+python3 parse_client.py [--socket SOCKET] [--engine parse|stack|ll1|ast|compile] input_file
+The socket can also be given in the TINY_PARSER_SOCKET environment variable.
+'''
+
+import argparse
+import json
+import os
+import socket
+import sys
+
+PARSER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parser.py')
+
+# parser.py option for each engine, used when there is no server
+ENGINE_OPTIONS = {'parse': [], 'stack': ['--stack'], 'll1': ['--ll1'], 'ast': ['--ast'], 'compile': ['--compile']}
+
+def request(address, message):
+    """ Sends one request to the server and returns its response. """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(address)
+        client.sendall(json.dumps(message).encode() + b'\n')
+        client.shutdown(socket.SHUT_WR)
+        with client.makefile('rb') as responses:
+            return json.loads(responses.readline())
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Parses a .tiny file on a running parser server.")
+    arg_parser.add_argument('input_file')
+    arg_parser.add_argument('--socket', default=os.environ.get('TINY_PARSER_SOCKET'), help="Unix socket of the server")
+    arg_parser.add_argument('--engine', choices=sorted(ENGINE_OPTIONS), default='parse')
+    args = arg_parser.parse_args()
+    if not os.path.isfile(args.input_file):
+        arg_parser.error(f"no such file: {args.input_file}")
+
+    try:
+        if not args.socket:
+            raise ConnectionRefusedError
+        response = request(args.socket, {'path': os.path.abspath(args.input_file), 'engine': args.engine})
+    except (ConnectionRefusedError, FileNotFoundError):
+        # No server, run the parser here instead
+        os.execv(sys.executable, [sys.executable, PARSER, *ENGINE_OPTIONS[args.engine], args.input_file])
+
+    sys.stdout.write(response['output'])
+    if response['error'] is not None:
+        print("Error")
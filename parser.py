@@ -36,8 +36,33 @@ The Context Free grammar provided for this python script is the following:
 
 '''
 
+import argparse
+import bisect
+import collections
+import concurrent.futures
+import contextlib
+import functools
+import glob
+import hashlib
+import heapq
+import io
+import json
+import marshal
+import math
+import mmap
+import operator
+import os
 import sys
 import re
+import struct
+import time
+from array import array
+
+# Optional C extension (cparser.c), built with python3 setup.py build_ext --inplace
+try:
+    import _cparser
+except ImportError:
+    _cparser = None
 
 '''
 This entire section defines the lexical analyzer.
@@ -73,73 +98,676 @@ TOKEN_TYPES = {
     'NOTEQ': r'<>'
 }
 
+# Integer token codes, in the same order as TOKEN_TYPES (like ADD_OP = 21 in the C translation).
+# The parser compares these instead of the token type strings.
+(LET, IN, END, IF, THEN, ELSE, INT, REAL, ID, NUMBER, ASSIGN, COLON, SEMICOLON, LPAREN, RPAREN,
+ PLUS, MINUS, TIMES, DIVIDE, LESS, LESSEQ, GREATER, GREATEREQ, EQUAL, NOTEQ, EOF) = range(len(TOKEN_TYPES) + 1)
+
+TOKEN_NAMES = list(TOKEN_TYPES) + ['EOF']
+TOKEN_CODES = {token_type: code for code, token_type in enumerate(TOKEN_NAMES)}
+
+if _cparser is not None and _cparser.TOKEN_NAMES != tuple(TOKEN_NAMES):
+    _cparser = None # Built from another version of the token table
+
+# Codes for the master pattern groups that are not tokens
+SKIP = -1
+KEYWORD = -2
+
+def _master_pattern(token_types):
+    """
+    Builds one compiled alternation (like master_pat in the book example) out of TOKEN_TYPES.
+    The alternatives keep the dictionary order, so the first pattern that matches still wins.
+    Keywords are grouped under KEYWORD and resolved through KEYWORDS once the text is matched.
+    'let', 'end', 'if', 'then' and 'else' have no word boundary, so they also match as prefixes (letx -> let, x).
+    """
+    keywords = {}
+    keyword_alts = []
+    alternatives = [r'(?P<WS>\s+)']
+    for token_type, pattern in token_types.items():
+        word = pattern.replace(r'\b', '')
+        if word.isalpha():
+            keywords[word] = token_type
+            # A trailing \b only has to be checked forward, the token always starts on a boundary
+            keyword_alts.append(word + r'(?!\w)' if pattern.endswith(r'\b') else word)
+            if len(keyword_alts) == 1:
+                alternatives.append(None) # Placeholder, keywords are tried where the first one appears
+        else:
+            alternatives.append(f'(?P<{token_type}>{pattern})')
+    alternatives[alternatives.index(None)] = '(?P<KEYWORD>' + '|'.join(keyword_alts) + ')'
+    return re.compile('|'.join(alternatives)), keywords
+
+MASTER_PATTERN, KEYWORDS = _master_pattern(TOKEN_TYPES)
+
+# Bytes version of the master pattern, used to scan memory-mapped files without decoding them first.
+# In bytes mode \s, \d and \w only match ASCII, which is all the grammar uses.
+MASTER_PATTERN_BYTES = re.compile(MASTER_PATTERN.pattern.encode('ascii'))
+
+KEYWORD_CODES = {word: TOKEN_CODES[token_type] for word, token_type in KEYWORDS.items()}
+KEYWORD_CODES_BYTES = {word.encode('ascii'): code for word, code in KEYWORD_CODES.items()}
+
+# Token code for each group number of the master pattern (match.lastindex), so no group name is looked up while scanning
+GROUP_CODES = [None] * (MASTER_PATTERN.groups + 1)
+for _name, _index in MASTER_PATTERN.groupindex.items():
+    GROUP_CODES[_index] = {'WS': SKIP, 'KEYWORD': KEYWORD}.get(_name, TOKEN_CODES.get(_name))
+
+def _snippet(text, pos):
+    """ Returns the text shown in lexical error messages. """
+    snippet = text[pos:pos + 10]
+    return snippet if isinstance(snippet, str) else bytes(snippet).decode('ascii', 'replace')
+
+def scan(text, pos=0):
+    """
+    Scans the text once, moving an offset forward instead of slicing the consumed text away.
+    Works on a str or, with the bytes pattern, on any bytes-like object (bytes, mmap...).
+    Yields (kind, start, end) for every token from offset pos on, whitespace is skipped.
+    """
+    if isinstance(text, str):
+        pattern, keywords = MASTER_PATTERN, KEYWORD_CODES
+    else:
+        pattern, keywords = MASTER_PATTERN_BYTES, KEYWORD_CODES_BYTES
+    codes = GROUP_CODES
+    for match in iter(pattern.scanner(text, pos).match, None):
+        kind = codes[match.lastindex]
+        start, pos = match.span()
+        if kind < 0:
+            if kind == SKIP:
+                continue
+            kind = keywords[match.group()]
+        yield (kind, start, pos)
+    if pos < len(text):
+        raise SyntaxError(f"Invalid token at: {_snippet(text, pos)}")
+
+def generate_tokens(text):
+    """
+    Yields the tokens of the text as (token_type, token_value) tuples.
+    """
+    for kind, start, end in scan(text):
+        yield (TOKEN_NAMES[kind], text[start:end])
+
+# Character classes of the DFA scanner. The letters of the keywords and the characters of the operators get a class each
+# (from DFA_FIRST_CHAR_CLASS on), so the keyword and operator paths can branch on them.
+# DIGIT is 0-9, UDIGIT any other \d (str mode), WORD the rest of \w (_ and other letters), END marks the end of the text.
+(C_OTHER, C_SPACE, C_LETTER, C_DIGIT, C_UDIGIT, C_WORD, C_DOT, C_END) = range(8)
+DFA_FIRST_CHAR_CLASS = 8
+
+# Accept code of a stop in the middle of a number ('3.' with no digit after it): the token ends one character earlier
+RETREAT = -3
+
+def _literal(pattern):
+    """ The text an operator pattern of TOKEN_TYPES matches, such as '<=' for r'<=' and '(' for r'\\('. """
+    literal = re.sub(r'\\(.)', r'\1', pattern)
+    if not re.fullmatch(pattern, literal):
+        raise ValueError(f"{pattern} is not a literal")
+    return literal
+
+def _dfa_tables():
+    """
+    Builds the tables of dfa_scan out of TOKEN_TYPES and KEYWORDS, with the quirks of MASTER_PATTERN:
+    - keywords win over ID, 'let', 'end', 'if', 'then' and 'else' also as prefixes (letx -> let, x), 'in', 'int' and
+      'real' only when no \\w follows (int5 is an ID, in_ is the ID 'in' then an invalid '_')
+    - operators are tried in dictionary order and the first one that matches wins, so one whose beginning is an earlier
+      operator never matches: '<=' scans as '<' '=' and '==' as '=' '='
+    - a number is \\d+(\\.\\d+)?, '3.' scans as 3 and then the '.' is invalid
+    Returns (str classes, bytes classes, transitions, accepts, width). A state is the offset of its row in the flat
+    transitions and accepts lists (width entries, one per class), 0 is the dead state and width the start state.
+    transitions[state + class] is the next state. accepts[state + class] is the kind of the token when the scanner
+    stops in state with class next, SKIP for whitespace, RETREAT, or None for an invalid token.
+    """
+    keywords = {}
+    operators = []
+    for token_type, pattern in TOKEN_TYPES.items():
+        word = pattern.replace(r'\b', '')
+        if word.isalpha():
+            keywords[word] = (TOKEN_CODES[token_type], pattern.endswith(r'\b'))
+        elif token_type not in ('ID', 'NUMBER'):
+            operators.append((_literal(pattern), TOKEN_CODES[token_type]))
+
+    # Characters with a class of their own
+    own_class = {}
+    for char in sorted(set(''.join(keywords))) + [literal_char for literal, _ in operators for literal_char in literal]:
+        own_class.setdefault(char, DFA_FIRST_CHAR_CLASS + len(own_class))
+    width = DFA_FIRST_CHAR_CLASS + len(own_class)
+
+    def char_class(char, ascii_only):
+        if char in own_class:
+            return own_class[char]
+        if ascii_only and not char.isascii():
+            return C_OTHER
+        if char.isspace():
+            return C_SPACE
+        if char.isascii() and char.isalpha():
+            return C_LETTER
+        if char.isascii() and char.isdigit():
+            return C_DIGIT
+        if char.isdecimal():
+            return C_UDIGIT
+        if char.isalnum() or char == '_':
+            return C_WORD
+        return C_DOT if char == '.' else C_OTHER
+
+    # In bytes mode \s is only ASCII whitespace without \x1c-\x1f, which str.isspace includes
+    byte_classes = bytes(char_class(chr(code), True) if not 0x1c <= code <= 0x1f else C_OTHER for code in range(256))
+    str_classes = _CharClasses((code, char_class(chr(code), False)) for code in range(128))
+    str_classes.char_class = char_class
+
+    id_classes = [C_LETTER, C_DIGIT] + [own_class[char] for char in own_class if char.isalnum()]
+    word_classes = set(id_classes) | {C_UDIGIT, C_WORD}
+    digit_classes = (C_DIGIT, C_UDIGIT)
+
+    transitions = [0] * width
+    accepts = [None] * width
+    def new_state(accept=None):
+        state = len(transitions)
+        transitions.extend([0] * width)
+        accepts.extend(accept if isinstance(accept, list) else [accept] * width)
+        return state
+    start = new_state()
+    space = new_state(SKIP)
+    identifier = new_state(ID)
+    integer, dot, fraction = new_state(NUMBER), new_state(RETREAT), new_state(NUMBER)
+
+    transitions[start + C_SPACE] = transitions[space + C_SPACE] = space
+    for char_class_ in id_classes:
+        transitions[start + char_class_] = transitions[identifier + char_class_] = identifier
+    for char_class_ in digit_classes:
+        transitions[start + char_class_] = transitions[integer + char_class_] = integer
+        transitions[dot + char_class_] = transitions[fraction + char_class_] = fraction
+    transitions[integer + C_DOT] = dot
+
+    # Keyword paths, one state per prefix of a keyword, leaving to ID on any other letter or digit
+    prefixes = {'': start}
+    for prefix in sorted({word[:end] for word in keywords for end in range(1, len(word) + 1)}, key=len):
+        if prefix in keywords:
+            kind, boundary = keywords[prefix]
+            if not boundary and any(word != prefix and word.startswith(prefix) for word in keywords):
+                raise ValueError(f"Keyword {prefix} is a prefix of another keyword")
+            accept = [ID if boundary and char_class_ in word_classes else kind for char_class_ in range(width)]
+        else:
+            kind, boundary, accept = None, True, ID
+        state = prefixes[prefix] = new_state(accept)
+        transitions[prefixes[prefix[:-1]] + own_class[prefix[-1]]] = state
+        if boundary: # A keyword without boundary ends as soon as it is complete
+            for char_class_ in id_classes:
+                transitions[state + char_class_] = identifier
+
+    # Operator paths, an operator that starts with an earlier one can't be reached
+    paths = {'': start}
+    complete = []
+    for literal, kind in operators:
+        if any(literal.startswith(earlier) for earlier in complete):
+            continue
+        complete.append(literal)
+        for end in range(1, len(literal) + 1):
+            if literal[:end] not in paths:
+                paths[literal[:end]] = new_state()
+                transitions[paths[literal[:end - 1]] + own_class[literal[end - 1]]] = paths[literal[:end]]
+        state = paths[literal]
+        accepts[state:state + width] = [kind] * width
+    return str_classes, byte_classes, transitions, accepts, width
+
+class _CharClasses(dict):
+    """ str.translate table from characters to DFA classes, other than ASCII characters are classified when first seen. """
+    def __missing__(self, code):
+        self[code] = self.char_class(chr(code), False)
+        return self[code]
+
+DFA_STR_CLASSES, DFA_BYTE_CLASSES, DFA_TRANSITIONS, DFA_ACCEPTS, DFA_WIDTH = _dfa_tables()
+DFA_START = DFA_WIDTH
+DFA_END_CLASS = bytes((C_END,))
+
+def dfa_scan(text, pos=0):
+    """
+    Scans the text with the DFA tables instead of the master pattern and yields the same (kind, start, end) tokens
+    and the same errors as scan, on a str or any bytes-like object.
+    The class of every character is looked up once for the whole text (str.translate or bytes.translate), then each
+    character costs one lookup in the transitions. A token ends where the current state has no transition for the next
+    character, and the accepts of that state and character give its kind.
+    """
+    if isinstance(text, str):
+        classes = text.translate(DFA_STR_CLASSES).encode('latin-1') + DFA_END_CLASS
+    else:
+        classes = bytes(text).translate(DFA_BYTE_CLASSES) + DFA_END_CLASS
+    transitions, accepts, start_state = DFA_TRANSITIONS, DFA_ACCEPTS, DFA_START
+    length = len(text)
+    while pos < length:
+        start = pos
+        state = start_state
+        while True:
+            following = transitions[state + classes[pos]]
+            if not following:
+                break
+            state = following
+            pos += 1
+        kind = accepts[state + classes[pos]]
+        if kind is None:
+            raise SyntaxError(f"Invalid token at: {_snippet(text, start)}")
+        if kind < 0:
+            if kind == SKIP:
+                continue
+            pos -= 1 # RETREAT
+            kind = NUMBER
+        yield (kind, start, pos)
+
+# Size of the pieces read from the file in streaming mode
+CHUNK_SIZE = 64 * 1024
+
+# A token is only accepted once two more characters are buffered after it.
+# That is enough to tell '3' from '3.5', 'le' from 'let' and 'in' from 'int'.
+LOOKAHEAD = 2
+
+def read_chunks(file, chunk_size=CHUNK_SIZE):
+    """
+    Reads the file piece by piece instead of loading it whole.
+    """
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+def generate_tokens_from_chunks(chunks):
+    """
+    Same as scan, but the text arrives in chunks and (kind, lexeme) pairs are yielded.
+    Only the unconsumed tail of the previous chunk is kept, so a token that crosses a chunk boundary
+    is finished with the next chunk and memory stays bounded by the chunk size.
+    """
+    match_at = MASTER_PATTERN.match
+    codes = GROUP_CODES
+    buffer = ''
+    for chunk in chunks:
+        buffer += chunk
+        pos = 0
+        safe = len(buffer) - LOOKAHEAD
+        while pos < safe:
+            match = match_at(buffer, pos)
+            if match is None:
+                raise SyntaxError(f"Invalid token at: {_snippet(buffer, pos)}")
+            if match.end() > safe:
+                break # The token could still continue in the next chunk
+            pos = match.end()
+            kind = codes[match.lastindex]
+            if kind == SKIP:
+                continue
+            lexeme = match.group()
+            yield (KEYWORD_CODES[lexeme] if kind == KEYWORD else kind, lexeme)
+        buffer = buffer[pos:]
+    for kind, start, end in scan(buffer):
+        yield (kind, buffer[start:end])
+
+# Searched in texts given as buffers (see BufferLexer), \s is the same as in the master pattern
+NEWLINE_BYTES = re.compile(rb'\n')
+SPACES = re.compile(r'\s*')
+SPACES_BYTES = re.compile(rb'\s*')
+
+class LineIndex:
+    """
+        Maps offsets of a text to line and column numbers (both starting at 1).
+        The offsets where the lines start are only searched the first time a position is asked for, in one pass over the text,
+        then every lookup is a binary search (bisect). Lexing itself never counts lines.
+    """
+    def __init__(self, text):
+        self.text = text
+
+    @functools.cached_property
+    def line_starts(self):
+        """ Offsets where the lines start, the first line starts at 0. """
+        text = self.text
+        starts = array('q', [0])
+        if isinstance(text, memoryview): # No find method, the regex engine searches the buffer in place
+            starts.extend(match.end() for match in NEWLINE_BYTES.finditer(text))
+            return starts
+        newline = '\n' if isinstance(text, str) else b'\n'
+        pos = text.find(newline)
+        while pos >= 0:
+            starts.append(pos + 1)
+            pos = text.find(newline, pos + 1)
+        return starts
+
+    def line_column(self, offset):
+        """ Returns (line, column) of an offset. """
+        starts = self.line_starts
+        line = bisect.bisect_right(starts, offset)
+        return line, offset - starts[line - 1] + 1
+
+def skip_spaces(text, pos):
+    """ Returns the offset of the first character from pos on that is not whitespace (where scan stopped on an error). """
+    return (SPACES if isinstance(text, str) else SPACES_BYTES).match(text, pos).end()
+
+class TokenStore:
+    """
+        Compact token list: the kind, start offset and end offset of every token are kept in parallel arrays
+        instead of one (token_type, token_value) tuple per token.
+        The text of a token is only cut out of the source when it is asked for.
+    """
+    def __init__(self, text):
+        self.text = text
+        # 32 bit offsets are enough unless the input is over 2 GB
+        offset_type = 'i' if len(text) < 2 ** 31 else 'q'
+        self.kinds = array('b')
+        self.starts = array(offset_type)
+        self.ends = array(offset_type)
+        # Set when the C extension tokenized the text: the distinct identifiers as interned str (names),
+        # and the index in names of the identifier of each token, -1 for the tokens that are not IDs (name_ids)
+        self.name_ids = None
+        self.names = None
+
+    def append(self, kind, start, end):
+        self.kinds.append(kind)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def lexeme(self, index):
+        """ Returns the text of the token at index. """
+        lexeme = self.text[self.starts[index]:self.ends[index]]
+        return lexeme if isinstance(lexeme, str) else bytes(lexeme).decode('ascii')
+
+    def slice(self, start, end):
+        """ Returns the tokens from index start to end (not included) as a new store over the same text. """
+        tokens = TokenStore.__new__(TokenStore)
+        tokens.text = self.text
+        tokens.kinds = self.kinds[start:end]
+        tokens.starts = self.starts[start:end]
+        tokens.ends = self.ends[start:end]
+        tokens.name_ids = None if self.name_ids is None else self.name_ids[start:end]
+        tokens.names = self.names
+        return tokens
+
+    @functools.cached_property
+    def line_index(self):
+        """ LineIndex of the text, built the first time a position is asked for. """
+        return LineIndex(self.text)
+
+    def position(self, index):
+        """ Returns (line, column) where the token at index starts. """
+        return self.line_index.line_column(self.starts[index])
+
+    def span(self, index):
+        """ Returns ((line, column), (line, column)) of the start and the end of the token at index. """
+        line_column = self.line_index.line_column
+        return line_column(self.starts[index]), line_column(self.ends[index])
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index):
+        """ Returns the token at index as a (token_type, token_value) tuple. """
+        return (TOKEN_NAMES[self.kinds[index]], self.lexeme(index))
+
+END_SEMICOLON = bytes((END, SEMICOLON))
+
+def split_blocks(kinds):
+    """
+    Finds the top-level let ... end ; blocks in an array of token kinds and returns their (start, end) token indexes.
+    Like Parser.prog, it stops at the first token that doesn't start a block,
+    and a block that never reaches 'end ;' runs to the end of the tokens (parsing it will report the error).
+    """
+    data = kinds.tobytes()
+    blocks = []
+    pos = 0
+    while pos < len(data) and data[pos] == LET:
+        end = data.find(END_SEMICOLON, pos)
+        end = len(data) if end < 0 else end + 2
+        blocks.append((pos, end))
+        pos = end
+    return blocks
+
+def native_buffer(text):
+    """
+    Returns (buffer, text_mode) to hand the text to the C extension, or None if only the Python code can lex it.
+    A str is only handed over when it is ASCII, so offsets are the same in the encoded bytes.
+    """
+    if not isinstance(text, str):
+        return text, False
+    if text.isascii():
+        return text.encode('ascii'), True
+    return None
+
+def native_tokens(text):
+    """ Tokenizes the text with the C extension into a TokenStore, or returns None if the Python scanner has to do it. """
+    native = native_buffer(text)
+    if native is None:
+        return None
+    arrays = _cparser.tokenize(*native)
+    if arrays is None:
+        return None # An invalid token, scan raises the error with its message
+    *arrays, names = arrays
+    tokens = TokenStore(text)
+    tokens.name_ids = array(tokens.starts.typecode)
+    for store, data in zip((tokens.kinds, tokens.starts, tokens.ends, tokens.name_ids), arrays):
+        store.frombytes(data)
+    tokens.names = names
+    return tokens
+
 class Lexer:
     """
         Lexical Analyzer Class that breaks the given input (read from the .tiny file) into a sequence of tokens (tokenizes the input)
         It uses multiple functions to tokenize the text.
+        The parser moves through the tokens with next_kind() and reads the text of the current token with value().
     """
-    def __init__(self, text):
+    scanner = staticmethod(scan) # How the text is cut into tokens, see DFALexer
+
+    def __init__(self, text, tokens=None):
         self.text = text
-        self.tokens = self.tokenize()
+        self.tokens = self.tokenize() if tokens is None else tokens # Already tokenized text can be passed in
+        self.kinds, self.starts, self.ends = self.tokens.kinds, self.tokens.starts, self.tokens.ends
+        self.name_ids, self.names = self.tokens.name_ids, self.tokens.names
+        self.is_text = isinstance(text, str)
         self.index = 0
     
     def tokenize(self):
         """ 
-        Converts the input into tokens using the items in the token types dictionary. 
-        """
-        tokens = []
-        while self.text:
-            self.text = self.text.lstrip()
-            for token_type, pattern in TOKEN_TYPES.items():
-                match = re.match(pattern, self.text)
-                if match:
-                    token_value = match.group(0)
-                    tokens.append((token_type, token_value))
-                    self.text = self.text[len(token_value):]
-                    break
-            else:
-                raise SyntaxError(f"Invalid token at: {self.text[:10]}")
+        Converts the input into tokens using the master pattern built from the token types dictionary.
+        The text is scanned once, so lexing is linear in the size of the input.
+        """
+        if _cparser is not None and self.scanner is scan:
+            tokens = native_tokens(self.text)
+            if tokens is not None:
+                return tokens
+
+        tokens = TokenStore(self.text)
+        kinds, starts, ends = tokens.kinds.append, tokens.starts.append, tokens.ends.append
+        try:
+            for kind, start, end in self.scanner(self.text):
+                kinds(kind)
+                starts(start)
+                ends(end)
+        except SyntaxError as error:
+            # Only on an error: give it the line and column of the invalid character
+            pos = skip_spaces(self.text, tokens.ends[-1] if len(tokens) else 0)
+            error.lineno, error.offset = tokens.line_index.line_column(pos)
+            raise
         
-        # print("Final token list:", tokens) # Checking if everything was done successfuly.
+        # print("Final token list:", list(tokens)) # Checking if everything was done successfuly.
         
         return tokens
 
+    def next_kind(self):
+        """
+        Moves to the next token and returns its kind (EOF at the end of the file).
+        """
+        index = self.index
+        self.index = index + 1
+        try:
+            return self.kinds[index]
+        except IndexError:
+            return EOF
+
+    def value(self):
+        """
+        Returns the text of the current token (the one returned by the last next_kind call).
+        When the C extension tokenized the text, an identifier is the same interned str at every occurrence,
+        so the symbol table finds it without hashing or comparing its characters again.
+        Only the C extension interns names (and finds keywords by a perfect hash): in the pure-Python path an ID is
+        sliced from the text, because calling sys.intern or numbering the names while tokenizing cost more than the
+        symbol table lookups saved. The master pattern already matches each keyword once and resolves it through a dict.
+        """
+        index = self.index - 1
+        if index < len(self.kinds):
+            if self.name_ids is not None:
+                name_id = self.name_ids[index]
+                if name_id >= 0:
+                    return self.names[name_id]
+            return self.text[self.starts[index]:self.ends[index]] if self.is_text else self.tokens.lexeme(index)
+        return '' # end of sentence/file
+
+    def position(self):
+        """
+        Returns (line, column) of the current token, or of the end of the text at EOF.
+        """
+        index = self.index - 1
+        if index < len(self.kinds):
+            return self.tokens.position(index)
+        return self.tokens.line_index.line_column(len(self.text))
+
     def get_next_token(self):
         """
-        Gets the next token in the text.
+        Gets the next token in the text as a (token_type, token_value) tuple.
         """
-        if self.index < len(self.tokens):
-            token = self.tokens[self.index]
-            
-            self.index += 1
-            return token
-        return ('EOF', '') # end of sentence/file
+        kind = self.next_kind()
+        return (TOKEN_NAMES[kind], self.value())
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        token = self.get_next_token()
+        if token[0] == 'EOF':
+            raise StopIteration
+        return token
+
+class DFALexer(Lexer):
+    """
+        Lexer that scans the text with the DFA tables (dfa_scan) instead of the master pattern.
+        Gives the same tokens and errors as Lexer.
+    """
+    scanner = staticmethod(dfa_scan)
+
+class BufferLexer(Lexer):
+    """
+        Lexer for programs held in any object with the buffer protocol (bytes, bytearray, memoryview, mmap, array...),
+        for embedders whose programs arrive in network buffers. The bytes are scanned in place through a memoryview,
+        so the program is never decoded or copied, only the IDs and numbers the parser reads are.
+        Each distinct identifier is decoded once and every later occurrence returns the same str (decoded, or the names
+        of the tokens when the C extension tokenized the buffer).
+        The buffer must not change while the program is parsed.
+    """
+    def __init__(self, buffer, tokens=None):
+        view = memoryview(buffer)
+        if view.format != 'B' or view.ndim != 1:
+            view = view.cast('B') # Offsets count bytes, whatever the items of the buffer are
+        self.decoded = {}
+        super().__init__(view, tokens)
+
+    def value(self):
+        index = self.index - 1
+        if index >= len(self.kinds) or self.name_ids is not None:
+            return super().value()
+        lexeme = bytes(self.text[self.starts[index]:self.ends[index]])
+        if self.kinds[index] != ID:
+            return lexeme.decode('ascii')
+        name = self.decoded.get(lexeme)
+        if name is None:
+            name = self.decoded[lexeme] = lexeme.decode('ascii')
+        return name
+
+class StreamingLexer(Lexer):
+    """
+        Lexer that reads the file in chunks and hands out tokens one at a time as the parser asks for them.
+        The full token list is never built, so memory does not grow with the size of the file.
+        Lexical errors show up while parsing, when the parser reaches the bad token.
+    """
+    def __init__(self, file, chunk_size=CHUNK_SIZE):
+        self.file = file
+        self.tokens = generate_tokens_from_chunks(read_chunks(file, chunk_size))
+        self.current = (EOF, '')
+
+    def next_kind(self):
+        self.current = next(self.tokens, (EOF, ''))
+        return self.current[0]
+
+    def value(self):
+        return self.current[1]
+
+class MappedLexer(Lexer):
+    """
+        Lexer that memory-maps the file (opened in binary mode) and scans the mapped bytes directly.
+        The file is never copied into a Python string, the OS pages it in as the lexer moves forward.
+        Tokens are produced lazily and only the ones the parser reads (ID, NUMBER) are decoded.
+    """
+    def __init__(self, file):
+        self.file = file
+        if os.fstat(file.fileno()).st_size == 0:
+            self.buffer = b'' # Empty files can't be mapped
+        else:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.tokens = scan(self.buffer)
+        self.current = (EOF, 0, 0)
+
+    def next_kind(self):
+        self.current = next(self.tokens, (EOF, 0, 0))
+        return self.current[0]
+
+    def value(self):
+        _, start, end = self.current
+        return self.buffer[start:end].decode('ascii')
+
+    def close(self):
+        """
+        Releases the mapping. The scanner of a scan that stopped before the end (after a syntax error)
+        still holds the buffer, so the scan is closed first.
+        """
+        self.tokens.close()
+        self.tokens = iter(())
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+# Token groups checked by the grammar rules
+ADD_OPS = frozenset((PLUS, MINUS))
+MULT_OPS = frozenset((TIMES, DIVIDE))
+TYPES = frozenset((INT, REAL))
+
+# Comparison operator of each <cond> token
+COMPARISONS = {
+    LESS: operator.lt,
+    LESSEQ: operator.le,
+    GREATER: operator.gt,
+    GREATEREQ: operator.ge,
+    EQUAL: operator.eq,
+    NOTEQ: operator.ne
+}
 
 class Parser:
     """
         Top Down Recursive Descent Parser Class
-        
+        Tokens are handled by their integer kind, the text of a token is only asked from the lexer for IDs and numbers.
     """
     def __init__(self, lexer):
         self.lexer = lexer
-        self.current_token = self.lexer.get_next_token()
+        self.next_kind = lexer.next_kind # Bound once, it runs for every token
+        self.current_kind = self.next_kind()
         self.symbol_table = {}
 
+    @property
+    def current_token(self):
+        """ The current token as a (token_type, token_value) tuple, for messages. """
+        return (TOKEN_NAMES[self.current_kind], self.lexer.value())
+
     def error(self, expected=None):
         """
         Function to raise an error
         """
         # print(f"Expected token: {expected}")
         # print(f"Current token: {self.current_token}")
+        expected = TOKEN_NAMES[expected] if expected is not None else None
         raise SyntaxError(f"Unexpected token {self.current_token}, expected {expected}")
 
-    def consume_token(self, token_type):
+    def consume_token(self, kind):
         """ Consumes the expected token. """
-        #print(f"Consuming: {self.current_token}, expected: {token_type}")
-        if self.current_token[0] == token_type:
-            self.current_token = self.lexer.get_next_token()
+        #print(f"Consuming: {self.current_token}, expected: {TOKEN_NAMES[kind]}")
+        if self.current_kind == kind:
+            self.current_kind = self.next_kind()
         else:
-            self.error(expected=token_type)
+            self.error(expected=kind)
     
     def prog(self):
         """
@@ -150,8 +778,8 @@ class Parser:
         """
         
         #print("Starting to parse the tiny document")
-        while self.current_token[0] == 'LET':
-            self.let_in_end()
+        while self.current_kind == LET:
+            print(self.let_in_end())
         #print("Parsing worked!")
 
     def let_in_end(self):
@@ -159,17 +787,17 @@ class Parser:
         Grammar rule:
         <let-in-end> ::= let <decl-list> in <type> ( <expr> ) end ;        
         """
-        self.consume_token('LET')
+        self.consume_token(LET)
         self.decl_list()
-        self.consume_token('IN')
+        self.consume_token(IN)
         var_type = self.type()
-        self.consume_token('LPAREN')
+        self.consume_token(LPAREN)
         result = self.expr()
-        self.consume_token('RPAREN')
-        self.consume_token('END')
-        self.consume_token('SEMICOLON')
+        self.consume_token(RPAREN)
+        self.consume_token(END)
+        self.consume_token(SEMICOLON)
         
-        print(result)
+        return result
 
     def decl_list(self):
         """
@@ -177,7 +805,7 @@ class Parser:
         <decl-list> ::= <decl> { <decl> }
         """
         self.decl()
-        while self.current_token[0] == 'ID':
+        while self.current_kind == ID:
             self.decl()
             
     def decl(self):
@@ -185,30 +813,30 @@ class Parser:
         Grammar rule:
         <decl> ::= id : <type> = <expr> ;
         """
-        var_name = self.current_token[1]
-        self.consume_token('ID')
-        self.consume_token('COLON')
+        var_name = self.lexer.value()
+        self.consume_token(ID)
+        self.consume_token(COLON)
 
-        if self.current_token[0] in ('INT', 'REAL'):
-            var_type = self.current_token[0]
+        if self.current_kind in TYPES:
+            var_type = self.current_kind
             self.consume_token(var_type)
         else:
             self.error()
 
-        self.consume_token('ASSIGN')
+        self.consume_token(ASSIGN)
         value = self.expr()
-        self.consume_token('SEMICOLON')
-        self.symbol_table[var_name] = (var_type, value)
+        self.consume_token(SEMICOLON)
+        self.symbol_table[var_name] = (TOKEN_NAMES[var_type], value)
     
     def type(self):
         """
         Grammar rule:
         <type> ::= int | real
         """
-        if self.current_token[0] in ('INT', 'REAL'):
-            type_val = self.current_token[0]
+        if self.current_kind in TYPES:
+            type_val = self.current_kind
             self.consume_token(type_val)
-            return type_val
+            return TOKEN_NAMES[type_val]
         else:
             self.error()
     
@@ -218,15 +846,15 @@ class Parser:
         Grammar rule:
         <expr> ::= <term> { + <term> | - <term> } | if <cond> then <expr> else <expr>
         """
-        if self.current_token[0] == 'IF':
+        if self.current_kind == IF:
             return self.if_expr()
         result = self.term()
-        while self.current_token[0] in ('PLUS', 'MINUS'):
-            op = self.current_token[0]
+        while self.current_kind in ADD_OPS:
+            op = self.current_kind
             self.consume_token(op)
             right = self.term()
             
-            if op == 'PLUS':
+            if op == PLUS:
                 result = result + right
             else:
                 result = result - right
@@ -238,11 +866,11 @@ class Parser:
         <term> ::= <factor> { * <factor> | / <factor> }
         """
         result = self.factor()
-        while self.current_token[0] in ('TIMES', 'DIVIDE'):
-            op = self.current_token[0]
+        while self.current_kind in MULT_OPS:
+            op = self.current_kind
             self.consume_token(op)
             right = self.factor()
-            result = result * right if op == 'TIMES' else result / right
+            result = result * right if op == TIMES else result / right
         return result
     
     def factor(self):
@@ -251,35 +879,35 @@ class Parser:
         Grammar rule:
         <factor> ::= ( <expr> ) | id | number | <type> ( id )
         """
-        token = self.current_token
+        kind = self.current_kind
 
-        # print(f"Current token: {token}")
+        # print(f"Current token: {self.current_token}")
         
-        if token[0] == 'LPAREN':
-            self.consume_token('LPAREN')
+        if kind == LPAREN:
+            self.consume_token(LPAREN)
             result = self.expr()
-            self.consume_token('RPAREN')
+            self.consume_token(RPAREN)
             return result
 
-        elif token[0] == 'ID':
-            var_name = token[1]
-            self.consume_token('ID')
+        elif kind == ID:
+            var_name = self.lexer.value()
+            self.consume_token(ID)
             if var_name in self.symbol_table:
                 return self.symbol_table[var_name][1]
             self.error()
 
-        elif token[0] == 'NUMBER':
-            self.consume_token('NUMBER')
-            return float(token[1]) if '.' in token[1] else int(token[1])
+        elif kind == NUMBER:
+            number = self.lexer.value()
+            self.consume_token(NUMBER)
+            return float(number) if '.' in number else int(number)
 
-        elif token[0] in ('INT', 'REAL'):
-            var_type = token[0]
-            self.consume_token(var_type)
-            self.consume_token('LPAREN')
+        elif kind in TYPES:
+            self.consume_token(kind)
+            self.consume_token(LPAREN)
             result = self.expr()
-            self.consume_token('RPAREN')
+            self.consume_token(RPAREN)
             
-            return float(result) if var_type == 'REAL' else int(result) # Applying type conversion
+            return float(result) if kind == REAL else int(result) # Applying type conversion
 
         else:
             self.error()
@@ -293,8 +921,8 @@ class Parser:
         """
         
         left = self.factor()
-        if self.current_token[0] in ('LESS', 'LESSEQ', 'GREATER', 'GREATEREQ', 'EQUAL', 'NOTEQ'):
-            op = self.current_token[0]
+        if self.current_kind in COMPARISONS:
+            op = self.current_kind
             self.consume_token(op)
             right = self.factor()
             return self.evaluate_condition(left, op, right)
@@ -302,55 +930,2537 @@ class Parser:
 
     def evaluate_condition(self, left, op, right):
         """ Evaluates conditional expressions. """
-        match op:
-            case 'LESS':
-                return left < right
-            case 'LESSEQ':
-                return left <= right
-            case 'GREATER':
-                return left > right
-            case 'GREATEREQ':
-                return left >= right
-            case 'EQUAL':
-                return left == right
-            case 'NOTEQ':
-                return left != right
-            case _:
-                raise ValueError(f"Invalid comparison operator: {op}")
+        if op not in COMPARISONS:
+            raise ValueError(f"Invalid comparison operator: {op}")
+        return COMPARISONS[op](left, right)
 
     def if_expr(self):
         """ Parses 'if-then-else' expressions. """
-        self.consume_token('IF')
+        self.consume_token(IF)
         condition = self.cond()
-        self.consume_token('THEN')
+        self.consume_token(THEN)
         true_expr = self.expr()
-        self.consume_token('ELSE')
+        self.consume_token(ELSE)
         false_expr = self.expr()
         return true_expr if condition else false_expr
 
 
 
-if __name__ == "__main__":
-    # Checking for correct usage
-    if len(sys.argv) < 2:
-        print("To use this parser, use the following form: parser_2814075.py input_file (e.g., sample.tiny)")
-        sys.exit(1)
-        
-    with open(sys.argv[1], 'r') as file:
-        text = file.read()
-    
-    # Lexical analysis
-    lexer = Lexer(text)
-    
-    #print(f"Lexical analysis done correctly")
-    
-    # Top down parser
-    parser = Parser(lexer)
-    try:
-        parser.prog()
-        #print(f"Parsing done correctly")
-    except Exception as e:
-        print(f"Error") # Here we could print the error but its not required in the project...
+'''
+This section defines the explicit stack expression engine.
+StackParser accepts the same language as Parser, but parses <expr>, <term>, <factor> and <cond> with a loop and a list
+of pending steps instead of recursive calls, so nesting depth is only limited by memory and each token costs the same.
+'''
+
+# Steps waiting on the stack for the value of a sub-expression
+(EXPR_FIRST, EXPR_REST, TERM_FIRST, TERM_REST, PAREN, CAST, COND_LEFT, COND_RIGHT, IF_TRUE, IF_FALSE) = range(10)
+
+# What the engine parses next
+PARSE_EXPR, PARSE_TERM, PARSE_FACTOR = range(3)
+
+class StackParser(Parser):
+    """
+        Parser whose expressions are parsed without recursion (the --stack engine).
+        Each step mirrors a line of the recursive methods, so values, the order they are computed in and errors are the same.
+    """
+    def expr(self):
+        """
+        Grammar rules:
+        <expr> ::= <term> { + <term> | - <term> } | if <cond> then <expr> else <expr>
+        <term> ::= <factor> { * <factor> | / <factor> }
+        <factor> ::= ( <expr> ) | id | number | <type> ( id )
+        <cond> ::= <oprnd> < <oprnd> | <oprnd> <= <oprnd> | ...
+
+        The stack holds (step, left value, operator) tuples. The engine goes down the rules until a factor gives a value,
+        then hands the value to the steps on the stack until one of them needs another sub-expression.
+        """
+        consume_token = self.consume_token
+        symbol_table = self.symbol_table
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        expr_first = (EXPR_FIRST, None, None)
+        term_first = (TERM_FIRST, None, None)
+        parse = PARSE_EXPR
+        while True:
+            # Go down to a factor
+            while True:
+                if parse == PARSE_EXPR:
+                    if self.current_kind == IF:
+                        consume_token(IF)
+                        push((COND_LEFT, None, None))
+                    else:
+                        push(expr_first)
+                        push(term_first)
+                elif parse == PARSE_TERM:
+                    push(term_first)
+                kind = self.current_kind
+                if kind == ID:
+                    var_name = self.lexer.value()
+                    consume_token(ID)
+                    if var_name in symbol_table:
+                        value = symbol_table[var_name][1]
+                        break
+                    self.error()
+                elif kind == NUMBER:
+                    number = self.lexer.value()
+                    consume_token(NUMBER)
+                    value = float(number) if '.' in number else int(number)
+                    break
+                elif kind == LPAREN:
+                    consume_token(LPAREN)
+                    push((PAREN, None, None))
+                    parse = PARSE_EXPR
+                elif kind in TYPES:
+                    consume_token(kind)
+                    consume_token(LPAREN)
+                    push((CAST, kind, None))
+                    parse = PARSE_EXPR
+                else:
+                    self.error()
+
+            # Hand the value back up until a step needs another sub-expression
+            while stack:
+                step, left, op = pop()
+                if step == TERM_REST:
+                    value = left * value if op == TIMES else left / value
+                    step = TERM_FIRST
+                elif step == EXPR_REST:
+                    value = left + value if op == PLUS else left - value
+                    step = EXPR_FIRST
+
+                if step == TERM_FIRST:
+                    if self.current_kind in MULT_OPS:
+                        op = self.current_kind
+                        consume_token(op)
+                        push((TERM_REST, value, op))
+                        parse = PARSE_FACTOR
+                        break
+                elif step == EXPR_FIRST:
+                    if self.current_kind in ADD_OPS:
+                        op = self.current_kind
+                        consume_token(op)
+                        push((EXPR_REST, value, op))
+                        parse = PARSE_TERM
+                        break
+                elif step == PAREN:
+                    consume_token(RPAREN)
+                elif step == CAST:
+                    consume_token(RPAREN)
+                    value = float(value) if left == REAL else int(value) # Applying type conversion
+                elif step == COND_LEFT:
+                    if self.current_kind in COMPARISONS:
+                        op = self.current_kind
+                        consume_token(op)
+                        push((COND_RIGHT, value, op))
+                        parse = PARSE_FACTOR
+                        break
+                    self.error()
+                elif step == COND_RIGHT:
+                    condition = self.evaluate_condition(left, op, value)
+                    consume_token(THEN)
+                    push((IF_TRUE, condition, None))
+                    parse = PARSE_EXPR
+                    break
+                elif step == IF_TRUE:
+                    consume_token(ELSE)
+                    push((IF_FALSE, left, value))
+                    parse = PARSE_EXPR
+                    break
+                else: # IF_FALSE, the true value was kept in place of the operator
+                    value = op if left else value
+            else:
+                return value
+
+
+
+'''
+This section defines the table-driven LL(1) engine.
+The grammar is written once as data in LL1_GRAMMAR. When the module loads, its FIRST and FOLLOW sets are computed
+and so is a parse table indexed by [nonterminal][token kind]. LL1Parser runs that table in one loop over an explicit
+stack of symbols. Symbols starting with @ are semantic actions. An action runs when it comes off the stack and computes
+the same values as the methods of Parser, using a second stack for the values.
+'''
+
+# The rules of the CFG above, with each { } repetition written as a -rest rule that ends in the empty production ().
+# <oprnd> is a <factor> because Parser.cond reads its operands with factor(). A cast takes any <expr>, as Parser.factor does.
+# Some terminals put something on the value stack: ID its name, NUMBER its text, and int, real and the comparisons their kind.
+LL1_GRAMMAR = {
+    '<prog>': [('<let-in-end>', '<prog>'), ()],
+    '<let-in-end>': [('LET', '<decl-list>', 'IN', '<type>', 'LPAREN', '<expr>', 'RPAREN', 'END', 'SEMICOLON', '@print')],
+    '<decl-list>': [('<decl>', '<decl-list-rest>')],
+    '<decl-list-rest>': [('<decl>', '<decl-list-rest>'), ()],
+    '<decl>': [('ID', 'COLON', '<type>', 'ASSIGN', '<expr>', 'SEMICOLON', '@declare')],
+    '<type>': [('INT',), ('REAL',)],
+    '<expr>': [('<term>', '<expr-rest>'), ('<if-expr>',)],
+    '<expr-rest>': [('PLUS', '<term>', '@add', '<expr-rest>'), ('MINUS', '<term>', '@subtract', '<expr-rest>'), ()],
+    '<term>': [('<factor>', '<term-rest>')],
+    '<term-rest>': [('TIMES', '<factor>', '@multiply', '<term-rest>'), ('DIVIDE', '<factor>', '@divide', '<term-rest>'), ()],
+    '<factor>': [('LPAREN', '<expr>', 'RPAREN'), ('ID', '@lookup'), ('NUMBER', '@number'),
+                 ('<type>', 'LPAREN', '<expr>', 'RPAREN', '@cast')],
+    '<if-expr>': [('IF', '<cond>', 'THEN', '<expr>', 'ELSE', '<expr>', '@select')],
+    '<cond>': [('<oprnd>', '<comparison>', '<oprnd>', '@compare')],
+    '<comparison>': [(TOKEN_NAMES[kind],) for kind in COMPARISONS],
+    '<oprnd>': [('<factor>',)]
+}
+LL1_START = '<prog>'
+
+# Semantic actions, the loop of LL1Parser.prog runs them by code
+LL1_ACTIONS = ('@lookup', '@number', '@add', '@subtract', '@multiply', '@divide', '@cast', '@compare', '@select',
+               '@declare', '@print')
+
+# Symbol codes: terminals are token kinds, then come the nonterminals and then the actions
+LL1_NONTERMINALS = list(LL1_GRAMMAR)
+LL1_NONTERMINAL_BASE = len(TOKEN_NAMES)
+LL1_ACTION_BASE = LL1_NONTERMINAL_BASE + len(LL1_NONTERMINALS)
+(DO_LOOKUP, DO_NUMBER, DO_ADD, DO_SUBTRACT, DO_MULTIPLY, DO_DIVIDE, DO_CAST, DO_COMPARE, DO_SELECT,
+ DO_DECLARE, DO_PRINT) = range(LL1_ACTION_BASE, LL1_ACTION_BASE + len(LL1_ACTIONS))
+
+# What a terminal puts on the value stack, by token kind
+PUSH_NOTHING, PUSH_TEXT, PUSH_KIND = range(3)
+LL1_PUSH = tuple(PUSH_TEXT if kind in (ID, NUMBER) else PUSH_KIND if kind in TYPES or kind in COMPARISONS
+                 else PUSH_NOTHING for kind in range(len(TOKEN_NAMES)))
+
+def sequence_first(symbols, first, nullable):
+    """ Returns the FIRST set of a sequence of symbols, and whether the whole sequence can be empty. Actions are skipped. """
+    result = set()
+    for symbol in symbols:
+        if symbol.startswith('@'):
+            continue
+        if symbol not in first: # A terminal
+            result.add(symbol)
+            return result, False
+        result |= first[symbol]
+        if symbol not in nullable:
+            return result, False
+    return result, True
+
+def first_follow(grammar, start):
+    """
+    Computes the FIRST and FOLLOW sets of the nonterminals of grammar (nonterminal -> list of productions).
+    Returns (first, nullable, follow). first and follow map each nonterminal to a set of token names.
+    nullable is the set of nonterminals that can be empty.
+    """
+    first = {nonterminal: set() for nonterminal in grammar}
+    nullable = set()
+    changed = True
+    while changed:
+        changed = False
+        for nonterminal, productions in grammar.items():
+            for production in productions:
+                symbols, empty = sequence_first(production, first, nullable)
+                if not symbols <= first[nonterminal] or (empty and nonterminal not in nullable):
+                    first[nonterminal] |= symbols
+                    if empty:
+                        nullable.add(nonterminal)
+                    changed = True
+
+    follow = {nonterminal: set() for nonterminal in grammar}
+    follow[start].add('EOF')
+    changed = True
+    while changed:
+        changed = False
+        for nonterminal, productions in grammar.items():
+            for production in productions:
+                for index, symbol in enumerate(production):
+                    if symbol not in grammar:
+                        continue
+                    symbols, empty = sequence_first(production[index + 1:], first, nullable)
+                    if empty:
+                        symbols |= follow[nonterminal]
+                    if not symbols <= follow[symbol]:
+                        follow[symbol] |= symbols
+                        changed = True
+    return first, nullable, follow
+
+def symbol_code(symbol):
+    """ Integer code of a grammar symbol, see LL1_NONTERMINAL_BASE. """
+    if symbol in TOKEN_CODES:
+        return TOKEN_CODES[symbol]
+    if symbol in LL1_GRAMMAR:
+        return LL1_NONTERMINAL_BASE + LL1_NONTERMINALS.index(symbol)
+    if symbol in LL1_ACTIONS:
+        return LL1_ACTION_BASE + LL1_ACTIONS.index(symbol)
+    raise ValueError(f"Unknown grammar symbol: {symbol}")
+
+def build_ll1_table(grammar, start):
+    """
+    Fills the parse table of grammar, raises ValueError if two productions of a nonterminal start with the same token.
+    Returns (table, expected):
+    - table[nonterminal code - LL1_NONTERMINAL_BASE][token kind] is the production to expand as a tuple of symbol codes,
+      reversed so it can extend the stack, or None for a syntax error
+    - expected[nonterminal code - LL1_NONTERMINAL_BASE] is the token named in the error message, only given when the
+      nonterminal has a single first token (as Parser.consume_token does for decl), otherwise None
+    A nonterminal that can be empty takes its empty production on every other token, like the { } loops of Parser,
+    so a wrong token is reported by the terminal that comes next, with the same message as Parser.
+    """
+    first, nullable, follow = first_follow(grammar, start)
+    table = []
+    expected = []
+    for nonterminal, productions in grammar.items():
+        row = [None] * len(TOKEN_NAMES)
+        empty_production = None
+        for production in productions:
+            codes = tuple(symbol_code(symbol) for symbol in reversed(production))
+            symbols, empty = sequence_first(production, first, nullable)
+            if empty:
+                symbols |= follow[nonterminal]
+                empty_production = codes
+            for token_type in symbols:
+                kind = TOKEN_CODES[token_type]
+                if row[kind] is not None and row[kind] != codes:
+                    raise ValueError(f"{nonterminal} is not LL(1): two productions start with {token_type}")
+                row[kind] = codes
+        if empty_production is not None:
+            row = [empty_production if codes is None else codes for codes in row]
+        table.append(row)
+        expected.append(TOKEN_CODES[next(iter(first[nonterminal]))] if len(first[nonterminal]) == 1 else None)
+    return inline_leading(table), expected
+
+def inline_leading(table):
+    """
+    Expands the nonterminals that start a production ahead of time, for the same token: <expr> on NUMBER becomes
+    NUMBER @number <term-rest> <expr-rest> instead of going through <term> and <factor> while parsing.
+    The parser does the same expansions in the same order, it just does them once here instead of at every token.
+    A nonterminal with no entry for the token is kept, so its error is raised while parsing.
+    """
+    inlined = []
+    for row in table:
+        new_row = []
+        for kind, production in enumerate(row):
+            while production and LL1_NONTERMINAL_BASE <= production[-1] < LL1_ACTION_BASE:
+                leading = table[production[-1] - LL1_NONTERMINAL_BASE][kind]
+                if leading is None:
+                    break
+                production = production[:-1] + leading
+            new_row.append(production)
+        inlined.append(new_row)
+    return inlined
+
+LL1_FIRST, LL1_NULLABLE, LL1_FOLLOW = first_follow(LL1_GRAMMAR, LL1_START)
+LL1_TABLE, LL1_EXPECTED = build_ll1_table(LL1_GRAMMAR, LL1_START)
+
+class LL1Parser(Parser):
+    """
+        Parser driven by LL1_TABLE instead of one method per rule (the --ll1 engine).
+        It prints the same values as Parser and raises the same errors at the same tokens.
+        Nesting depth is only limited by memory.
+    """
+    def prog(self):
+        """
+        Grammar rule:
+        <prog> ::= <let-in-end> { <let-in-end> }
+
+        Parses and evaluates the whole program, printing the value of each block.
+        The symbol stack holds what is left to match, topmost last. A nonterminal is replaced by the production
+        the table gives for the current token, a terminal must match it, and an action works on the value stack.
+        """
+        table = LL1_TABLE
+        expected = LL1_EXPECTED
+        pushes = LL1_PUSH
+        nonterminal_base = LL1_NONTERMINAL_BASE
+        action_base = LL1_ACTION_BASE
+        next_kind = self.next_kind
+        text = self.lexer.value
+        symbol_table = self.symbol_table
+        stack = [symbol_code(LL1_START)]
+        pop = stack.pop
+        expand = stack.extend
+        values = []
+        keep = values.append
+        take = values.pop
+        kind = self.current_kind
+        while stack:
+            symbol = pop()
+            if symbol < nonterminal_base:
+                if kind != symbol:
+                    self.current_kind = kind
+                    self.error(expected=symbol)
+                push = pushes[kind]
+                if push == PUSH_TEXT:
+                    keep(text())
+                elif push == PUSH_KIND:
+                    keep(kind)
+                kind = next_kind()
+            elif symbol < action_base:
+                production = table[symbol - nonterminal_base][kind]
+                if production is None:
+                    self.current_kind = kind
+                    self.error(expected[symbol - nonterminal_base])
+                expand(production)
+            elif symbol == DO_LOOKUP:
+                var_name = values[-1]
+                if var_name not in symbol_table:
+                    self.current_kind = kind
+                    self.error()
+                values[-1] = symbol_table[var_name][1]
+            elif symbol == DO_NUMBER:
+                number = values[-1]
+                values[-1] = float(number) if '.' in number else int(number)
+            elif symbol <= DO_DIVIDE:
+                right = take()
+                left = values[-1]
+                if symbol == DO_ADD:
+                    values[-1] = left + right
+                elif symbol == DO_SUBTRACT:
+                    values[-1] = left - right
+                elif symbol == DO_MULTIPLY:
+                    values[-1] = left * right
+                else:
+                    values[-1] = left / right
+            elif symbol == DO_CAST:
+                result = take()
+                values[-1] = float(result) if values[-1] == REAL else int(result) # Applying type conversion
+            elif symbol == DO_COMPARE:
+                right = take()
+                op = take()
+                values[-1] = self.evaluate_condition(values[-1], op, right)
+            elif symbol == DO_SELECT:
+                false_expr = take()
+                true_expr = take()
+                values[-1] = true_expr if values[-1] else false_expr
+            elif symbol == DO_DECLARE:
+                value = take()
+                var_type = take()
+                symbol_table[take()] = (TOKEN_NAMES[var_type], value)
+            else: # DO_PRINT, the value of the block is on top of its type
+                print(take())
+                take()
+        self.current_kind = kind
+
+
+
+'''
+This section defines the syntax tree mode.
+TreeBuilder parses the same grammar as Parser but returns a tree of nodes instead of values (like ExpressionTreeBuilder in the book example),
+and Evaluator computes the values from the tree, so a program can be parsed once and evaluated many times.
+'''
+
+# Arithmetic operator of each <expr>/<term> token
+ARITHMETIC = {
+    PLUS: operator.add,
+    MINUS: operator.sub,
+    TIMES: operator.mul,
+    DIVIDE: operator.truediv
+}
+
+class Node:
+    """
+        Base class of the syntax tree nodes.
+        Every node lists its fields in __slots__, so nodes are small and have no __dict__.
+    """
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for field, value in zip(self.__slots__, values):
+            setattr(self, field, value)
+
+    def __repr__(self):
+        fields = ', '.join(repr(getattr(self, field)) for field in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+class Program(Node):
+    """ <prog> """
+    __slots__ = ('blocks',)
+
+class LetInEnd(Node):
+    """ <let-in-end>, var_type is INT or REAL """
+    __slots__ = ('decls', 'var_type', 'expr')
+
+class Decl(Node):
+    """ <decl> """
+    __slots__ = ('name', 'var_type', 'expr')
+
+class Number(Node):
+    """ number, value is already converted to int or float """
+    __slots__ = ('value',)
+
+class Var(Node):
+    """ id """
+    __slots__ = ('name',)
+
+class BinOp(Node):
+    """ <expr>/<term> operation, op is PLUS, MINUS, TIMES or DIVIDE """
+    __slots__ = ('op', 'left', 'right')
+
+class Cast(Node):
+    """ <type> ( <expr> ) """
+    __slots__ = ('var_type', 'expr')
+
+class Cond(Node):
+    """ <cond>, op is one of the COMPARISONS tokens """
+    __slots__ = ('op', 'left', 'right')
+
+class IfExpr(Node):
+    """ if <cond> then <expr> else <expr> """
+    __slots__ = ('cond', 'true_expr', 'false_expr')
+
+class Shared(Node):
+    """ Subexpression that appears more than once in a statement, its value is kept in slot (made by Optimizer) """
+    __slots__ = ('slot', 'expr')
+
+class Reuse(Node):
+    """ Later occurrence of a Shared subexpression, its value is taken from slot """
+    __slots__ = ('slot',)
+
+class TreeBuilder(Parser):
+    """
+        Parser that builds the syntax tree instead of computing values.
+        Declared names are still tracked, so an undefined id is reported at the same token as in Parser.
+    """
+    def __init__(self, lexer):
+        super().__init__(lexer)
+        self.blocks = [] # Blocks parsed so far, kept if parsing stops on an error
+        self.block_start = 0 # Index of the let token of the block being built
+
+    def node(self, node_type, *fields):
+        """ Creates an expression node. """
+        return node_type(*fields)
+
+    def prog(self):
+        """
+        <prog> ::= <let-in-end> { <let-in-end> }
+        """
+        while self.current_kind == LET:
+            self.block_start = self.lexer.index - 1
+            self.blocks.append(self.let_in_end())
+        return Program(self.blocks)
+
+    def first_error(self, error, symbol_table, parser_class=None):
+        """
+        Returns the error Parser.prog stops on in the block that failed to build with error.
+        Parser computes the values while it parses, so a value of that block that raises (a division by zero...)
+        before the syntax error comes first. The block is parsed again with parser_class (Parser by default) over
+        symbol_table, the symbol table after evaluating the blocks before it.
+        Lexers without a token store (StreamingLexer, MappedLexer) can't go back, the error is returned as it is.
+        """
+        tokens = getattr(self.lexer, 'tokens', None)
+        if not isinstance(error, SyntaxError) or not isinstance(tokens, TokenStore):
+            return error
+        parser = (parser_class or Parser)(Lexer(self.lexer.text, tokens.slice(self.block_start, len(tokens))))
+        parser.symbol_table = dict(symbol_table)
+        try:
+            parser.let_in_end()
+        except Exception as e:
+            return e
+        return error
+
+    def let_in_end(self):
+        """
+        <let-in-end> ::= let <decl-list> in <type> ( <expr> ) end ;
+        """
+        self.consume_token(LET)
+        decls = self.decl_list()
+        self.consume_token(IN)
+        var_type = TOKEN_CODES[self.type()]
+        self.consume_token(LPAREN)
+        tree = self.expr()
+        self.consume_token(RPAREN)
+        self.consume_token(END)
+        self.consume_token(SEMICOLON)
+        return LetInEnd(decls, var_type, tree)
+
+    def decl_list(self):
+        """
+        <decl-list> ::= <decl> { <decl> }
+        """
+        decls = [self.decl()]
+        while self.current_kind == ID:
+            decls.append(self.decl())
+        return decls
+
+    def decl(self):
+        """
+        <decl> ::= id : <type> = <expr> ;
+        """
+        var_name = self.lexer.value()
+        self.consume_token(ID)
+        self.consume_token(COLON)
+        var_type = TOKEN_CODES[self.type()]
+        self.consume_token(ASSIGN)
+        tree = self.expr()
+        self.consume_token(SEMICOLON)
+        self.symbol_table[var_name] = TOKEN_NAMES[var_type] # Only the name matters while building
+        return Decl(var_name, var_type, tree)
+
+    def expr(self):
+        """
+        <expr> ::= <term> { + <term> | - <term> } | if <cond> then <expr> else <expr>
+        """
+        if self.current_kind == IF:
+            return self.if_expr()
+        tree = self.term()
+        while self.current_kind in ADD_OPS:
+            op = self.current_kind
+            self.consume_token(op)
+            tree = self.node(BinOp, op, tree, self.term())
+        return tree
+
+    def term(self):
+        """
+        <term> ::= <factor> { * <factor> | / <factor> }
+        """
+        tree = self.factor()
+        while self.current_kind in MULT_OPS:
+            op = self.current_kind
+            self.consume_token(op)
+            tree = self.node(BinOp, op, tree, self.factor())
+        return tree
+
+    def factor(self):
+        """
+        <factor> ::= ( <expr> ) | id | number | <type> ( id )
+        """
+        kind = self.current_kind
+        if kind == LPAREN:
+            self.consume_token(LPAREN)
+            tree = self.expr()
+            self.consume_token(RPAREN)
+            return tree
+        elif kind == ID:
+            var_name = self.lexer.value()
+            self.consume_token(ID)
+            if var_name in self.symbol_table:
+                return self.node(Var, var_name)
+            self.error()
+        elif kind == NUMBER:
+            number = self.lexer.value()
+            self.consume_token(NUMBER)
+            return self.node(Number, float(number) if '.' in number else int(number))
+        elif kind in TYPES:
+            self.consume_token(kind)
+            self.consume_token(LPAREN)
+            tree = self.expr()
+            self.consume_token(RPAREN)
+            return self.node(Cast, kind, tree)
+        else:
+            self.error()
+
+    def cond(self):
+        """
+        <cond> ::= <oprnd> < <oprnd> | ... | <oprnd> <> <oprnd>
+        """
+        left = self.factor()
+        if self.current_kind in COMPARISONS:
+            op = self.current_kind
+            self.consume_token(op)
+            return self.node(Cond, op, left, self.factor())
+        self.error()
+
+    def if_expr(self):
+        """ if <cond> then <expr> else <expr> """
+        self.consume_token(IF)
+        condition = self.cond()
+        self.consume_token(THEN)
+        true_expr = self.expr()
+        self.consume_token(ELSE)
+        false_expr = self.expr()
+        return self.node(IfExpr, condition, true_expr, false_expr)
+
+class SharingTreeBuilder(TreeBuilder):
+    """
+        TreeBuilder that returns the same node object for expressions with the same structure (hash-consing),
+        so a subtree repeated many times in the program is stored once and the tree becomes a DAG.
+        Children are already shared when their parent is created, so comparing them by identity is enough.
+    """
+    def __init__(self, lexer):
+        super().__init__(lexer)
+        self.nodes = {}
+
+    def node(self, node_type, *fields):
+        # Number keeps the type of its value in the key, 1 and 1.0 are different numbers
+        key = (node_type, type(fields[0])) + fields if node_type is Number else (node_type,) + fields
+        node = self.nodes.get(key)
+        if node is None:
+            node = self.nodes[key] = node_type(*fields)
+        return node
+
+class Evaluator:
+    """
+        Computes the values of a syntax tree the same way Parser computes them while parsing.
+        The symbol table is kept between blocks (and between calls), like Parser.symbol_table.
+        Both branches of an if are evaluated, as in Parser.if_expr, so an error in either branch is still raised.
+    """
+    def __init__(self):
+        self.symbol_table = {}
+        self.dispatch = {
+            Number: self.number,
+            Var: self.var,
+            BinOp: self.bin_op,
+            Cast: self.cast,
+            IfExpr: self.if_expr,
+            Cond: self.cond,
+            Shared: self.shared,
+            Reuse: self.reuse
+        }
+        self.values = {} # Values of the Shared subexpressions, by slot
+
+    def prog(self, program):
+        """ Evaluates every block and prints its result, like Parser.prog. """
+        for block in program.blocks:
+            print(self.let_in_end(block))
+
+    def let_in_end(self, block):
+        """ Evaluates the declarations of a block and returns the value of its expression. """
+        for decl in block.decls:
+            self.decl(decl)
+        return self.expr(block.expr)
+
+    def decl(self, decl):
+        self.symbol_table[decl.name] = (TOKEN_NAMES[decl.var_type], self.expr(decl.expr))
+
+    def expr(self, node):
+        """ Evaluates any expression node. """
+        return self.dispatch[type(node)](node)
+
+    def number(self, node):
+        return node.value
+
+    def var(self, node):
+        try:
+            return self.symbol_table[node.name][1]
+        except KeyError:
+            raise SyntaxError(f"Undefined variable {node.name}") from None
+
+    def bin_op(self, node):
+        return ARITHMETIC[node.op](self.expr(node.left), self.expr(node.right))
+
+    def cast(self, node):
+        result = self.expr(node.expr)
+        return float(result) if node.var_type == REAL else int(result) # Applying type conversion
+
+    def cond(self, node):
+        return COMPARISONS[node.op](self.expr(node.left), self.expr(node.right))
+
+    def if_expr(self, node):
+        condition = self.cond(node.cond)
+        true_expr = self.expr(node.true_expr)
+        false_expr = self.expr(node.false_expr)
+        return true_expr if condition else false_expr
+
+    def shared(self, node):
+        value = self.values[node.slot] = self.expr(node.expr)
+        return value
+
+    def reuse(self, node):
+        return self.values[node.slot]
+
+# Smallest subtree (in nodes) worth memoizing, a lookup costs more than evaluating a few nodes
+MEMO_MIN_NODES = 5
+MEMO_MAX_ENTRIES = 100000
+
+def same_value(old, new):
+    """ True if two values are exactly the same value (1 is not 1.0, -0.0 is not 0.0). """
+    if type(old) is not type(new):
+        return False
+    return old.hex() == new.hex() if type(new) is float else old == new
+
+class MemoizingEvaluator(Evaluator):
+    """
+        Evaluator that remembers the values of subexpressions, across blocks as well.
+        Every subtree gets a shape number (structurally equal subtrees get the same number) and its value is stored under
+        (shape, versions of the variables it reads). A declaration only bumps the version of its variable when the value
+        actually changes, so a stored value is reused until one of the variables it depends on gets a different value.
+        The memo keeps at most max_entries values and drops the least recently used one first.
+        Works on any tree, but trees from SharingTreeBuilder are analyzed once per distinct subtree instead of once per node.
+    """
+    def __init__(self, max_entries=MEMO_MAX_ENTRIES, min_nodes=MEMO_MIN_NODES):
+        super().__init__()
+        self.max_entries = max_entries
+        self.min_nodes = min_nodes
+        self.memo = collections.OrderedDict()
+        self.versions = {}
+        self.shapes = {}      # structure of a subtree -> shape number
+        self.node_info = {}   # node -> (shape, names read, size)
+        self.hits = 0
+        self.misses = 0
+
+    def decl(self, decl):
+        old = self.symbol_table.get(decl.name)
+        super().decl(decl)
+        new = self.symbol_table[decl.name]
+        if old is None or old[0] != new[0] or not same_value(old[1], new[1]):
+            self.versions[decl.name] = self.versions.get(decl.name, 0) + 1
+
+    def analyze(self, node):
+        """
+        Computes (shape, names read, size) of node and of the subtrees not analyzed yet.
+        """
+        info = self.node_info.get(node)
+        if info is not None:
+            return info
+        kind = type(node)
+        if kind is Number:
+            structure, reads, size = (kind, type(node.value), node.value), (), 1
+        elif kind is Var:
+            structure, reads, size = (kind, node.name), (node.name,), 1
+        else:
+            if kind is Cast:
+                children = (node.expr,)
+                label = node.var_type
+            elif kind is IfExpr:
+                children = (node.cond, node.true_expr, node.false_expr)
+                label = None
+            else:
+                children = (node.left, node.right)
+                label = node.op
+            structure = (kind, label)
+            names = set()
+            size = 1
+            for child in children:
+                shape, reads, child_size = self.analyze(child)
+                structure += (shape,)
+                names.update(reads)
+                size += child_size
+            reads = tuple(sorted(names))
+        shape = self.shapes.setdefault(structure, len(self.shapes))
+        info = self.node_info[node] = (shape, reads, size)
+        return info
+
+    def expr(self, node):
+        info = self.node_info.get(node)
+        if info is None:
+            info = self.analyze(node)
+        shape, reads, size = info
+        if size < self.min_nodes:
+            return self.dispatch[type(node)](node)
+        versions = self.versions
+        key = (shape, tuple([versions.get(name, 0) for name in reads]))
+        memo = self.memo
+        if key in memo:
+            self.hits += 1
+            memo.move_to_end(key)
+            return memo[key]
+        self.misses += 1
+        result = self.dispatch[type(node)](node)
+        memo[key] = result
+        if len(memo) > self.max_entries:
+            memo.popitem(last=False)
+        return result
+
+    def stats(self):
+        """ Returns the memo counters as a dictionary. """
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.memo)}
+
+def run_tree(lexer, evaluator=None, optimized=False):
+    """
+    Builds the tree of the whole program and then evaluates it (the --ast mode).
+    If parsing stops on an error, the blocks before it are still evaluated first,
+    so the output is the same as Parser.prog printing results while it parses.
+    optimized=True runs the Optimizer on the tree before evaluating it (--optimize).
+    A ScopedEvaluator gets the tree of ScopedTreeBuilder (--ast --scoped).
+    """
+    memo = isinstance(evaluator, MemoizingEvaluator)
+    if memo:
+        builder = SharingTreeBuilder(lexer)
+    elif isinstance(evaluator, ScopedEvaluator):
+        builder = ScopedTreeBuilder(lexer)
+    else:
+        builder = TreeBuilder(lexer)
+    evaluator = evaluator or Evaluator()
+    error = None
+    try:
+        builder.prog()
+    except SyntaxError as e:
+        error = e
+    finally:
+        program = Program(builder.blocks)
+        if optimized:
+            program = optimize(program, share=not memo, keep=error is not None)
+        evaluator.prog(program)
+    if error is not None:
+        scoped = isinstance(builder, ScopedTreeBuilder)
+        raise builder.first_error(error, evaluator.symbol_table, ScopedParser if scoped else None)
+
+
+
+'''
+This section defines the scoped mode (--scoped), where every let-in-end block has its own frame of variables.
+The frame is released at end ; so a name is only visible in the block that declares it, and memory stays the size of
+the largest block however many blocks the program has. Names are resolved to slots (0, 1, ...) of the frame while parsing.
+Programs that read names declared by earlier blocks get an undefined variable error in this mode.
+'''
+
+class ScopedParser(Parser):
+    """
+        Parser with a frame per let-in-end block instead of the flat symbol_table (which stays empty).
+        slots gives the slot of each name declared so far in the current block, in order of first declaration,
+        and frame holds the values by slot. Both are dropped at the end of the block.
+    """
+    def __init__(self, lexer):
+        super().__init__(lexer)
+        self.slots = {}
+        self.frame = []
+
+    def let_in_end(self):
+        """
+        <let-in-end> ::= let <decl-list> in <type> ( <expr> ) end ;
+        Opens the frame of the block, it is released when the block ends (or fails).
+        """
+        self.slots = {}
+        self.frame = []
+        try:
+            return super().let_in_end()
+        finally:
+            self.slots = {}
+            self.frame = []
+
+    def decl(self):
+        """
+        <decl> ::= id : <type> = <expr> ;
+        A name declared again in the same block keeps its slot.
+        """
+        var_name = self.lexer.value()
+        self.consume_token(ID)
+        self.consume_token(COLON)
+
+        if self.current_kind in TYPES:
+            var_type = self.current_kind
+            self.consume_token(var_type)
+        else:
+            self.error()
+
+        self.consume_token(ASSIGN)
+        value = self.expr()
+        self.consume_token(SEMICOLON)
+        slot = self.slots.get(var_name)
+        if slot is None:
+            self.slots[var_name] = len(self.frame)
+            self.frame.append(value)
+        else:
+            self.frame[slot] = value
+
+    def factor(self):
+        """
+        <factor> ::= ( <expr> ) | id | number | <type> ( id )
+        Only id changes: its value comes from the frame of the block.
+        """
+        if self.current_kind != ID:
+            return super().factor()
+        var_name = self.lexer.value()
+        self.consume_token(ID)
+        slot = self.slots.get(var_name)
+        if slot is not None:
+            return self.frame[slot]
+        self.error()
+
+class Local(Node):
+    """ id resolved to a slot of its block's frame (made by ScopedTreeBuilder) """
+    __slots__ = ('slot', 'name')
+
+class LocalDecl(Node):
+    """ <decl> that stores its value into a slot of its block's frame """
+    __slots__ = ('slot', 'name', 'var_type', 'expr')
+
+class ScopedTreeBuilder(TreeBuilder):
+    """
+        TreeBuilder for the scoped mode: ids become Local nodes and declarations LocalDecl nodes, both with the slot of the name
+        in the block's frame, so evaluating the tree looks values up by index instead of by name.
+        A block has at most one slot per declaration, ScopedEvaluator sizes its frames with len(block.decls).
+    """
+    def __init__(self, lexer):
+        super().__init__(lexer)
+        self.slots = {}
+
+    def let_in_end(self):
+        self.slots = {}
+        try:
+            return super().let_in_end()
+        finally:
+            self.slots = {}
+
+    def decl(self):
+        """
+        <decl> ::= id : <type> = <expr> ;
+        """
+        var_name = self.lexer.value()
+        self.consume_token(ID)
+        self.consume_token(COLON)
+        var_type = TOKEN_CODES[self.type()]
+        self.consume_token(ASSIGN)
+        tree = self.expr()
+        self.consume_token(SEMICOLON)
+        slot = self.slots.setdefault(var_name, len(self.slots))
+        return LocalDecl(slot, var_name, var_type, tree)
+
+    def factor(self):
+        """
+        <factor> ::= ( <expr> ) | id | number | <type> ( id )
+        """
+        if self.current_kind != ID:
+            return super().factor()
+        var_name = self.lexer.value()
+        self.consume_token(ID)
+        slot = self.slots.get(var_name)
+        if slot is not None:
+            return self.node(Local, slot, var_name)
+        self.error()
+
+class ScopedEvaluator(Evaluator):
+    """
+        Evaluates the trees of ScopedTreeBuilder, each block in a new frame (a list indexed by slot).
+        symbol_table stays empty.
+    """
+    def __init__(self):
+        super().__init__()
+        self.dispatch[Local] = self.local
+        self.frame = []
+
+    def let_in_end(self, block):
+        """ Evaluates a block in its own frame and returns the value of its expression. """
+        self.frame = [None] * len(block.decls)
+        try:
+            for decl in block.decls:
+                self.frame[decl.slot] = self.expr(decl.expr)
+            return self.expr(block.expr)
+        finally:
+            self.frame = []
+
+    def local(self, node):
+        return self.frame[node.slot]
+
+def run_scoped(lexer):
+    """ Parses and evaluates the program with ScopedParser, printing the result of each block. """
+    ScopedParser(lexer).prog()
+
+
+
+'''
+This section compiles let-in-end blocks of the syntax tree into Python functions.
+A compiled block can be run many times (with different declaration values) without lexing, parsing or walking the tree again.
+'''
+
+# Python operator written for each token in the generated source
+PYTHON_OPERATORS = {
+    PLUS: '+', MINUS: '-', TIMES: '*', DIVIDE: '/',
+    LESS: '<', LESSEQ: '<=', GREATER: '>', GREATEREQ: '>=', EQUAL: '==', NOTEQ: '!='
+}
+
+PRECEDENCE = {PLUS: 1, MINUS: 1, TIMES: 2, DIVIDE: 2}
+
+class Compiler:
+    """
+        Generates the source of one Python function per let-in-end block and compiles it with compile().
+        Declared variables become local variables of the function (prefixed with v_ so they can't clash with Python names),
+        names that come from earlier blocks are read from the symbol table once at the start.
+        The function is called as function(symbol_table, overrides) and returns the value of the block,
+        a name given in overrides takes that value instead of its declared expression.
+    """
+    def block_source(self, block):
+        """ Returns the source of the function for a block. """
+        self.conditions = 0 # Temporaries c_N holding the conditions of the ifs, one per if of the block
+        lines = []
+        outer = []
+        declared = set()
+        for decl in block.decls:
+            for name in self.names_read(decl.expr):
+                if name not in declared and name not in outer:
+                    outer.append(name)
+            declared.add(decl.name)
+            lines.append(f"    v_{decl.name} = overrides[{decl.name!r}] if {decl.name!r} in overrides else {self.expr(decl.expr)}")
+            lines.append(f"    symbol_table[{decl.name!r}] = ({TOKEN_NAMES[decl.var_type]!r}, v_{decl.name})")
+        for name in self.names_read(block.expr):
+            if name not in declared and name not in outer:
+                outer.append(name)
+        lines.append(f"    return {self.expr(block.expr)}")
+        loads = [f"    v_{name} = symbol_table[{name!r}][1]" for name in outer]
+        return '\n'.join(["def let_in_end(symbol_table, overrides=NO_OVERRIDES):"] + loads + lines) + '\n'
+
+    def names_read(self, node):
+        """ Yields the names of the variables an expression reads, in evaluation order. """
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if type(node) is Var:
+                yield node.name
+            elif type(node) in (BinOp, Cond):
+                stack.append(node.right)
+                stack.append(node.left)
+            elif type(node) is Cast:
+                stack.append(node.expr)
+            elif type(node) is IfExpr:
+                stack.append(node.false_expr)
+                stack.append(node.true_expr)
+                stack.append(node.cond)
+            elif type(node) is Shared:
+                stack.append(node.expr)
+
+    def expr(self, node):
+        """ Returns the Python expression for an expression node. """
+        kind = type(node)
+        if kind is Number:
+            if isinstance(node.value, float) and not math.isfinite(node.value):
+                return f"float('{node.value}')" # A real literal that overflowed, inf and nan are not Python literals
+            return repr(node.value)
+        elif kind is Var:
+            return f"v_{node.name}"
+        elif kind is BinOp:
+            # Parentheses only where Python's precedence differs from the tree, so long chains don't nest
+            left, right = self.expr(node.left), self.expr(node.right)
+            if type(node.left) is BinOp and PRECEDENCE[node.left.op] < PRECEDENCE[node.op]:
+                left = f"({left})"
+            if type(node.right) is BinOp and PRECEDENCE[node.right.op] <= PRECEDENCE[node.op]:
+                right = f"({right})"
+            return f"{left} {PYTHON_OPERATORS[node.op]} {right}"
+        elif kind is Cast:
+            return f"{'float' if node.var_type == REAL else 'int'}({self.expr(node.expr)})"
+        elif kind is Cond:
+            return f"{self.expr(node.left)} {PYTHON_OPERATORS[node.op]} {self.expr(node.right)}"
+        elif kind is IfExpr:
+            # Like Parser.if_expr: the condition first, then both branches, then one is picked.
+            # The tuple is evaluated left to right, so c_N is set before the branches run (they may reuse its t_N).
+            condition = f"c_{self.conditions}"
+            self.conditions += 1
+            return (f"(({condition} := not ({self.expr(node.cond)})), {self.expr(node.true_expr)}, "
+                    f"{self.expr(node.false_expr)})[1 + {condition}]")
+        elif kind is Shared:
+            return f"(t_{node.slot} := {self.expr(node.expr)})"
+        elif kind is Reuse:
+            return f"t_{node.slot}"
+        raise ValueError(f"Invalid node: {node!r}")
+
+    def compile(self, block):
+        """
+        Compiles a block into a function.
+        Blocks nested too deeply for the Python compiler fall back to a function that runs the Evaluator.
+        """
+        try:
+            source = self.block_source(block)
+            namespace = {'NO_OVERRIDES': {}, '__builtins__': {'int': int, 'float': float}}
+            exec(compile(source, '<let-in-end>', 'exec'), namespace)
+            return namespace['let_in_end']
+        except (SyntaxError, RecursionError, MemoryError):
+            return self.evaluator_function(block)
+
+    def evaluator_function(self, block):
+        """ Returns a function with the same signature as a compiled block that walks the tree instead. """
+        def let_in_end(symbol_table, overrides={}):
+            evaluator = Evaluator()
+            evaluator.symbol_table = symbol_table
+            for decl in block.decls:
+                if decl.name in overrides:
+                    symbol_table[decl.name] = (TOKEN_NAMES[decl.var_type], overrides[decl.name])
+                else:
+                    evaluator.decl(decl)
+            return evaluator.expr(block.expr)
+        return let_in_end
+
+def compile_program(program):
+    """ Compiles every block of a program, returns the list of functions. """
+    compiler = Compiler()
+    return [compiler.compile(block) for block in program.blocks]
+
+def run_compiled(lexer, optimized=False):
+    """
+    Builds the tree of the whole program, compiles its blocks and runs them (the --compile mode).
+    Like run_tree, the blocks before a syntax error are still run first.
+    """
+    builder = TreeBuilder(lexer)
+    symbol_table = {}
+    error = None
+    try:
+        builder.prog()
+    except SyntaxError as e:
+        error = e
+    finally:
+        program = Program(builder.blocks)
+        if optimized:
+            program = optimize(program, keep=error is not None)
+        for function in compile_program(program):
+            print(function(symbol_table))
+    if error is not None:
+        raise builder.first_error(error, symbol_table)
+
+
+
+'''
+This section defines the optimization pass over the syntax tree.
+Optimizer rewrites a program into one that prints the same results as Parser.prog but has fewer nodes to evaluate.
+'''
+
+# Folded integers larger than this stay unfolded, the compiled source would need a huge literal
+FOLD_MAX_BITS = 1024
+
+# Subexpressions that are worth computing once when they are repeated
+SHAREABLE = (BinOp, Cast, IfExpr)
+
+def children(node):
+    """ Returns the expression nodes directly under node, in evaluation order. """
+    kind = type(node)
+    if kind is BinOp or kind is Cond:
+        return (node.left, node.right)
+    elif kind is Cast or kind is Shared:
+        return (node.expr,)
+    elif kind is IfExpr:
+        return (node.cond, node.true_expr, node.false_expr)
+    return ()
+
+def can_raise(node):
+    """
+    True if evaluating an expression might raise an error.
+    Names are always declared (TreeBuilder checks them) and comparisons never raise,
+    but any arithmetic or cast might (division by zero, int(inf), a huge int mixed with a float).
+    """
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if type(node) is BinOp or type(node) is Cast:
+            return True
+        stack.extend(children(node))
+    return False
+
+class Optimizer:
+    """
+        Rewrites a syntax tree into one that prints the same results with fewer nodes to evaluate:
+        - constant folding: operations on numbers are computed once, and a name declared with a constant is replaced by it
+        - if elimination: an if whose condition is decided by constants becomes the branch it picks,
+          but only when the other branch can't raise an error, since Parser evaluates both branches
+        - dead declarations: declarations that are never read and can't raise an error are dropped
+        - common subexpressions: a subexpression repeated in one declaration or block expression is computed once (Shared)
+          and its value is reused at the other places (Reuse)
+        Folding uses the same operations in the same order as Evaluator, so folded values are exactly the evaluated ones,
+        and an operation that raises an error is left in the tree so the error still happens when the program runs.
+        The given tree is not changed, nodes are created again where something changes (trees from SharingTreeBuilder
+        share nodes between blocks). The optimized program assumes an empty symbol table at the start, like Parser,
+        and dropped declarations are missing from the symbol table after it runs.
+        share=False leaves out the common subexpressions, for MemoizingEvaluator which already reuses values.
+        keep=True keeps the last declaration of every name, for the blocks before a syntax error: the block that failed
+        is parsed again with Parser over their symbol table (see TreeBuilder.first_error).
+    """
+    def __init__(self, share=True, keep=False):
+        self.share = share
+        self.keep = keep
+        self.constants = {} # Names whose current value is known, with that value
+        self.dispatch = {
+            Number: self.number,
+            Var: self.var,
+            BinOp: self.bin_op,
+            Cast: self.cast,
+            IfExpr: self.if_expr,
+            Cond: self.cond
+        }
+
+    def prog(self, program):
+        """ Returns the optimized program. """
+        return Program(self.remove_dead([self.let_in_end(block) for block in program.blocks]))
+
+    def let_in_end(self, block):
+        """ Returns the block with its declarations and expression optimized (dead declarations are still there). """
+        decls = [self.decl(decl) for decl in block.decls]
+        return LetInEnd(decls, block.var_type, self.statement(block.expr))
+
+    def decl(self, decl):
+        expr = self.statement(decl.expr)
+        if type(expr) is Number:
+            self.constants[decl.name] = expr.value
+        else:
+            self.constants.pop(decl.name, None)
+        return decl if expr is decl.expr else Decl(decl.name, decl.var_type, expr)
+
+    def statement(self, node):
+        """ Optimizes the expression of a declaration or of a block. """
+        self.folded = {} # Node -> folded node, so a shared subtree is only folded once
+        node = self.fold(node)
+        if self.share:
+            node = self.share_subexpressions(node)
+        return node
+
+    def fold(self, node):
+        folded = self.folded.get(node)
+        if folded is None:
+            folded = self.folded[node] = self.dispatch[type(node)](node)
+        return folded
+
+    def constant(self, function, *values):
+        """ Returns function(*values) as a Number, or None if it raises an error or the value can't be a literal. """
+        try:
+            value = function(*values)
+        except (ArithmeticError, ValueError):
+            return None
+        if type(value) is float and not math.isfinite(value):
+            return None # inf and nan have no literal in the compiled source
+        if type(value) is int and value.bit_length() > FOLD_MAX_BITS:
+            return None
+        return Number(value)
+
+    def number(self, node):
+        return node
+
+    def var(self, node):
+        if node.name in self.constants:
+            return Number(self.constants[node.name])
+        return node
+
+    def bin_op(self, node):
+        left, right = self.fold(node.left), self.fold(node.right)
+        if type(left) is Number and type(right) is Number:
+            folded = self.constant(ARITHMETIC[node.op], left.value, right.value)
+            if folded is not None:
+                return folded
+        if left is node.left and right is node.right:
+            return node
+        return BinOp(node.op, left, right)
+
+    def cast(self, node):
+        expr = self.fold(node.expr)
+        if type(expr) is Number:
+            folded = self.constant(float if node.var_type == REAL else int, expr.value)
+            if folded is not None:
+                return folded
+        return node if expr is node.expr else Cast(node.var_type, expr)
+
+    def cond(self, node):
+        left, right = self.fold(node.left), self.fold(node.right)
+        if left is node.left and right is node.right:
+            return node
+        return Cond(node.op, left, right)
+
+    def if_expr(self, node):
+        cond = self.fold(node.cond)
+        true_expr, false_expr = self.fold(node.true_expr), self.fold(node.false_expr)
+        if type(cond.left) is Number and type(cond.right) is Number:
+            if COMPARISONS[cond.op](cond.left.value, cond.right.value):
+                chosen, dropped = true_expr, false_expr
+            else:
+                chosen, dropped = false_expr, true_expr
+            if not can_raise(dropped):
+                return chosen
+        elif type(true_expr) is Number and type(false_expr) is Number and same_value(true_expr.value, false_expr.value):
+            return true_expr # Both branches give the same value
+        if cond is node.cond and true_expr is node.true_expr and false_expr is node.false_expr:
+            return node
+        return IfExpr(cond, true_expr, false_expr)
+
+    def share_subexpressions(self, node):
+        """
+        Replaces the repeated subexpressions of a statement by Shared (first occurrence) and Reuse (the others).
+        Occurrences are numbered in evaluation order, so the Shared one is always evaluated before its Reuse nodes.
+        The subexpressions of a repeated subexpression are only counted in its first occurrence, the others are not evaluated anymore.
+        """
+        self.structures = {} # Structure of a subexpression -> its key, equal subexpressions get the same key
+        self.keys = {}       # Node -> key
+        counts = collections.Counter()
+        self.count(node, counts)
+        if max(counts.values()) < 2:
+            return node
+        return self.rebuild(node, counts, {})
+
+    def key(self, node):
+        key = self.keys.get(node)
+        if key is None:
+            kind = type(node)
+            if kind is Number:
+                # -0.0 and 0.0 are equal but print differently, 1 and 1.0 too
+                structure = (kind, node.value.hex() if type(node.value) is float else node.value)
+            elif kind is Var:
+                structure = (kind, node.name)
+            else:
+                label = node.var_type if kind is Cast else None if kind is IfExpr else node.op
+                structure = (kind, label) + tuple(self.key(child) for child in children(node))
+            key = self.keys[node] = self.structures.setdefault(structure, len(self.structures))
+        return key
+
+    def count(self, node, counts):
+        key = self.key(node)
+        counts[key] += 1
+        if counts[key] == 1:
+            for child in children(node):
+                self.count(child, counts)
+
+    def rebuild(self, node, counts, slots):
+        """ slots holds the slot of each shared key whose first occurrence was already rebuilt. """
+        kind = type(node)
+        key = self.keys[node]
+        if kind in SHAREABLE and counts[key] > 1:
+            if key in slots:
+                return Reuse(slots[key])
+            slot = slots[key] = len(slots)
+            return Shared(slot, self.rebuild_children(node, counts, slots))
+        return self.rebuild_children(node, counts, slots)
+
+    def rebuild_children(self, node, counts, slots):
+        kind = type(node)
+        if kind is BinOp or kind is Cond:
+            left = self.rebuild(node.left, counts, slots)
+            right = self.rebuild(node.right, counts, slots)
+            return node if left is node.left and right is node.right else kind(node.op, left, right)
+        elif kind is Cast:
+            expr = self.rebuild(node.expr, counts, slots)
+            return node if expr is node.expr else Cast(node.var_type, expr)
+        elif kind is IfExpr:
+            cond = self.rebuild(node.cond, counts, slots)
+            true_expr = self.rebuild(node.true_expr, counts, slots)
+            false_expr = self.rebuild(node.false_expr, counts, slots)
+            if cond is node.cond and true_expr is node.true_expr and false_expr is node.false_expr:
+                return node
+            return IfExpr(cond, true_expr, false_expr)
+        return node
+
+    def remove_dead(self, blocks):
+        """
+        Drops the declarations whose value is never read and that can't raise an error.
+        Goes through the program backwards keeping the names that are read before being declared again (live names).
+        """
+        names_read = Compiler().names_read
+        live = {decl.name for block in blocks for decl in block.decls} if self.keep else set()
+        optimized = []
+        for block in reversed(blocks):
+            live.update(names_read(block.expr))
+            decls = []
+            for decl in reversed(block.decls):
+                if decl.name not in live and not can_raise(decl.expr):
+                    continue
+                live.discard(decl.name)
+                live.update(names_read(decl.expr))
+                decls.append(decl)
+            decls.reverse()
+            optimized.append(block if len(decls) == len(block.decls) else LetInEnd(decls, block.var_type, block.expr))
+        optimized.reverse()
+        return optimized
+
+def optimize(program, share=True, keep=False):
+    """ Returns the optimized program, see Optimizer. """
+    return Optimizer(share, keep).prog(program)
+
+
+
+'''
+This section defines the on-disk parse cache.
+The syntax tree of every top-level let-in-end block is stored under a hash of the block's source,
+so blocks that did not change since the last run are not parsed again (and a file that did not change at all is not even lexed).
+'''
+
+# Node types in the order used by the cache encoding, changing it requires a new CACHE_VERSION
+NODE_TYPES = (Program, LetInEnd, Decl, Number, Var, BinOp, Cast, Cond, IfExpr)
+NODE_INDEX = {node_type: index for index, node_type in enumerate(NODE_TYPES)}
+
+CACHE_MAGIC = b'TINYPC'
+CACHE_VERSION = 1
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+def tree_to_tuple(node):
+    """ Converts a tree into nested tuples that marshal can store, each node becomes (type index, fields...). """
+    if isinstance(node, Node):
+        return (NODE_INDEX[type(node)],) + tuple(tree_to_tuple(getattr(node, field)) for field in node.__slots__)
+    if isinstance(node, list):
+        return [tree_to_tuple(item) for item in node]
+    return node
+
+def tree_from_tuple(data):
+    """ Rebuilds the tree stored by tree_to_tuple. """
+    if isinstance(data, tuple):
+        return NODE_TYPES[data[0]](*[tree_from_tuple(item) for item in data[1:]])
+    if isinstance(data, list):
+        return [tree_from_tuple(item) for item in data]
+    return data
+
+def grammar_digest():
+    """
+    Digest of everything the cached trees depend on: the token patterns and the cache format version.
+    A cache written with different TOKEN_TYPES is thrown away when it is loaded.
+    """
+    return hashlib.sha256(repr((CACHE_VERSION, list(TOKEN_TYPES.items()))).encode()).digest()[:16]
+
+class ParseCache:
+    """
+        Least recently used cache of parsed blocks, saved to one file.
+        The file starts with a header (magic, format version, grammar digest) followed by the marshaled entries,
+        oldest first. Entries are evicted once their total size goes over max_bytes.
+    """
+    def __init__(self, path, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def header(self):
+        return CACHE_MAGIC + struct.pack('<H', CACHE_VERSION) + grammar_digest()
+
+    def load(self):
+        """ Reads the cache file, a missing, damaged or outdated file gives an empty cache. """
+        try:
+            with open(self.path, 'rb') as file:
+                data = file.read()
+        except OSError:
+            return
+        header = self.header()
+        if not data.startswith(header):
+            return
+        try:
+            entries = marshal.loads(data[len(header):])
+        except (EOFError, ValueError, TypeError):
+            return
+        for key, value in entries:
+            self.put(key, value)
+
+    def save(self):
+        """ Writes the cache file (to a temporary file first, so a crash never leaves half a cache). """
+        data = self.header() + marshal.dumps(list(self.entries.items()))
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, self.path)
+
+    def get(self, key):
+        """ Returns the value stored under key (and marks it as recently used), or None. """
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        """ Stores a bytes value under key, evicting the least recently used entries if the cache is full. """
+        if key in self.entries:
+            self.size -= len(key) + len(self.entries[key])
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        self.size += len(key) + len(value)
+        while self.size > self.max_bytes and self.entries:
+            old_key, old_value = self.entries.popitem(last=False)
+            self.size -= len(old_key) + len(old_value)
+
+    @staticmethod
+    def key(kind, text):
+        """ Cache key of a source text, kind is b'F' for a whole file or b'B' for one block. """
+        return kind + hashlib.sha256(text.encode('utf-8', 'surrogatepass')).digest()[:16]
+
+    def get_block(self, key):
+        value = self.get(key)
+        return tree_from_tuple(marshal.loads(value)) if value is not None else None
+
+    def put_block(self, key, block):
+        try:
+            self.put(key, marshal.dumps(tree_to_tuple(block)))
+        except (ValueError, RecursionError):
+            pass # Too deep for marshal, the block will just be parsed again next time
+
+def reads_declared(block, declared):
+    """ True if every name the block reads is declared before it is read, by an earlier block (declared) or itself. """
+    names_read = Compiler().names_read
+    declared = set(declared)
+    for decl in block.decls:
+        if any(name not in declared for name in names_read(decl.expr)):
+            return False
+        declared.add(decl.name)
+    return all(name in declared for name in names_read(block.expr))
+
+def parse_with_cache(text, cache):
+    """
+    Returns (blocks, error, builder): the syntax trees of the blocks of the program, taking unchanged blocks from the cache.
+    If a block fails to parse, the blocks before it are returned together with the error and the TreeBuilder of the
+    block (for TreeBuilder.first_error), the error and builder are None otherwise.
+    A cached block is only reused if the names it reads are still declared before it, otherwise it is parsed again
+    so the undefined name gets the same error as in Parser.
+    """
+    file_key = cache.key(b'F', text)
+    block_keys = cache.get(file_key)
+    if block_keys is not None:
+        blocks = [cache.get_block(key) for key in marshal.loads(block_keys)]
+        if None not in blocks:
+            return blocks, None, None
+
+    lexer = Lexer(text)
+    tokens = lexer.tokens
+    blocks = []
+    keys = []
+    declared = {}
+    for start, end in split_blocks(tokens.kinds):
+        key = cache.key(b'B', text[tokens.starts[start]:tokens.ends[end - 1]])
+        block = cache.get_block(key)
+        if block is not None and not reads_declared(block, declared):
+            block = None # An earlier declaration it reads was removed
+        if block is None:
+            builder = TreeBuilder(Lexer(text, tokens.slice(start, end)))
+            builder.symbol_table = declared # Names declared by the earlier blocks
+            try:
+                block = builder.let_in_end()
+            except Exception as e:
+                return blocks, e, builder
+            cache.put_block(key, block)
+        for decl in block.decls:
+            declared[decl.name] = TOKEN_NAMES[decl.var_type]
+        blocks.append(block)
+        keys.append(key)
+    cache.put(file_key, marshal.dumps(keys))
+    return blocks, None, None
+
+def run_cached(text, cache, evaluator=None, optimized=False):
+    """
+    Parses the program through the cache, then evaluates it (the --cache mode).
+    Like run_tree, the blocks before a syntax error are still evaluated first.
+    The cache keeps the trees as parsed, optimized=True optimizes them after they are loaded.
+    """
+    blocks, error, builder = parse_with_cache(text, cache)
+    cache.save()
+    program = Program(blocks)
+    if optimized:
+        program = optimize(program, share=not isinstance(evaluator, MemoizingEvaluator), keep=error is not None)
+    evaluator = evaluator or Evaluator()
+    evaluator.prog(program)
+    if error is not None:
+        raise builder.first_error(error, evaluator.symbol_table)
+
+
+
+'''
+This section runs the blocks of one file in parallel.
+The file is split on its top-level let ... end ; blocks, and a block only has to wait for the earlier blocks that declare
+the names it reads (the symbol table is the only thing blocks share). Independent groups of blocks run on a process pool
+and the results are printed in the original order.
+'''
+
+# Smallest group of consecutive blocks (in tokens) sent to a worker, smaller tasks cost more to send than to run
+PARALLEL_MIN_TASK_TOKENS = 2000
+
+# Files shorter than this are lexed in the main process, splitting them would cost more than it saves
+PARALLEL_MIN_LEX_CHARS = 1024 * 1024
+
+WHITESPACE = re.compile(r'\s')
+
+def split_text(text, pieces):
+    """
+    Cuts the text into about equal (start, end) pieces.
+    Every cut is made on a whitespace character, which never falls inside a token, so the pieces can be lexed separately.
+    """
+    size = len(text) // pieces
+    cuts = [0]
+    for number in range(1, pieces):
+        match = WHITESPACE.search(text, max(cuts[-1], number * size))
+        if match is None:
+            break
+        cuts.append(match.start())
+    cuts.append(len(text))
+    return [(cuts[i], cuts[i + 1]) for i in range(len(cuts) - 1) if cuts[i] < cuts[i + 1]]
+
+def lex_piece(text, base, offset_type):
+    """
+    Tokenizes one piece of a file in a worker.
+    Returns the kinds as bytes and the start/end offsets (relative to the whole file) as arrays.
+    """
+    tokens = Lexer(text).tokens
+    return (tokens.kinds.tobytes(),
+            array(offset_type, [start + base for start in tokens.starts]),
+            array(offset_type, [end + base for end in tokens.ends]))
+
+def lex_parallel(text, pool, pieces):
+    """ Tokenizes the text on the pool, piece by piece, and joins the pieces into one TokenStore. """
+    tokens = TokenStore(text)
+    offset_type = tokens.starts.typecode
+    futures = [pool.submit(lex_piece, text[start:end], start, offset_type) for start, end in split_text(text, pieces)]
+    for future in futures:
+        kinds, starts, ends = future.result()
+        tokens.kinds.frombytes(kinds)
+        tokens.starts.extend(starts)
+        tokens.ends.extend(ends)
+    return tokens
+
+def block_names(tokens, start, end):
+    """
+    Returns (reads, writes): the names a range of tokens reads and the names it declares, found from the tokens alone.
+    A name followed by ':' is declared (<decl> ::= id : ...), any other name is read.
+    """
+    kinds = tokens.kinds
+    data = kinds.tobytes()
+    id_byte = bytes((ID,))
+    reads = set()
+    writes = set()
+    index = data.find(id_byte, start, end)
+    while index >= 0:
+        if index + 1 < end and kinds[index + 1] == COLON:
+            writes.add(tokens.lexeme(index))
+        else:
+            reads.add(tokens.lexeme(index))
+        index = data.find(id_byte, index + 1, end)
+    return reads, writes
+
+def plan_tasks(tokens, blocks, min_tokens=PARALLEL_MIN_TASK_TOKENS):
+    """
+    Groups consecutive blocks into tasks of at least min_tokens tokens and finds what each task depends on.
+    Returns a list of (start token, end token, reads, writes, dependencies), where dependencies are the indexes of the
+    earlier tasks that last declared the names the task reads.
+    """
+    groups = []
+    for start, end in blocks:
+        if groups and groups[-1][1] - groups[-1][0] < min_tokens:
+            groups[-1][1] = end
+        else:
+            groups.append([start, end])
+    tasks = []
+    last_writer = {}
+    for number, (start, end) in enumerate(groups):
+        reads, writes = block_names(tokens, start, end)
+        dependencies = {last_writer[name] for name in reads if name in last_writer}
+        tasks.append((start, end, reads, writes, dependencies))
+        for name in writes:
+            last_writer[name] = number
+    return tasks
+
+def run_task(text, kinds, starts, ends, symbol_table, writes):
+    """
+    Runs a group of consecutive blocks in a worker, starting from the values of the names it reads.
+    text is the source of the group, kinds/starts/ends its tokens with offsets relative to the whole file.
+    Returns (results, declared, error): the result of each block that ran, the final values of the names the group
+    declares, and the exception that stopped it (or None).
+    """
+    results = []
+    try:
+        tokens = TokenStore(text)
+        base = starts[0]
+        tokens.kinds.frombytes(kinds)
+        tokens.starts.extend(start - base for start in starts)
+        tokens.ends.extend(end - base for end in ends)
+        parser = Parser(Lexer(text, tokens))
+        parser.symbol_table = symbol_table
+        while parser.current_kind == LET:
+            results.append(parser.let_in_end())
+        error = None
+    except Exception as e:
+        error = e
+    declared = {name: symbol_table[name] for name in writes if name in symbol_table}
+    return results, declared, error
+
+def run_parallel(text, workers=None, min_tokens=PARALLEL_MIN_TASK_TOKENS):
+    """
+    Parses and evaluates the blocks of one program on a process pool (the --parallel mode).
+    The output is the same as Parser.prog: results in block order, and on an error the results of the blocks before it.
+    """
+    workers = workers or os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        if len(text) < PARALLEL_MIN_LEX_CHARS:
+            tokens = Lexer(text).tokens
+        else:
+            tokens = lex_parallel(text, pool, workers * 4)
+        tasks = plan_tasks(tokens, split_blocks(tokens.kinds), min_tokens)
+        values = {}       # task index -> values of the names it declared
+        outcomes = {}     # task index -> (results, error)
+        first_error = len(tasks) # Tasks after a failed one don't have to run
+        printed = 0
+        running = {}
+        waiting = list(range(len(tasks)))
+        while waiting or running:
+            # Start every task whose dependencies are done
+            still_waiting = []
+            for number in waiting:
+                start, end, reads, writes, dependencies = tasks[number]
+                if number >= first_error:
+                    continue
+                if all(dependency in values for dependency in dependencies):
+                    symbol_table = {}
+                    for dependency in sorted(dependencies):
+                        symbol_table.update((name, value) for name, value in values[dependency].items() if name in reads)
+                    source = text[tokens.starts[start]:tokens.ends[end - 1]]
+                    future = pool.submit(run_task, source, tokens.kinds[start:end].tobytes(), tokens.starts[start:end],
+                                         tokens.ends[start:end], symbol_table, writes)
+                    running[future] = number
+                else:
+                    still_waiting.append(number)
+            waiting = still_waiting
+            if not running:
+                break
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                number = running.pop(future)
+                results, declared, error = future.result()
+                outcomes[number] = (results, error)
+                if error is None:
+                    values[number] = declared
+                else:
+                    first_error = min(first_error, number)
+            # Print the results that are now complete, in order
+            while printed in outcomes and printed <= first_error:
+                results, error = outcomes[printed]
+                for result in results:
+                    print(result)
+                if error is not None:
+                    raise error
+                printed += 1
+
+
+
+'''
+This section defines the incremental re-parse, for tools that check a buffer again after every edit.
+The text is split into segments: the let ... end ; blocks, the tokens that stop Parser.prog (anything that doesn't start
+with let) and the parts that could not be lexed. Each segment keeps its own tokens and each block the result of running it.
+An edit only re-lexes from the first segment it touches until the new tokens line up with an old segment again,
+and only runs the new blocks and the later blocks that read a name whose value changed.
+'''
+
+# Kinds of segments
+BLOCK_SEGMENT, OTHER_SEGMENT, ERROR_SEGMENT = range(3)
+
+class Segment:
+    """
+        A part of an IncrementalDocument.
+        Offsets are counted from the start of the text for segments before the last edit (front is True) and from
+        the end of the text for the ones after it, so an edit doesn't move the offsets of the segments after it.
+    """
+    __slots__ = ('kind', 'front', 'start', 'end', 'tokens', 'reads', 'writes', 'inputs', 'declared', 'result', 'error',
+                 'invalid')
+
+    def __init__(self, kind, start, end, tokens=None, error=None):
+        self.kind = kind
+        self.front = True
+        self.start = start   # Offset of the first token
+        self.end = end       # Offset after the last token
+        self.tokens = tokens # TokenStore over the text of the segment
+        self.reads = self.writes = frozenset()
+        self.inputs = None   # Values of the names the block reads, as they were when it last ran
+        self.declared = {}   # Values of the names the block declared
+        self.result = None
+        self.error = error
+        self.invalid = 0     # Offset of the invalid character from start, in the segments that can't be lexed
+
+class IncrementalDocument:
+    """
+        A program that is lexed and parsed again piece by piece as it is edited.
+        results() and prog() give the same values and error as Parser.prog on the whole current text.
+    """
+    def __init__(self, text=''):
+        self.text = ''
+        self.segments = []
+        self.gap = 0 # Segments before this index are counted from the start of the text, the others from the end
+        self.writers = collections.defaultdict(list) # name -> blocks that declare it, in text order
+        self.readers = collections.defaultdict(list) # name -> blocks that read it, in text order
+        self.reran = 0 # Blocks run by the last edit
+        self.edit(0, 0, text)
+
+    def start(self, segment):
+        return segment.start if segment.front else len(self.text) - segment.start
+
+    def end(self, segment):
+        return segment.end if segment.front else len(self.text) - segment.end
+
+    def move_gap(self, index):
+        """ Makes the segments before index count from the start of the text and the others from the end. """
+        length = len(self.text)
+        for segment in self.segments[min(index, self.gap):max(index, self.gap)]:
+            segment.front = not segment.front
+            segment.start, segment.end = length - segment.start, length - segment.end
+        self.gap = index
+
+    def edit(self, offset, deleted, inserted):
+        """
+        Replaces the deleted characters at offset with the inserted text, then lexes, parses and runs again
+        only what the edit can have changed.
+        """
+        if not 0 <= offset <= offset + deleted <= len(self.text):
+            raise ValueError(f"Edit ({offset}, {deleted}) is outside of the text")
+        segments = self.segments
+        start = self.start
+        # Tokens right next to the edit can merge with the inserted text, so they are touched too
+        first = bisect.bisect_left(segments, offset, key=self.end)
+        if first > 0 and self.is_open(segments[first - 1]):
+            first -= 1 # The segment before runs until the next let or the end of the text, the edit can extend it
+        pos = min(start(segments[first]), offset) if first < len(segments) else offset
+        self.move_gap(first)
+        old_end = offset + deleted
+
+        self.text = text = self.text[:offset] + inserted + self.text[old_end:]
+        new_end = offset + len(inserted)
+        delta = len(inserted) - deleted
+        later = first # Old segment where the new tokens may line up with the old ones
+        while later < len(segments) and len(text) - segments[later].start < new_end:
+            later += 1
+
+        def lines_up(position):
+            """ True if an old segment after the edit starts at position, from there on the tokens are the same as before. """
+            nonlocal later
+            while later < len(segments) and len(text) - segments[later].start < position:
+                later += 1
+            return later < len(segments) and len(text) - segments[later].start == position
+
+        new_segments = []
+        kinds, starts, ends = bytearray(), [], []
+        stop = len(segments)
+        try:
+            for kind, token_start, token_end in scan(text, pos):
+                if kinds and kinds[0] != LET and kind == LET:
+                    new_segments.append(self.make_segment(text, kinds, starts, ends))
+                    kinds, starts, ends = bytearray(), [], []
+                if not kinds and token_start >= new_end and lines_up(token_start):
+                    stop = later
+                    break
+                kinds.append(kind)
+                starts.append(token_start)
+                ends.append(token_end)
+                if kind == SEMICOLON and kinds[0] == LET and kinds[-2:] == END_SEMICOLON:
+                    new_segments.append(self.make_segment(text, kinds, starts, ends))
+                    kinds, starts, ends = bytearray(), [], []
+            else:
+                if kinds:
+                    new_segments.append(self.make_segment(text, kinds, starts, ends))
+        except SyntaxError as e:
+            # The part that can't be lexed runs to the next old segment after it (or to the end of the text)
+            error_start = starts[0] if starts else (self.end(new_segments[-1]) if new_segments else pos)
+            failed_at = ends[-1] if ends else error_start
+            lines_up(max(failed_at + 1, new_end))
+            stop = later
+            error_end = len(text) - segments[stop].start if stop < len(segments) else len(text)
+            new_segments.append(Segment(ERROR_SEGMENT, error_start, error_end, error=e))
+            new_segments[-1].invalid = skip_spaces(text, failed_at) - error_start
+
+        removed = segments[first:stop]
+        for segment in removed:
+            self.unindex(segment, len(text) - delta)
+        for segment in new_segments:
+            segment.front = False
+            segment.start, segment.end = len(text) - segment.start, len(text) - segment.end
+        segments[first:stop] = new_segments
+        for segment in new_segments:
+            self.index(segment)
+        self.rerun(removed, new_segments, first + len(new_segments))
+
+    def is_open(self, segment):
+        """ True if the segment would take in tokens added after it: anything but a block that ends with 'end ;'. """
+        if segment.kind == BLOCK_SEGMENT:
+            return segment.tokens.kinds[-2:].tobytes() != END_SEMICOLON
+        return segment.kind == OTHER_SEGMENT
+
+    def make_segment(self, text, kinds, starts, ends):
+        """ Builds a segment out of the tokens of one block (or of what comes after the blocks). """
+        start, end = starts[0], ends[-1]
+        tokens = TokenStore(text[start:end])
+        tokens.kinds.frombytes(kinds)
+        tokens.starts.extend(offset - start for offset in starts)
+        tokens.ends.extend(offset - start for offset in ends)
+        segment = Segment(BLOCK_SEGMENT if kinds[0] == LET else OTHER_SEGMENT, start, end, tokens)
+        if segment.kind == BLOCK_SEGMENT:
+            reads, writes = block_names(tokens, 0, len(tokens))
+            # A declared name is read too when the block is malformed (x : ... where an expression is expected)
+            segment.reads, segment.writes = frozenset(reads | writes), frozenset(writes)
+        return segment
+
+    def index(self, segment):
+        """ Adds a new segment to the name indexes. """
+        key = self.start
+        position = key(segment)
+        for table, names in ((self.writers, segment.writes), (self.readers, segment.reads)):
+            for name in names:
+                segments = table[name]
+                if not segments or key(segments[-1]) < position:
+                    segments.append(segment) # Always the case when the text is first read
+                else:
+                    bisect.insort(segments, segment, key=key)
+
+    def unindex(self, segment, length):
+        """ Removes an old segment from the name indexes, offsets are still the ones of the text before the edit. """
+        def key(other):
+            return other.start if other.front else length - other.start
+        position = key(segment)
+        for table, names in ((self.writers, segment.writes), (self.readers, segment.reads)):
+            for name in names:
+                segments = table[name]
+                index = bisect.bisect_left(segments, position, key=key)
+                while segments[index] is not segment:
+                    index += 1
+                del segments[index]
+
+    def value_before(self, name, segment):
+        """ The value (type, value) of name when the block starts running, None if it isn't declared yet. """
+        writers = self.writers.get(name, ())
+        index = bisect.bisect_left(writers, self.start(segment), key=self.start)
+        while index > 0:
+            index -= 1
+            if name in writers[index].declared:
+                return writers[index].declared[name]
+        return None
+
+    def queue_readers(self, queue, name, position):
+        """ Queues the blocks after position that read name, up to the next block that declares it again. """
+        writers = self.writers.get(name, ())
+        index = bisect.bisect_right(writers, position, key=self.start)
+        limit = self.start(writers[index]) if index < len(writers) else len(self.text)
+        readers = self.readers.get(name, ())
+        index = bisect.bisect_right(readers, position, key=self.start)
+        while index < len(readers) and self.start(readers[index]) <= limit:
+            heapq.heappush(queue, (self.start(readers[index]), id(readers[index]), readers[index]))
+            index += 1
+
+    def rerun(self, removed, new_segments, after):
+        """
+        Runs the new blocks, then every later block whose inputs changed, in text order.
+        after is the index of the first old segment after the new ones.
+        """
+        queue = [(self.start(segment), id(segment), segment) for segment in new_segments if segment.kind == BLOCK_SEGMENT]
+        heapq.heapify(queue)
+        position = self.start(self.segments[after]) - 1 if after < len(self.segments) else len(self.text)
+        for name in {name for segment in removed for name in segment.writes}:
+            self.queue_readers(queue, name, position)
+        self.reran = 0
+        done = set()
+        while queue:
+            _, key, segment = heapq.heappop(queue)
+            if key in done:
+                continue
+            done.add(key)
+            inputs = {name: self.value_before(name, segment) for name in segment.reads}
+            if segment.inputs is not None and all(same_symbol(segment.inputs[name], value) for name, value in inputs.items()):
+                continue
+            declared = segment.declared
+            self.run_block(segment, inputs)
+            self.reran += 1
+            for name in declared.keys() | segment.declared.keys():
+                if not same_symbol(declared.get(name), segment.declared.get(name)):
+                    self.queue_readers(queue, name, self.start(segment))
+
+    def run_block(self, segment, inputs):
+        """ Parses and runs one block, starting from the values of the names it reads. """
+        symbol_table = {name: value for name, value in inputs.items() if value is not None}
+        parser = Parser(Lexer(segment.tokens.text, segment.tokens))
+        parser.symbol_table = symbol_table
+        try:
+            segment.result, segment.error = parser.let_in_end(), None
+        except Exception as e:
+            segment.result, segment.error = None, e
+        segment.inputs = inputs
+        segment.declared = {name: symbol_table[name] for name in segment.writes if name in symbol_table}
+
+    def results(self):
+        """
+        Returns (results, error) as Parser.prog on the whole text would give them:
+        the result of each block up to the first error, and that error (None if there is none).
+        """
+        for segment in self.segments:
+            if segment.kind == ERROR_SEGMENT:
+                # Lexing the whole text fails before anything is parsed, at the line and column Lexer gives the error
+                error = segment.error
+                error.lineno, error.offset = LineIndex(self.text).line_column(self.start(segment) + segment.invalid)
+                return [], error
+        results = []
+        for segment in self.segments:
+            if segment.kind != BLOCK_SEGMENT:
+                break
+            if segment.error is not None:
+                return results, segment.error
+            results.append(segment.result)
+        return results, None
+
+    def prog(self):
+        """ Prints the results and raises the error, like Parser.prog. """
+        results, error = self.results()
+        for result in results:
+            print(result)
+        if error is not None:
+            raise error
+
+def same_symbol(old, new):
+    """ True if two symbol table entries (type, value), or None for a missing name, are exactly the same. """
+    if old is None or new is None:
+        return old is new
+    return old[0] == new[0] and same_value(old[1], new[1])
+
+
+
+'''
+This section defines the opt-in instrumentation of the grammar rules.
+instrument() returns a subclass whose rule methods are wrapped to record calls and time in a RuleProfile,
+so the Parser and Lexer classes themselves are never changed and cost nothing extra when it isn't used.
+'''
+
+# Methods wrapped by instrument(), the grammar rules of Parser and the tokenizer of Lexer
+PARSER_RULES = ('prog', 'let_in_end', 'decl_list', 'decl', 'type', 'expr', 'term', 'factor', 'cond', 'if_expr', 'consume_token')
+LEXER_RULES = ('tokenize',)
+
+class RuleProfile:
+    """
+    Call counts, cumulative and self time and recursion depth of each instrumented rule.
+    Cumulative time only counts the outermost call of a recursive rule (as cProfile does), self time leaves out the
+    time spent in the instrumented rules it calls. Self time is also kept per call stack, for flame graphs.
+    """
+    def __init__(self):
+        self.calls = collections.Counter()
+        self.cumulative = collections.Counter()
+        self.self_time = collections.Counter()
+        self.depth = collections.Counter()     # Calls of each rule that are running now
+        self.max_depth = collections.Counter()
+        self.stacks = collections.Counter()    # "prog;let_in_end;expr" -> self time
+        self.frames = []                       # [rule, call stack, start time, time spent in instrumented calls]
+        self.deepest = 0
+
+    def enter(self, rule):
+        frames = self.frames
+        stack = f"{frames[-1][1]};{rule}" if frames else rule
+        frames.append([rule, stack, time.perf_counter(), 0.0])
+        depth = self.depth[rule] = self.depth[rule] + 1
+        if depth > self.max_depth[rule]:
+            self.max_depth[rule] = depth
+        if len(frames) > self.deepest:
+            self.deepest = len(frames)
+
+    def exit(self):
+        rule, stack, start, inner = self.frames.pop()
+        elapsed = time.perf_counter() - start
+        self.calls[rule] += 1
+        self.self_time[rule] += elapsed - inner
+        self.stacks[stack] += elapsed - inner
+        self.depth[rule] -= 1
+        if self.depth[rule] == 0:
+            self.cumulative[rule] += elapsed
+        if self.frames:
+            self.frames[-1][3] += elapsed
+
+    def wrap(self, rule, method):
+        """ Returns method wrapped to record its calls under the rule name. """
+        enter, exit = self.enter, self.exit
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            enter(rule)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                exit()
+        return wrapper
+
+    def to_dict(self):
+        """ The numbers as a dictionary (times in seconds), rules sorted by self time. """
+        rules = sorted(self.calls, key=self.self_time.__getitem__, reverse=True)
+        return {
+            'max_depth': self.deepest,
+            'rules': {rule: {
+                'calls': self.calls[rule],
+                'cumulative': self.cumulative[rule],
+                'self': self.self_time[rule],
+                'max_depth': self.max_depth[rule],
+            } for rule in rules},
+        }
+
+    def write_json(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2)
+            file.write('\n')
+
+    def write_collapsed(self, path):
+        """
+        Writes the self time of each call stack in microseconds, one "rule;rule;rule count" line per stack,
+        the collapsed format read by flamegraph.pl and speedscope.
+        """
+        with open(path, 'w') as file:
+            for stack, seconds in sorted(self.stacks.items()):
+                microseconds = round(seconds * 1e6)
+                if microseconds:
+                    file.write(f"{stack} {microseconds}\n")
+
+def instrument(cls, profile, rules=PARSER_RULES):
+    """
+    Returns a subclass of cls (Parser, a Lexer, or one of their subclasses) whose rules record into profile.
+    Rules that cls doesn't have are skipped.
+    """
+    methods = {rule: profile.wrap(rule, getattr(cls, rule)) for rule in rules if hasattr(cls, rule)}
+    return type(f"Instrumented{cls.__name__}", (cls,), methods)
+
+
+
+'''
+This section defines the error recovery mode (--recover), which reports every error of a file in one pass.
+Instead of stopping at the first error, the parser records it as a Diagnostic (message, offsets, line and column)
+and skips ahead to a token it can go on from: the ; that ends a declaration or the end ; that ends a block.
+Nothing is evaluated in this mode, it only checks the syntax and the names.
+'''
+
+# Tokens a broken declaration is skipped to
+DECL_SYNC = frozenset((SEMICOLON, IN, END, LET))
+BLOCK_SYNC = frozenset((END, LET))
+
+class Diagnostic:
+    """ An error found in recovery mode: its message and the span of text it is about (offsets, lines and columns). """
+    __slots__ = ('message', 'start', 'end', 'line', 'column', 'end_line', 'end_column')
+
+    def __init__(self, lines, message, start, end):
+        """ lines is the LineIndex of the text. """
+        self.message = message
+        self.start = start
+        self.end = end
+        self.line, self.column = lines.line_column(start)
+        self.end_line, self.end_column = lines.line_column(end)
+
+    def __str__(self):
+        return f"{self.line}:{self.column}: {self.message}"
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+class SkipBlock(Exception):
+    """ Raised when a broken declaration can't be skipped to its ;, the rest of the block is skipped instead. """
+
+def tokenize_recovering(text, diagnostics):
+    """
+    Tokenizes the text like Lexer.tokenize, but an invalid character is added to diagnostics and skipped
+    instead of stopping the lexer. Returns the TokenStore.
+    """
+    tokens = TokenStore(text)
+    append = tokens.append
+    pos = 0
+    while True:
+        try:
+            for kind, start, pos in scan(text, pos):
+                append(kind, start, pos)
+            return tokens
+        except SyntaxError as error:
+            bad = skip_spaces(text, pos)
+            diagnostics.append(Diagnostic(tokens.line_index, error.msg, bad, bad + 1)) # The message of Lexer
+            pos = bad + 1
+
+class RecoveringTreeBuilder(TreeBuilder):
+    """
+        TreeBuilder that records errors in diagnostics and goes on parsing.
+        An error in a declaration skips to the ; that ends it, an error anywhere else in a block skips to the block's end ;
+        and parsing goes on with the next block. The name of a broken declaration still counts as declared, so its uses
+        are not reported again. An undefined name gets the same message as in Parser, at the token after it where Parser
+        stops, and parsing goes on from there.
+        Only the blocks without errors are kept in blocks. Needs a Lexer, the offsets come from its token store.
+    """
+    def __init__(self, lexer):
+        super().__init__(lexer)
+        self.diagnostics = []
+        self.block_failed = False
+
+    def report(self, message):
+        """ Records an error at the current token. """
+        tokens = self.lexer.tokens
+        index = self.lexer.index - 1
+        if index < len(tokens):
+            start, end = tokens.starts[index], tokens.ends[index]
+        else:
+            start = end = len(self.lexer.text)
+        self.diagnostics.append(Diagnostic(tokens.line_index, message, start, end))
+        self.block_failed = True
+
+    def skip_to(self, kinds):
+        """ Skips tokens until the current one is one of kinds or EOF. """
+        while self.current_kind not in kinds and self.current_kind != EOF:
+            self.current_kind = self.next_kind()
+
+    def prog(self):
+        """
+        <prog> ::= <let-in-end> { <let-in-end> }
+        Like Parser.prog it stops at a token that doesn't start a block, unless it got there by skipping a broken block.
+        """
+        while self.current_kind == LET:
+            block = self.let_in_end()
+            if block is None:
+                self.skip_to((LET,))
+            else:
+                self.blocks.append(block)
+        return Program(self.blocks)
+
+    def let_in_end(self):
+        """
+        <let-in-end> ::= let <decl-list> in <type> ( <expr> ) end ;
+        Returns None if the block has an error.
+        """
+        self.block_failed = False
+        try:
+            block = super().let_in_end()
+        except (SyntaxError, SkipBlock) as e:
+            if isinstance(e, SyntaxError):
+                self.report(str(e))
+            self.skip_to(BLOCK_SYNC)
+            if self.current_kind == END:
+                self.current_kind = self.next_kind()
+                if self.current_kind == SEMICOLON:
+                    self.current_kind = self.next_kind()
+            return None
+        return None if self.block_failed else block
+
+    def decl(self):
+        """
+        <decl> ::= id : <type> = <expr> ;
+        """
+        var_name = self.lexer.value() if self.current_kind == ID else None
+        try:
+            return super().decl()
+        except SyntaxError as e:
+            self.report(str(e))
+        if var_name is not None:
+            self.symbol_table[var_name] = None
+        self.skip_to(DECL_SYNC)
+        if self.current_kind == SEMICOLON:
+            self.current_kind = self.next_kind()
+        elif self.current_kind != IN:
+            raise SkipBlock()
+
+    def factor(self):
+        """
+        <factor> ::= ( <expr> ) | id | number | <type> ( id )
+        """
+        if self.current_kind != ID:
+            return super().factor()
+        var_name = self.lexer.value()
+        self.consume_token(ID)
+        if var_name not in self.symbol_table:
+            try:
+                self.error()
+            except SyntaxError as e:
+                self.report(str(e))
+        return self.node(Var, var_name)
+
+def parse_recovering(text):
+    """
+    Parses a whole program in recovery mode.
+    Returns (program, diagnostics): the blocks without errors and all the errors of the text, in the order of the text.
+    """
+    diagnostics = []
+    builder = RecoveringTreeBuilder(Lexer(text, tokenize_recovering(text, diagnostics)))
+    program = builder.prog()
+    diagnostics.extend(builder.diagnostics)
+    diagnostics.sort(key=lambda diagnostic: diagnostic.start)
+    return program, diagnostics
+
+
+
+'''
+This section defines the batch mode, which parses many files across a pool of worker processes.
+'''
+
+def run_parser(lexer):
+    """ Parses and evaluates the program with Parser, printing the result of each block. """
+    Parser(lexer).prog()
+
+def run_native(text):
+    """
+    Runs the program with the C extension and prints the result of each block, as run_parser.
+    Returns False without printing anything when the extension is not built or leaves the program to Parser
+    (errors, ints beyond 64 bits, deep nesting, non-ASCII text), the caller then runs Parser.
+    """
+    native = native_buffer(text) if _cparser is not None else None
+    values = _cparser.run(*native) if native is not None else None
+    if values is None:
+        return False
+    for value in values:
+        print(value)
+    return True
+
+def run_stack_parser(lexer):
+    """ Same as run_parser with the non-recursive StackParser. """
+    StackParser(lexer).prog()
+
+def run_ll1_parser(lexer):
+    """ Same as run_parser with the table-driven LL1Parser. """
+    LL1Parser(lexer).prog()
+
+# How each --engine runs a program
+ENGINES = {
+    'parse': run_parser,
+    'stack': run_stack_parser,
+    'll1': run_ll1_parser,
+    'ast': run_tree,
+    'compile': run_compiled
+}
+
+def run_text(text, engine='parse'):
+    """
+    Parses a program and returns (output, error) instead of printing them, so it can run in a worker process.
+    output is what the program prints, error is None or a message such as "SyntaxError: Unexpected token ...".
+    text is a str, or any buffer (bytes, bytearray, memoryview...) which is read in place with BufferLexer.
+    """
+    output = io.StringIO()
+    error = None
+    try:
+        with contextlib.redirect_stdout(output):
+            if engine != 'parse' or not run_native(text):
+                ENGINES[engine](Lexer(text) if isinstance(text, str) else BufferLexer(text))
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return output.getvalue(), error
+
+def run_file(path, engine='parse'):
+    """ Parses one file and returns (path, output, error), see run_text. """
+    try:
+        with open(path, 'r') as file:
+            text = file.read()
+    except Exception as e:
+        return path, '', f"{type(e).__name__}: {e}"
+    return (path,) + run_text(text, engine)
+
+def expand_inputs(patterns):
+    """
+    Turns the command line inputs into a sorted list of files.
+    A directory gives all the .tiny files under it, a pattern is expanded with glob (** is recursive).
+    Files are listed once, in the order of the inputs.
+    """
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = glob.glob(os.path.join(glob.escape(pattern), '**', '*.tiny'), recursive=True)
+        elif os.path.exists(pattern):
+            matches = [pattern]
+        else:
+            matches = glob.glob(pattern, recursive=True)
+        paths.extend(sorted(path for path in matches if os.path.isfile(path)))
+    return list(dict.fromkeys(paths))
+
+def run_batch(paths, engine='parse', workers=None, chunksize=None):
+    """
+    Parses the files on a process pool and prints the output of each one, in the order of paths.
+    Returns the number of files that had an error.
+    """
+    workers = workers or os.cpu_count() or 1
+    if chunksize is None:
+        # Several chunks per worker keep them all busy until the end, without sending files one by one
+        chunksize = max(1, min(64, len(paths) // (workers * 8)))
+    task = functools.partial(run_file, engine=engine)
+    failed = 0
+    with contextlib.ExitStack() as stack:
+        if workers == 1:
+            results = map(task, paths)
+        else:
+            pool = stack.enter_context(concurrent.futures.ProcessPoolExecutor(workers))
+            results = pool.map(task, paths, chunksize=chunksize)
+        for path, output, error in results:
+            print(f"==> {path} <==")
+            sys.stdout.write(output)
+            if error is not None:
+                print(f"Error: {error}")
+                failed += 1
+    return failed
+
+
+
+if __name__ == "__main__":
+    # Checking for correct usage
+    if len(sys.argv) < 2:
+        print("To use this parser, use the following form: parser_2814075.py input_file (e.g., sample.tiny)")
+        sys.exit(1)
+
+    arg_parser = argparse.ArgumentParser(description="Top-down recursive-descent parser for .tiny programs")
+    arg_parser.add_argument('inputs', nargs='+', metavar='input_file', help=".tiny file to parse (in batch mode: files, directories or glob patterns)")
+    input_mode = arg_parser.add_mutually_exclusive_group()
+    input_mode.add_argument('--stream', action='store_true', help="read and tokenize the file in chunks instead of loading it whole")
+    input_mode.add_argument('--mmap', action='store_true', help="memory-map the file and tokenize the mapped bytes")
+    arg_parser.add_argument('--dfa', action='store_true', help="tokenize with the DFA scanner tables instead of the master regex (same tokens)")
+    arg_parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="size of the chunks read in --stream mode")
+    engine = arg_parser.add_mutually_exclusive_group()
+    engine.add_argument('--stack', action='store_true', help="parse expressions with an explicit stack instead of recursion (no nesting limit)")
+    engine.add_argument('--ll1', action='store_true', help="parse with the table-driven LL(1) engine (explicit stack of grammar symbols, no nesting limit)")
+    engine.add_argument('--ast', action='store_true', help="build the syntax tree first, then evaluate it")
+    engine.add_argument('--compile', action='store_true', help="build the syntax tree and run its blocks compiled to Python functions")
+    engine.add_argument('--parallel', action='store_true', help="run independent let ... end ; blocks of the file on a process pool (see --workers)")
+    engine.add_argument('--cache', metavar='CACHE_FILE', help="keep the syntax trees of the blocks in CACHE_FILE and only parse the blocks that changed")
+    arg_parser.add_argument('--cache-size', type=int, default=CACHE_MAX_BYTES, help="maximum size of the --cache file in bytes")
+    arg_parser.add_argument('--optimize', action='store_true', help="fold constants, drop dead declarations and compute repeated subexpressions once before running the tree (--ast, --compile or --cache, alone it implies --ast)")
+    arg_parser.add_argument('--scoped', action='store_true', help="give every let ... end ; block its own frame of variables, released at its end (names of earlier blocks are undefined), with the default parser or --ast")
+    arg_parser.add_argument('--memo', action='store_true', help="remember subexpression values while evaluating the tree (--ast or --cache, alone it implies --ast), counters go to stderr")
+    arg_parser.add_argument('--memo-size', type=int, default=MEMO_MAX_ENTRIES, help="maximum number of values kept by --memo")
+    arg_parser.add_argument('--recover', action='store_true', help="only check the files, printing every syntax error and undefined name as file:line:column: message instead of stopping at the first one")
+    arg_parser.add_argument('--pure', action='store_true', help="don't use the C extension (_cparser) even when it is built")
+    arg_parser.add_argument('--profile', metavar='JSON_FILE', help="record calls, time and depth of each grammar rule of the default parser into JSON_FILE")
+    arg_parser.add_argument('--collapsed', metavar='STACKS_FILE', help="write the self time of each rule call stack for flame graphs (implies the profiling of --profile)")
+    batch = arg_parser.add_argument_group("batch mode", "used when several inputs are given or with --batch")
+    batch.add_argument('--batch', action='store_true', help="treat the input as a directory or glob pattern even if it's a single file")
+    batch.add_argument('--workers', type=int, default=None, help="number of worker processes, also used by --parallel (default: number of CPUs)")
+    batch.add_argument('--chunksize', type=int, default=None, help="number of files sent to a worker at a time")
+    batch.add_argument('--engine', choices=sorted(ENGINES), default='parse', help="how each file is run (default: parse)")
+    args = arg_parser.parse_args()
+
+    if args.optimize and (args.stack or args.ll1 or args.parallel):
+        arg_parser.error("--optimize works on the syntax tree, use it with --ast, --compile or --cache")
+
+    if args.memo and (args.stack or args.ll1 or args.compile or args.parallel):
+        arg_parser.error("--memo works while evaluating the syntax tree, use it with --ast or --cache")
+
+    if args.scoped and (args.stack or args.ll1 or args.compile or args.parallel or args.cache or args.memo or args.optimize):
+        arg_parser.error("--scoped works with the default parser or --ast only")
+
+    if (args.stream or args.mmap) and (args.cache or args.parallel):
+        arg_parser.error("--cache and --parallel read the whole text themselves, they can't be used with --stream or --mmap")
+
+    if args.dfa and (args.stream or args.mmap or args.cache or args.parallel):
+        arg_parser.error("--dfa replaces the lexer of the whole text, it can't be used with --stream, --mmap, --cache or --parallel")
+
+    if args.recover and (args.stream or args.mmap or args.dfa or args.pure or args.stack or args.ll1 or args.ast or args.compile
+                         or args.parallel or args.cache or args.optimize or args.scoped or args.memo or args.profile
+                         or args.collapsed):
+        arg_parser.error("--recover only checks the files with its own lexer and parser, it can't be used with the options "
+                         "that choose how the file is read, lexed, parsed or evaluated")
+
+    if args.pure:
+        _cparser = None
+
+    if args.recover:
+        failed = 0
+        for pattern in args.inputs:
+            if not expand_inputs([pattern]):
+                print(f"{pattern}: no such file")
+                failed += 1
+        for path in expand_inputs(args.inputs):
+            try:
+                with open(path) as file:
+                    text = file.read()
+            except (OSError, UnicodeDecodeError) as e:
+                print(f"{path}: {type(e).__name__}: {e}") # Like the error of a file in batch mode
+                failed += 1
+                continue
+            _, diagnostics = parse_recovering(text)
+            for diagnostic in diagnostics:
+                print(f"{path}:{diagnostic}")
+            failed += bool(diagnostics)
+        sys.exit(1 if failed else 0)
+
+    if args.batch or len(args.inputs) > 1:
+        failed = run_batch(expand_inputs(args.inputs), args.engine, args.workers, args.chunksize)
+        sys.exit(1 if failed else 0)
+
+    profile = RuleProfile() if args.profile or args.collapsed else None
+    lexer_class, parser_class = DFALexer if args.dfa else Lexer, StackParser if args.stack else LL1Parser if args.ll1 else ScopedParser if args.scoped else Parser
+    if profile:
+        lexer_class = instrument(lexer_class, profile, LEXER_RULES)
+        parser_class = instrument(parser_class, profile)
+
+    # The C extension runs the program when the default parser is asked for, Parser takes over when it can't
+    native = (_cparser is not None and parser_class is Parser and lexer_class is Lexer
+              and not (args.stream or args.mmap or args.cache or args.parallel or args.compile or args.ast or args.optimize
+                       or args.memo))
+
+    with open(args.inputs[0], 'rb' if args.mmap else 'r') as file:
+        if args.cache or args.parallel:
+            lexer = None # These modes lex the text themselves
+        elif native:
+            text = file.read()
+            lexer = None if run_native(text) else Lexer(text) # Parser takes over what the C extension leaves
+        elif args.mmap:
+            lexer = MappedLexer(file)
+        elif args.stream:
+            lexer = StreamingLexer(file, args.chunk_size)
+        else:
+            # Lexical analysis
+            lexer = lexer_class(file.read())
+        
+        #print(f"Lexical analysis done correctly")
+        
+        # Top down parser
+        try:
+            evaluator = MemoizingEvaluator(args.memo_size) if args.memo else None
+            if args.cache:
+                run_cached(file.read(), ParseCache(args.cache, args.cache_size), evaluator, args.optimize)
+            elif args.parallel:
+                run_parallel(file.read(), args.workers)
+            elif args.compile:
+                run_compiled(lexer, args.optimize)
+            elif args.ast or args.optimize or args.memo:
+                run_tree(lexer, ScopedEvaluator() if args.scoped else evaluator, args.optimize)
+            elif native and lexer is None:
+                pass # Already run by the C extension
+            else:
+                parser = parser_class(lexer)
+                parser.prog()
+            #print(f"Parsing done correctly")
+        except Exception as e:
+            print(f"Error") # Here we could print the error but its not required in the project...
+        finally:
+            if args.mmap:
+                lexer.close()
+        if args.memo:
+            print(f"memo: {evaluator.stats()}", file=sys.stderr)
+        if args.profile:
+            profile.write_json(args.profile)
+        if args.collapsed:
+            profile.write_collapsed(args.collapsed)
 
 '''Resources:
 Python Regex: https://docs.python.org/3/library/re.html 
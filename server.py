@@ -0,0 +1,127 @@
+'''
+Parser server
+
+Keeps the parser loaded between runs, so a pipeline that parses many files doesn't pay Python's startup and the
+compilation of the token patterns for each one. parse_client.py is the per-file client.
+
+Requests and responses are JSON objects, one per line. A request gives a file or the program text, and the engine
+(parse, stack, ll1, ast or compile, as --engine in parser.py):
+    {"id": 1, "path": "/data/sample1.tiny", "engine": "parse"}
+    {"id": 2, "text": "let x : int = 7 ; in int ( x ) end ;"}
+and gets back the id, what the program printed and the error (or null), as in batch mode:
+    {"id": 1, "output": "40.0\\n", "error": "SyntaxError: Unexpected token ..."}
+Connections are served concurrently with asyncio and the parsing itself runs on a process pool, so responses on one
+connection can come back in a different order than the requests (the id tells them apart).
+
+Usage:
+python3 server.py SOCKET [--workers N]     (Unix domain socket)
+python3 server.py - [--workers N]          (requests on stdin, responses on stdout)
+'''
+
+import argparse
+import asyncio
+import concurrent.futures
+import functools
+import json
+import os
+import signal
+import sys
+
+from parser import ENGINES, run_file, run_text
+
+# Longest request line, a request carries a whole program when it gives "text"
+SERVER_MAX_LINE = 64 * 1024 * 1024
+
+def serve_request(line):
+    """ Runs one request line in a worker and returns the response line. """
+    request_id = None
+    try:
+        request = json.loads(line)
+        request_id = request.get('id')
+        engine = request.get('engine', 'parse')
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine {engine!r}, choose from {', '.join(sorted(ENGINES))}")
+        if 'text' in request:
+            output, error = run_text(request['text'], engine)
+        elif 'path' in request:
+            _, output, error = run_file(request['path'], engine)
+        else:
+            raise ValueError("The request has neither 'text' nor 'path'")
+    except Exception as e:
+        output, error = '', f"{type(e).__name__}: {e}"
+    return json.dumps({'id': request_id, 'output': output, 'error': error})
+
+async def serve_connection(reader, writer, pool):
+    """ Answers the requests of one client until it closes the connection. """
+    loop = asyncio.get_running_loop()
+
+    async def respond(line):
+        response = await loop.run_in_executor(pool, serve_request, line)
+        writer.write(response.encode() + b'\n')
+        await writer.drain()
+
+    pending = set()
+    try:
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError: # Longer than SERVER_MAX_LINE, the rest of the stream can't be split into requests
+                writer.write(json.dumps({'id': None, 'output': '', 'error': "ValueError: Request too long"}).encode() + b'\n')
+                break
+            if not line:
+                break
+            if line.strip():
+                task = asyncio.create_task(respond(line))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.gather(*pending)
+    finally:
+        writer.close()
+
+class StdioStream:
+    """
+        Reads requests from stdin and writes responses to stdout, with the methods of the asyncio streams used by
+        serve_connection. Unlike asyncio pipes it also works when stdin or stdout is a regular file.
+    """
+    async def readline(self):
+        return await asyncio.get_running_loop().run_in_executor(None, sys.stdin.buffer.readline)
+
+    def write(self, data):
+        sys.stdout.buffer.write(data)
+
+    async def drain(self):
+        sys.stdout.buffer.flush()
+
+    def close(self):
+        sys.stdout.buffer.flush()
+
+async def serve(address, workers=None):
+    """
+    Serves requests on the Unix domain socket at address, or on stdin/stdout if address is '-'.
+    """
+    with concurrent.futures.ProcessPoolExecutor(workers or os.cpu_count() or 1) as pool:
+        if address == '-':
+            stdio = StdioStream()
+            await serve_connection(stdio, stdio, pool)
+            return
+        # Stop on SIGTERM as on Ctrl-C, so the socket file is removed
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        server = await asyncio.start_unix_server(functools.partial(serve_connection, pool=pool), address, limit=SERVER_MAX_LINE)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if os.path.exists(address):
+                os.unlink(address)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Answers JSON parse requests with a warm parser.")
+    arg_parser.add_argument('address', metavar='SOCKET', help="Unix socket to listen on, or - for stdin/stdout")
+    arg_parser.add_argument('--workers', type=int, default=None, help="number of worker processes (default: number of CPUs)")
+    args = arg_parser.parse_args()
+    try:
+        asyncio.run(serve(args.address, args.workers))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
@@ -0,0 +1,12 @@
+'''
+Builds the optional C extension of parser.py (cparser.c) next to it:
+python3 setup.py build_ext --inplace
+parser.py finds it on its own, and runs its pure-Python code when it is not built.
+'''
+
+from setuptools import Extension, setup
+
+setup(
+    name='tiny-parser',
+    ext_modules=[Extension('_cparser', ['cparser.c'])],
+)
@@ -0,0 +1,44 @@
+'''
+Tests of the parser.py command line: options that can't work together are rejected before anything is read.
+'''
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SAMPLE = os.path.join(ROOT, 'Sample Files', 'sample2.tiny')
+
+def run_parser(*args):
+    return subprocess.run([sys.executable, os.path.join(ROOT, 'parser.py'), *args], capture_output=True, text=True)
+
+REJECTED = [
+    ('--mmap', '--cache', 'CACHE'),
+    ('--stream', '--cache', 'CACHE'),
+    ('--mmap', '--parallel'),
+    ('--stream', '--parallel'),
+    ('--recover', '--mmap'),
+    ('--recover', '--stream'),
+    ('--recover', '--dfa'),
+    ('--recover', '--pure'),
+    ('--recover', '--compile'),
+]
+
+@pytest.mark.parametrize('options', REJECTED, ids=' '.join)
+def test_rejected_combinations(tmp_path, options):
+    options = [str(tmp_path / 'cache') if option == 'CACHE' else option for option in options]
+    result = run_parser(*options, SAMPLE)
+    assert result.returncode == 2
+    assert 'error:' in result.stderr and result.stdout == ''
+
+def test_cache_prints_what_the_parser_prints(tmp_path):
+    result = run_parser('--cache', str(tmp_path / 'cache'), SAMPLE)
+    assert result.returncode == 0
+    assert result.stdout == run_parser(SAMPLE).stdout
+
+def test_recover_goes_on_after_a_missing_file(tmp_path):
+    result = run_parser('--recover', str(tmp_path / 'missing.tiny'), SAMPLE)
+    assert result.returncode == 1
+    assert result.stdout == f"{tmp_path / 'missing.tiny'}: no such file\n"
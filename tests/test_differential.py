@@ -0,0 +1,350 @@
+'''
+Differential check of the engines and modes
+
+Runs every program through Parser.prog and through the other ways parser.py can run it, and reports each program where
+one prints something else or stops on another error (type and message) than Parser:
+- stack, ll1: StackParser and LL1Parser (--stack, --ll1)
+- dfa, pure, buffer: Parser on the tokens of DFALexer (--dfa), of the pure-Python lexer (--pure) and of BufferLexer
+- stream, mmap: Parser reading the file through StreamingLexer (--stream, in small chunks) and MappedLexer (--mmap).
+  Their lexical errors come while parsing, after the blocks before them are printed, so they only run the programs
+  that Lexer tokenizes
+- ast, ast+optimize: the syntax tree evaluated by Evaluator (--ast, --optimize)
+- compile, compile+optimize: the compiled blocks (--compile, --compile --optimize)
+- memo, memo+optimize: the tree evaluated by MemoizingEvaluator (--memo)
+- cache, cache+memo: the blocks parsed through a ParseCache, once with an empty cache and once with the cache filled
+  by that first run (--cache)
+- parallel: run_parallel on two workers, with tasks of a few blocks (--parallel)
+- incremental: an IncrementalDocument of the program
+- native: the default command line path, through the C extension when it is built
+- server: a request of server.py
+- scoped ast: run_tree with ScopedEvaluator, compared with ScopedParser instead (--scoped, --ast --scoped)
+- vectorized: VectorEvaluator without bindings, for the programs that parse (it only gives the name of the error).
+  Needs NumPy
+- recover: parse_recovering finds no error exactly when the parse-only TreeBuilder succeeds, and otherwise has the
+  error TreeBuilder stops on among its diagnostics (--recover)
+Edited programs are also checked: the cache filled by the program before the edit, and an IncrementalDocument of it
+given the edit (and then the edit undone).
+
+The programs are the Sample Files, a few handwritten programs (subexpressions shared between the condition and a
+branch of an if, errors in both the condition and a branch, a real literal that overflows, names removed from an
+earlier block) and programs of the seeded generator, each also with a declaration removed, a divisor set to 0,
+a token removed, an invalid character, a two character comparison (<=, >=, == or <>) and a name that starts with a
+keyword that is not word bounded.
+
+Run with pytest, or as a script that prints every difference (the exit status is 1 when there is one).
+
+Usage:
+python3 -m pytest tests/test_differential.py
+python3 -m tests.test_differential [--seeds N] [--blocks N] [-v]
+'''
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from benchmarks.generator import ProgramGenerator
+import parser
+from parser import (BufferLexer, DFALexer, IncrementalDocument, Lexer, LL1Parser, MappedLexer, MemoizingEvaluator,
+                    ParseCache, Parser, ScopedEvaluator, ScopedParser, StackParser, StreamingLexer, TreeBuilder,
+                    parse_recovering, run_cached, run_compiled, run_parallel, run_text, run_tree)
+from server import serve_request
+import vectorized
+
+SAMPLE_FILES = os.path.join(ROOT, 'Sample Files')
+
+SEEDS = 30
+BLOCKS = 10
+STREAM_CHUNK_SIZE = 16 # Small chunks, so tokens are split across them
+PARALLEL_WORKERS = 2
+PARALLEL_TASK_TOKENS = 50 # Tasks of a few blocks, so blocks wait for the ones that declare the names they read
+
+# Shares b + 1 (beyond the folding limit) and int ( r ) between the condition and a branch
+SHARED = ("let x : int = 4149515568880992958512407863691161151012446232242436899995657329690652811412908146399707048947"
+          "103794288197886611300789182395151075411775307886874834113963687061181803401509523685376 ; "
+          "b : int = x * x ; in int ( if ( b + 1 ) > 3 then ( b + 1 ) else 0 ) end ;\n"
+          "let r : real = 7.5 ; in int ( if int ( r ) > 3 then int ( r ) * 2 else 0 ) end ;\n"
+          "let r : real = 1.5 ; in int ( if int ( r ) > 3 then int ( r ) * 2 else int ( r ) ) end ;")
+
+# Real literals that overflow to inf, and the nan and -inf they give
+OVERFLOW = (f"let x : real = 1{'0' * 400}.0 ; in real ( x ) end ;\n"
+            "let y : real = x - x ; z : real = 0.0 - x ; in real ( if y < 1 then z * 2 else y ) end ;\n"
+            "let w : real = x ; in real ( int ( w ) + 1 ) end ;")
+
+PROGRAMS = {
+    'shared condition and branch': SHARED,
+    'real literal that overflows': OVERFLOW,
+    'error in the condition and a branch':
+        'let z : int = 0 ; in real ( if ( 1 / z ) > 0 then 1.0 / 0.0 else 2 ) end ;',
+    'error in both branches': 'let z : real = 0.0 ; in int ( if z < 1 then 1 / 0 else 1.0 / z ) end ;',
+    'name of an earlier block': 'let x : int = 1 ; in int ( x ) end ;\nlet y : int = x + 1 ; in int ( y ) end ;',
+    'undefined name': 'let x : int = 1 ; in int ( y + 1 ) end ;',
+    'error in a value before a syntax error': ('let x : int = 1 ; in int ( x ) end ;\n'
+                                               'let a : int = x / 0 ; b : int = ( ; in int ( a ) end ;'),
+    'error in a value before an undefined name': ('let x : int = 1 ; y : int = 2 ; in int ( x ) end ;\n'
+                                                  'let a : real = 1 + 1.0 / 0 ; b : int = y + q ; in int ( a ) end ;'),
+}
+
+# (before, after): the second program is run with the cache filled by the first one, and as an edit of it
+EDITS = {
+    'declaration of an earlier block removed': (
+        'let x : int = 1 ; in int ( x ) end ;\nlet y : int = x + 1 ; in int ( y ) end ;',
+        'let w : int = 1 ; in int ( w ) end ;\nlet y : int = x + 1 ; in int ( y ) end ;'),
+    'earlier block removed': (
+        'let x : int = 1 ; in int ( x ) end ;\nlet y : int = x + 1 ; in int ( y ) end ;',
+        'let y : int = x + 1 ; in int ( y ) end ;'),
+}
+
+def outcome(function):
+    """
+    Runs function and returns (output, error) like run_text: what it printed,
+    and None or the message of the error that stopped it, such as "SyntaxError: Unexpected token ...".
+    """
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            function()
+    except Exception as e:
+        return output.getvalue(), f"{type(e).__name__}: {e}"
+    return output.getvalue(), None
+
+def cached(cache_path, text, evaluator=None, before=None):
+    """ Runs text with run_cached on a new cache, filled first by running before if it is given. """
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+    if before is not None:
+        outcome(lambda: run_cached(before, ParseCache(cache_path)))
+    return outcome(lambda: run_cached(text, ParseCache(cache_path), evaluator))
+
+def pure(text):
+    """ Parser on the tokens of the pure-Python lexer, as with --pure. """
+    native, parser._cparser = parser._cparser, None
+    try:
+        return outcome(lambda: Parser(Lexer(text)).prog())
+    finally:
+        parser._cparser = native
+
+def mapped(path, text):
+    """ Parser on a MappedLexer of the program written to path, the mapping is released whatever happens. """
+    with open(path, 'w') as file:
+        file.write(text)
+    with open(path, 'rb') as file:
+        lexer = MappedLexer(file)
+        try:
+            return outcome(lambda: Parser(lexer).prog())
+        finally:
+            lexer.close()
+
+def served(text):
+    """ The response of server.py to a request with the program text. """
+    response = json.loads(serve_request(json.dumps({'id': 1, 'text': text})))
+    return response['output'], response['error']
+
+def vector(text):
+    """ The output of VectorEvaluator and the name of the error that stopped it. """
+    values, error = vectorized.VectorEvaluator(vectorized.parse_program(text)).run({}).row(0)
+    return ''.join(f"{value}\n" for value in values), error
+
+def modes(directory):
+    """ Functions taking the text of a program, each one runs the program in one mode and returns its outcome. """
+    cache_path = os.path.join(directory, 'parse.cache')
+    return {
+        'stack': lambda text: outcome(lambda: StackParser(Lexer(text)).prog()),
+        'll1': lambda text: outcome(lambda: LL1Parser(Lexer(text)).prog()),
+        'dfa': lambda text: outcome(lambda: Parser(DFALexer(text)).prog()),
+        'pure': pure,
+        'buffer': lambda text: outcome(lambda: Parser(BufferLexer(text.encode())).prog()),
+        'ast': lambda text: outcome(lambda: run_tree(Lexer(text))),
+        'ast+optimize': lambda text: outcome(lambda: run_tree(Lexer(text), optimized=True)),
+        'compile': lambda text: outcome(lambda: run_compiled(Lexer(text))),
+        'compile+optimize': lambda text: outcome(lambda: run_compiled(Lexer(text), optimized=True)),
+        'memo': lambda text: outcome(lambda: run_tree(Lexer(text), MemoizingEvaluator())),
+        'memo+optimize': lambda text: outcome(lambda: run_tree(Lexer(text), MemoizingEvaluator(), optimized=True)),
+        'cache (empty)': lambda text: cached(cache_path, text),
+        'cache (filled)': lambda text: cached(cache_path, text, before=text),
+        'cache+memo (filled)': lambda text: cached(cache_path, text, MemoizingEvaluator(), before=text),
+        'parallel': lambda text: outcome(lambda: run_parallel(text, PARALLEL_WORKERS, PARALLEL_TASK_TOKENS)),
+        'incremental': lambda text: outcome(lambda: IncrementalDocument(text).prog()),
+        'native': run_text,
+        'server': served,
+    }
+
+def lazy_modes(directory):
+    """ The modes whose lexer reads the program as the parser asks for tokens. """
+    mapped_path = os.path.join(directory, 'mapped.tiny')
+    return {
+        'stream': lambda text: outcome(lambda: Parser(StreamingLexer(io.StringIO(text), STREAM_CHUNK_SIZE)).prog()),
+        'mmap': lambda text: mapped(mapped_path, text),
+    }
+
+def check_recover(text):
+    """
+    Returns None if parse_recovering agrees with TreeBuilder, else what went wrong.
+    A diagnostic has the message of the error without its line, which the diagnostic gives with the column.
+    """
+    _, diagnostics = parse_recovering(text)
+    messages = [diagnostic.message for diagnostic in diagnostics]
+    try:
+        TreeBuilder(Lexer(text)).prog()
+    except SyntaxError as error:
+        if error.msg not in messages:
+            return f"{error.msg!r} is not among the diagnostics {messages}"
+        return None
+    return f"diagnostics {messages} for a valid program" if messages else None
+
+def differences(text, directory):
+    """ Returns (mode, problem) for every mode that runs the program differently from Parser (or ScopedParser). """
+    found = []
+
+    def compare(mode, result, expected):
+        if result != expected:
+            found.append((mode, f"{result!r} instead of {expected!r}"))
+
+    expected = outcome(lambda: Parser(Lexer(text)).prog())
+    for mode, run in modes(directory).items():
+        compare(mode, run(text), expected)
+    if outcome(lambda: Lexer(text))[1] is None:
+        for mode, run in lazy_modes(directory).items():
+            compare(mode, run(text), expected)
+    compare('scoped ast', outcome(lambda: run_tree(Lexer(text), ScopedEvaluator())),
+            outcome(lambda: ScopedParser(Lexer(text)).prog()))
+    if vectorized.numpy is not None and outcome(lambda: vectorized.parse_program(text))[1] is None:
+        compare('vectorized', vector(text), (expected[0], expected[1] and expected[1].split(':')[0]))
+    problem = check_recover(text)
+    if problem:
+        found.append(('recover', problem))
+    return found
+
+def edit_between(before, after):
+    """ The smallest edit (offset, deleted length, inserted text) that turns before into after. """
+    start = 0
+    while start < min(len(before), len(after)) and before[start] == after[start]:
+        start += 1
+    end = 0
+    while end < min(len(before), len(after)) - start and before[-1 - end] == after[-1 - end]:
+        end += 1
+    return start, len(before) - start - end, after[start:len(after) - end]
+
+def edit_differences(before, after, directory):
+    """ Returns (mode, problem) for every mode that runs the edited program differently from Parser. """
+    found = []
+
+    def compare(mode, result, expected):
+        if result != expected:
+            found.append((mode, f"{result!r} instead of {expected!r}"))
+
+    expected = outcome(lambda: Parser(Lexer(after)).prog())
+    cache_path = os.path.join(directory, 'parse.cache')
+    compare('cache (edited)', cached(cache_path, after, before=before), expected)
+    compare('cache+memo (edited)', cached(cache_path, after, MemoizingEvaluator(), before), expected)
+    document = IncrementalDocument(before)
+    offset, deleted, inserted = edit_between(before, after)
+    document.edit(offset, deleted, inserted)
+    compare('incremental (edited)', outcome(document.prog), expected)
+    document.edit(offset, len(inserted), before[offset:offset + deleted])
+    compare('incremental (undone)', outcome(document.prog), outcome(lambda: Parser(Lexer(before)).prog()))
+    return found
+
+def mutations(text, seed):
+    """ Versions of a generated program with one mistake each, the same seed gives the same mistakes. """
+    choice = random.Random(seed).choice
+    lines = text.split('\n')
+    decls = [number for number, line in enumerate(lines) if ' : ' in line]
+    removed = choice(decls)
+    yield 'declaration removed', '\n'.join(lines[:removed] + lines[removed + 1:])
+    divisors = list(re.finditer(r'/ \d+(\.\d+)?', text))
+    if divisors:
+        divisor = choice(divisors)
+        yield 'divisor set to 0', text[:divisor.start()] + '/ 0' + text[divisor.end():]
+    words = list(re.finditer(r'\S+', text))
+    word = choice(words)
+    yield 'token removed', text[:word.start()] + text[word.end():]
+    word = choice(words)
+    yield 'invalid character', text[:word.start()] + '@ ' + text[word.start():]
+    comparisons = list(re.finditer(r' [<>] ', text))
+    if comparisons:
+        comparison = choice(comparisons) # Lexed as two tokens, like in every lexer of the repository
+        yield 'two character comparison', text[:comparison.start()] + f" {choice(('<=', '>=', '==', '<>'))} " + text[comparison.end():]
+    declared = choice(decls)
+    yield 'name starting with a keyword', '\n'.join(lines[:declared] + [choice(('let', 'end', 'if', 'then', 'else')) + lines[declared]]
+                                                   + lines[declared + 1:])
+
+def programs(seeds=SEEDS, blocks=BLOCKS):
+    """ Yields (name, text) for every program to check. """
+    for path in sorted(glob.glob(os.path.join(SAMPLE_FILES, '*.tiny'))):
+        with open(path) as file:
+            yield os.path.basename(path), file.read()
+    yield from PROGRAMS.items()
+    for seed in range(seeds):
+        text = ProgramGenerator(seed).program(blocks)
+        yield f"seed {seed}", text
+        for mistake, mutated in mutations(text, seed):
+            yield f"seed {seed}, {mistake}", mutated
+
+def edits(seeds=SEEDS, blocks=BLOCKS):
+    """ Yields (name, before, after) for every edit to check. """
+    for name, (before, after) in EDITS.items():
+        yield name, before, after
+    for seed in range(seeds):
+        text = ProgramGenerator(seed).program(blocks)
+        for mistake, mutated in mutations(text, seed):
+            yield f"seed {seed}, {mistake}", text, mutated
+
+@pytest.fixture(scope='module')
+def directory(tmp_path_factory):
+    return str(tmp_path_factory.mktemp('differential'))
+
+PROGRAM_CASES = list(programs())
+EDIT_CASES = list(edits())
+
+@pytest.mark.parametrize('name, text', PROGRAM_CASES, ids=[name for name, _ in PROGRAM_CASES])
+def test_modes_run_like_parser(directory, name, text):
+    assert differences(text, directory) == []
+
+@pytest.mark.parametrize('name, before, after', EDIT_CASES, ids=[name for name, _, _ in EDIT_CASES])
+def test_edited_programs_run_like_parser(directory, name, before, after):
+    assert edit_differences(before, after, directory) == []
+
+def check(seeds=SEEDS, blocks=BLOCKS, verbose=False):
+    """ Prints every difference and returns how many there were. """
+    directory = tempfile.mkdtemp()
+    found = 0
+    checked = 0
+    try:
+        for name, text in programs(seeds, blocks):
+            checked += 1
+            if verbose:
+                print(f"{name}: {outcome(lambda: Parser(Lexer(text)).prog())[1] or 'ok'}")
+            for mode, problem in differences(text, directory):
+                found += 1
+                print(f"{name}: {mode}: {problem}")
+        for name, before, after in edits(seeds, blocks):
+            checked += 1
+            for mode, problem in edit_differences(before, after, directory):
+                found += 1
+                print(f"{name}: {mode}: {problem}")
+    finally:
+        shutil.rmtree(directory)
+    print(f"{checked} programs and edits, {found} differences")
+    return found
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Compares the engines and modes of parser.py with Parser.prog.")
+    arg_parser.add_argument('--seeds', type=int, default=SEEDS, help="number of generated programs")
+    arg_parser.add_argument('--blocks', type=int, default=BLOCKS, help="let-in-end blocks of a generated program")
+    arg_parser.add_argument('-v', '--verbose', action='store_true', help="print the outcome of every program")
+    args = arg_parser.parse_args()
+    sys.exit(1 if check(args.seeds, args.blocks, args.verbose) else 0)
@@ -0,0 +1,27 @@
+'''
+Tests of the lexers that read the file themselves.
+'''
+
+import pytest
+
+from parser import MappedLexer, Parser
+
+PROGRAMS = {
+    'syntax error': 'let x : int = 1 ; in int ( x ) end ;\nlet y = 2 ; in int ( y ) end ;\nlet z : int = 3 ; in int ( z ) end ;',
+    'invalid character': 'let x : int = 1 ; in int ( x ) end ;\nlet y : int = 2 @ ; in int ( y ) end ;',
+    'valid': 'let x : int = 1 ; in int ( x ) end ;',
+    'empty': '',
+}
+
+@pytest.mark.parametrize('text', PROGRAMS.values(), ids=PROGRAMS.keys())
+def test_mapped_lexer_closes_after_parsing_stops(tmp_path, capsys, text):
+    path = tmp_path / 'program.tiny'
+    path.write_text(text)
+    with open(path, 'rb') as file:
+        lexer = MappedLexer(file)
+        try:
+            Parser(lexer).prog()
+        except SyntaxError:
+            pass
+        lexer.close() # Raised BufferError while the scan of the mapping was suspended
+    assert not text or lexer.buffer.closed
@@ -0,0 +1,30 @@
+'''
+Tests of VectorEvaluator: every row must print what parser.py prints for the program with the bound values
+written in its declarations.
+'''
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+from parser import run_text
+from vectorized import VectorEvaluator, parse_program
+
+# n * 9007199254740993 is past 2**53 unless n is 0, so those rows are evaluated again exactly with the compiled blocks.
+# x is a real literal that overflows to inf, and y is the nan it gives.
+EXACT_ROWS = (f"let n : int = {{n}} ; x : real = 1{'0' * 400}.0 ; big : int = n * 9007199254740993 ; in int ( big ) end ;\n"
+              "let y : real = x - x ; in real ( if n > 1 then x else y ) end ;\n"
+              "let z : int = int ( y ) ; in int ( z ) end ;")
+
+def parser_output(text):
+    """ What python3 parser.py prints for the program. """
+    output, error = run_text(text)
+    return output + ("Error\n" if error else '')
+
+def test_exact_rows_with_an_overflowing_literal():
+    values = [0, 1, 2, 3]
+    result = VectorEvaluator(parse_program(EXACT_ROWS.format(n=0))).run({'n': numpy.array(values)})
+    assert {1, 2, 3} <= set(result.exact)
+    for row, value in enumerate(values):
+        assert result.output(row) == parser_output(EXACT_ROWS.format(n=value))
+        assert result.row(row)[1] == 'ValueError' # int ( nan )
@@ -0,0 +1,249 @@
+'''
+Vectorized batch evaluation
+
+Evaluates one .tiny program for many bindings at once, for example sweeping r in real ( pi * r * r ) over thousands of values.
+A binding gives values to declared names: a bound name takes its value from the binding instead of its declared
+expression, as the overrides of a compiled block (see Compiler in parser.py).
+The bindings are columns (one array per name, one row per binding), and every <expr>, <term> and <factor> of the tree
+is computed as one NumPy operation over all the rows. Needs NumPy.
+
+Each row gets exactly what parser.py would print for it:
+- ints and reals are told apart per row, as Python does (int / int gives a real, int ( ) truncates, an if can give
+  an int in some rows and a real in others)
+- both branches of an if are evaluated and numpy.where picks one, errors in either branch stop the row like in Parser.if_expr
+- a division by zero or int ( ) of inf or nan stops the row at that block, the other rows go on
+- ints are kept in float64, which holds them exactly up to 2**53. Rows whose ints get bigger than that are evaluated
+  again one by one with the compiled blocks, so their results are exact Python ints
+
+Usage:
+python3 vectorized.py program.tiny bindings.csv > results.csv
+The first line of bindings.csv names the bound variables, every other line is one binding.
+'''
+
+import argparse
+import csv
+import sys
+
+from parser import (ARITHMETIC, BinOp, Cast, COMPARISONS, DIVIDE, IfExpr, Lexer, Number, REAL, TIMES, TreeBuilder,
+                    Var, compile_program)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Largest int a float64 holds exactly (2**53 + 1 is already rounded), int rows reaching it are evaluated one by one
+EXACT_INT = 2 ** 53
+
+# Error codes of the rows, 0 means no error
+ERROR_TYPES = (None, 'ZeroDivisionError', 'OverflowError', 'ValueError')
+ZERO_DIVISION, OVERFLOW, INVALID = 1, 2, 3
+
+def parse_program(text):
+    """ Parses a whole program into its syntax tree, a syntax error raises SyntaxError. """
+    return TreeBuilder(Lexer(text)).prog()
+
+def binding_column(values):
+    """
+    Converts the values of one bound name to (numbers, real): a float64 array and a bool array, True for the reals.
+    An integer array gives ints, a float array gives reals, a list may mix Python ints and floats.
+    """
+    if not isinstance(values, numpy.ndarray):
+        real = numpy.array([isinstance(value, float) for value in values], bool)
+        # Ints too big for a float64 become inf, check_int sends their rows to the exact evaluation
+        numbers = [value if isinstance(value, float) or abs(value) < EXACT_INT else numpy.inf for value in values]
+        return numpy.array(numbers, numpy.float64), real
+    if values.dtype.kind in 'iu':
+        return values.astype(numpy.float64), numpy.zeros(len(values), bool)
+    if values.dtype.kind == 'f':
+        return values.astype(numpy.float64), numpy.ones(len(values), bool)
+    raise TypeError(f"Bindings must be ints or reals, not {values.dtype}")
+
+def row_value(numbers, real, row):
+    """ The Python value of one row of a column. """
+    return float(numbers[row]) if real[row] else int(numbers[row])
+
+class BatchResult:
+    """
+        Results of VectorEvaluator.run, for each block and binding.
+        numbers[b] and real[b] are the values of block b (float64 array, and True where the value is a real).
+        stopped is the number of blocks each row printed, error_codes the error that stopped it (an index of ERROR_TYPES).
+        exact holds the rows evaluated one by one: row -> (values, error name or None).
+    """
+    def __init__(self, numbers, real, stopped, error_codes, exact):
+        self.numbers = numbers
+        self.real = real
+        self.stopped = stopped
+        self.error_codes = error_codes
+        self.exact = exact
+
+    def __len__(self):
+        return len(self.stopped)
+
+    def row(self, row):
+        """ Returns (values, error) of one binding: the values of the blocks it printed and None or the error name. """
+        if row in self.exact:
+            return self.exact[row]
+        values = [row_value(self.numbers[block], self.real[block], row) for block in range(self.stopped[row])]
+        return values, ERROR_TYPES[self.error_codes[row]]
+
+    def output(self, row):
+        """ What parser.py prints for one binding. """
+        values, error = self.row(row)
+        return ''.join(f"{value}\n" for value in values) + ("Error\n" if error else '')
+
+class VectorEvaluator:
+    """
+        Evaluates a syntax tree over columns of bindings, see the module description.
+        A value is a pair (numbers, real) of arrays with one entry per row (or NumPy scalars, which broadcast).
+        Tree nodes are visited in the same order as Evaluator, so the first error of a row is the one Parser raises.
+    """
+    def __init__(self, program):
+        if numpy is None:
+            raise ImportError("VectorEvaluator needs NumPy (pip install numpy)")
+        self.program = program
+        self.declared = {decl.name for block in program.blocks for decl in block.decls}
+        self.dispatch = {
+            Number: self.number,
+            Var: self.var,
+            BinOp: self.bin_op,
+            Cast: self.cast,
+            IfExpr: self.if_expr
+        }
+        self.functions = None # Compiled blocks for the rows evaluated one by one, compiled on first use
+
+    def run(self, bindings, rows=None):
+        """
+        Evaluates the program for every row of bindings (name -> column of values, all of the same length)
+        and returns a BatchResult. rows is the number of rows when there are no bindings.
+        """
+        for name in bindings:
+            if name not in self.declared:
+                raise ValueError(f"{name} is not declared in the program")
+        columns = {name: binding_column(values) for name, values in bindings.items()}
+        lengths = {len(numbers) for numbers, _ in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError("All the binding columns must have the same length")
+        self.rows = lengths.pop() if lengths else (1 if rows is None else rows)
+        self.error_codes = numpy.zeros(self.rows, numpy.int8)
+        self.stopped = numpy.full(self.rows, len(self.program.blocks), numpy.int64)
+        self.inexact = numpy.zeros(self.rows, bool)
+        for numbers, real in columns.values():
+            self.check_int(numbers, real)
+
+        self.symbol_table = {}
+        results_numbers, results_real = [], []
+        with numpy.errstate(all='ignore'): # inf and nan are expected, errors are found by the masks
+            for self.block_index, block in enumerate(self.program.blocks):
+                for decl in block.decls:
+                    self.symbol_table[decl.name] = columns[decl.name] if decl.name in columns else self.expr(decl.expr)
+                numbers, real = self.expr(block.expr)
+                results_numbers.append(numpy.broadcast_to(numbers, (self.rows,)).copy())
+                results_real.append(numpy.broadcast_to(real, (self.rows,)).copy())
+
+        exact = {int(row): self.run_row(bindings, row) for row in numpy.flatnonzero(self.inexact)}
+        return BatchResult(results_numbers, results_real, self.stopped, self.error_codes, exact)
+
+    def run_row(self, bindings, row):
+        """ Evaluates one row with the compiled blocks, returns (values, error name or None). """
+        if self.functions is None:
+            self.functions = compile_program(self.program)
+        overrides = {}
+        for name, values in bindings.items():
+            value = values[row]
+            overrides[name] = value.item() if isinstance(value, numpy.generic) else value
+        symbol_table = {}
+        values = []
+        for function in self.functions:
+            try:
+                values.append(function(symbol_table, overrides))
+            except Exception as e:
+                return values, type(e).__name__
+        return values, None
+
+    def fail(self, mask, code):
+        """ Stops the rows of mask with an error, unless an earlier error already stopped them. """
+        new = numpy.logical_and(mask, self.error_codes == 0)
+        self.error_codes[new] = code
+        self.stopped[new] = self.block_index
+
+    def check_int(self, numbers, real):
+        """ Marks the int rows that a float64 may not hold exactly. """
+        numpy.logical_or(self.inexact, ~real & (numpy.abs(numbers) >= EXACT_INT), out=self.inexact)
+
+    def expr(self, node):
+        return self.dispatch[type(node)](node)
+
+    def number(self, node):
+        if type(node.value) is int and abs(node.value) >= EXACT_INT:
+            self.inexact[:] = True
+            return numpy.float64(0), numpy.False_
+        return numpy.float64(node.value), numpy.bool_(type(node.value) is float)
+
+    def var(self, node):
+        return self.symbol_table[node.name]
+
+    def bin_op(self, node):
+        left, left_real = self.expr(node.left)
+        right, right_real = self.expr(node.right)
+        if node.op == DIVIDE:
+            self.fail(right == 0, ZERO_DIVISION)
+            return left / right, numpy.True_ # Python's / always gives a real
+        numbers = ARITHMETIC[node.op](left, right)
+        real = left_real | right_real
+        if node.op == TIMES:
+            numbers = numpy.where(real, numbers, numbers + 0.0) # 0 * -3 is -0.0 in float64 but 0 for ints
+        self.check_int(numbers, real)
+        return numbers, real
+
+    def cast(self, node):
+        numbers, real = self.expr(node.expr)
+        if node.var_type == REAL:
+            return numbers, numpy.True_
+        self.fail(real & numpy.isnan(numbers), INVALID)
+        self.fail(real & numpy.isinf(numbers), OVERFLOW)
+        numbers = numpy.trunc(numbers) + 0.0 # int ( -0.5 ) is 0, not -0.0
+        self.check_int(numbers, numpy.False_)
+        return numbers, numpy.False_
+
+    def cond(self, node):
+        return COMPARISONS[node.op](self.expr(node.left)[0], self.expr(node.right)[0])
+
+    def if_expr(self, node):
+        condition = self.cond(node.cond)
+        true_numbers, true_real = self.expr(node.true_expr)
+        false_numbers, false_real = self.expr(node.false_expr)
+        return numpy.where(condition, true_numbers, false_numbers), numpy.where(condition, true_real, false_real)
+
+def read_bindings(path):
+    """ Reads a CSV file of bindings, a column of ints only gives ints, any other column gives reals. """
+    with open(path, newline='') as file:
+        reader = csv.reader(file)
+        names = next(reader)
+        rows = list(reader)
+    bindings = {}
+    for index, name in enumerate(names):
+        cells = [row[index].strip() for row in rows]
+        try:
+            bindings[name.strip()] = numpy.array([int(cell) for cell in cells], numpy.int64)
+        except ValueError:
+            bindings[name.strip()] = numpy.array([float(cell) for cell in cells], numpy.float64)
+    return bindings
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Evaluates a .tiny program for every binding of a CSV file.")
+    arg_parser.add_argument('program', help=".tiny file")
+    arg_parser.add_argument('bindings', help="CSV file, a header line with the bound names and one line per binding")
+    args = arg_parser.parse_args()
+    if numpy is None:
+        arg_parser.error("vectorized.py needs NumPy (pip install numpy)")
+
+    with open(args.program) as file:
+        program = parse_program(file.read())
+    result = VectorEvaluator(program).run(read_bindings(args.bindings))
+    # One line per binding: the value of each block, then Error if the binding stopped on an error
+    writer = csv.writer(sys.stdout)
+    writer.writerow([f"block{number}" for number in range(1, len(program.blocks) + 1)] + ['error'])
+    for row in range(len(result)):
+        values, error = result.row(row)
+        writer.writerow(values + [''] * (len(program.blocks) - len(values)) + [error or ''])